@@ -0,0 +1,304 @@
+"""Catalog compiled into lookup tables and pre-rendered JSON bodies.
+
+The catalog lives in Mongo (``catalog_products``, ``reviews`` with their
+``review_stats`` aggregates, and version counters in ``catalog_meta``) but
+requests never read it from there:
+``CatalogStore`` keeps an immutable ``CompiledCatalog`` snapshot and swaps
+it atomically when the stored version moves. New reviews only move
+``review_version``, which re-renders the featured review list and the
+stats body and shares every product body with the previous snapshot. Every public catalog endpoint
+is answered with bytes rendered when the snapshot was built. Each body
+carries a strong ETag derived from its content, which lets clients
+revalidate with ``If-None-Match`` and get an empty 304 back.
+"""
+import asyncio
+import copy
+import hashlib
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+import orjson
+from pymongo import ReturnDocument
+from pymongo.errors import OperationFailure
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from compression import compress, negotiate
+from pricing import PriceBook
+from search import SearchIndex
+
+logger = logging.getLogger(__name__)
+
+# Newest reviews kept in the snapshot for /api/reviews; per-product pages come from Mongo
+FEATURED_REVIEWS = 50
+
+
+class RenderedJSON:
+    """A response body rendered once, plus compressed variants built on first use.
+
+    Each encoding is a different representation, so each gets its own
+    strong ETag (the identity ETag with an encoding suffix).
+    """
+
+    __slots__ = ("body", "etag", "_variants")
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        self._variants: Dict[str, Tuple[bytes, str]] = {}
+
+    def variant(self, encoding: Optional[str]) -> Tuple[bytes, str]:
+        if encoding is None:
+            return self.body, self.etag
+        cached = self._variants.get(encoding)
+        if cached is None:
+            cached = self._variants[encoding] = (compress(self.body, encoding), f'{self.etag[:-1]}-{encoding}"')
+        return cached
+
+
+def render_json(payload) -> RenderedJSON:
+    # orjson emits the same compact UTF-8 encoding as starlette's JSONResponse
+    return RenderedJSON(orjson.dumps(payload))
+
+
+EMPTY_LIST = render_json([])
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, so W/"x" matches "x"
+    candidates = (c.strip() for c in if_none_match.split(","))
+    return any((c[2:] if c.startswith("W/") else c) == etag for c in candidates)
+
+
+def rendered_response(request: Request, rendered: RenderedJSON) -> Response:
+    encoding = negotiate(request.headers.get("accept-encoding"), len(rendered.body))
+    body, etag = rendered.variant(encoding)
+    headers = {"ETag": etag, "Vary": "Accept-Encoding"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+# What product grids and cards render; everything heavy (description,
+# feature_categories, screenshots, requirements, pricing_tiers) is left out
+SUMMARY_FIELDS = ("product_id", "name", "game", "price", "status", "status_label", "tier",
+                  "image_url", "accent_color", "tagline", "features")
+# Every projection the product endpoints serve, all rendered with the snapshot;
+# arbitrary field sets are not accepted, so no request renders the catalog
+VIEWS: Dict[str, Optional[Tuple[str, ...]]] = {
+    "full": None,
+    "summary": SUMMARY_FIELDS,
+    # Just what the products grid shows
+    "grid": ("product_id", "name", "price", "tier", "status", "image_url"),
+}
+
+
+class CatalogView:
+    """Pre-rendered product responses restricted to one set of fields (None means all)."""
+
+    def __init__(self, products: List[Dict], by_game: Dict[str, List[Dict]], fields: Optional[Tuple[str, ...]]):
+        def project(p: Dict) -> Dict:
+            return p if fields is None else {f: p.get(f) for f in fields}
+
+        self.fields = fields
+        self.products = render_json([project(p) for p in products])
+        self.products_by_game: Dict[str, RenderedJSON] = {g: render_json([project(p) for p in ps]) for g, ps in by_game.items()}
+        self.product_by_id: Dict[str, RenderedJSON] = {p["product_id"]: render_json(project(p)) for p in products}
+
+    def products_for_game(self, game: str) -> RenderedJSON:
+        return self.products_by_game.get(game.lower(), EMPTY_LIST)
+
+
+class CompiledCatalog:
+    """Products and reviews indexed by id and game, with every response pre-rendered.
+
+    ``products`` and ``reviews`` must already be validated and shaped as the
+    endpoints return them.
+    """
+
+    def __init__(self, products: List[Dict], reviews: List[Dict], version: int = 0,
+                 total_reviews: Optional[int] = None):
+        self.version = version
+        self.review_version = 0
+        self.product_list = products
+        self.review_list = reviews
+        self.by_id: Dict[str, Dict] = {p["product_id"]: p for p in products}
+        self.by_game: Dict[str, List[Dict]] = {}
+        for p in products:
+            self.by_game.setdefault(p["game"].lower(), []).append(p)
+
+        games = sorted({p["game"] for p in products})
+        games_payload = [
+            {
+                "name": g,
+                "products": [
+                    {"product_id": p["product_id"], "name": p["name"], "tier": p["tier"], "price": p["price"], "status": p["status"]}
+                    for p in self.by_game[g.lower()]
+                ],
+            }
+            for g in games
+        ]
+        self.stats_payload = {
+            "total_products": len(products),
+            "total_games": len(games),
+            "undetected_count": len([p for p in products if p["status"] == "undetected"]),
+            "total_reviews": len(reviews) if total_reviews is None else total_reviews,
+        }
+
+        self.views = {name: CatalogView(products, self.by_game, fields) for name, fields in VIEWS.items()}
+        self.full = self.views["full"]
+        self.prices = PriceBook(products)
+        self.search = SearchIndex(products)
+        self.quotes = {pid: render_json([q.payload() for q in quotes]) for pid, quotes in self.prices.by_product.items()}
+        self.reviews = render_json(reviews)
+        self.games = render_json(games_payload)
+        self.stats = render_json(self.stats_payload)
+
+    def with_reviews(self, reviews: List[Dict], total_reviews: int, review_version: int) -> "CompiledCatalog":
+        """A copy sharing every product body, with the review list and stats re-rendered."""
+        snapshot = copy.copy(self)
+        snapshot.review_version = review_version
+        snapshot.review_list = reviews
+        snapshot.stats_payload = {**self.stats_payload, "total_reviews": total_reviews}
+        snapshot.reviews = render_json(reviews)
+        snapshot.stats = render_json(snapshot.stats_payload)
+        return snapshot
+
+    def view(self, name: str = "full") -> CatalogView:
+        """One of the named ``VIEWS``."""
+        return self.views[name]
+
+
+class CatalogStore:
+    """Holds the current catalog snapshot and reloads it when the stored version changes.
+
+    ``compile`` turns raw product and review documents plus the review total into a
+    validated ``CompiledCatalog``; ``shape_reviews`` validates review documents alone. Handlers read ``current`` once per request, so a
+    swap mid-request can never mix two versions. Updates are noticed through
+    a change stream on ``catalog_meta`` where the deployment supports one,
+    and by polling the version document otherwise.
+    """
+
+    def __init__(self, db, compile: Callable[[List[Dict], List[Dict], int, Optional[int]], CompiledCatalog],
+                 shape_reviews: Callable[[List[Dict]], List[Dict]],
+                 seed_products: List[Dict], seed_reviews: List[Dict], poll_interval: float = 5.0):
+        self.db = db
+        self.compile = compile
+        self.shape_reviews = shape_reviews
+        self.seed_products = seed_products
+        self.seed_reviews = seed_reviews
+        self.poll_interval = poll_interval
+        # Serve the built-in catalog until the first load completes
+        self.current: CompiledCatalog = compile(seed_products, seed_reviews, 0, None)
+        self.listeners: List[Callable[[CompiledCatalog], None]] = []
+        self.reloads = 0
+        self.review_refreshes = 0
+        self._watcher: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if await self.db.catalog_meta.find_one({"_id": "catalog"}) is None:
+            await self.seed()
+        await self.reload()
+        self._watcher = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            await asyncio.gather(self._watcher, return_exceptions=True)
+            self._watcher = None
+
+    async def seed(self):
+        """Idempotently load the built-in catalog into an empty database."""
+        for position, product in enumerate(self.seed_products):
+            await self.db.catalog_products.update_one(
+                {"product_id": product["product_id"]},
+                {"$setOnInsert": {**product, "position": position}}, upsert=True
+            )
+        for review in self.seed_reviews:
+            await self.db.reviews.update_one(
+                {"review_id": review["review_id"]}, {"$setOnInsert": review}, upsert=True
+            )
+        await self.db.catalog_meta.update_one(
+            {"_id": "catalog"}, {"$setOnInsert": {"version": 1}}, upsert=True
+        )
+
+    async def reload(self):
+        meta = await self.db.catalog_meta.find_one({"_id": "catalog"}) or {}
+        products = await self.db.catalog_products.find({}, {"_id": 0}).sort([("position", 1), ("product_id", 1)]).to_list(None)
+        reviews, total_reviews = await self._load_reviews()
+        snapshot = self.compile(products, reviews, meta.get("version", 0), total_reviews)
+        snapshot.review_version = meta.get("review_version", 0)
+        self.current = snapshot
+        self.reloads += 1
+        for listener in self.listeners:
+            listener(snapshot)
+
+    async def refresh_reviews(self, review_version: int):
+        """Swap in the newest reviews and review total, keeping every product body."""
+        reviews, total_reviews = await self._load_reviews()
+        self.current = self.current.with_reviews(self.shape_reviews(reviews), total_reviews, review_version)
+        self.review_refreshes += 1
+
+    async def _load_reviews(self):
+        reviews = await self.db.reviews.find({}, {"_id": 0}).sort([("created_at", -1), ("review_id", -1)]) \
+            .limit(FEATURED_REVIEWS).to_list(FEATURED_REVIEWS)
+        # One aggregate document per product, so this sums a handful of documents
+        totals = await self.db.review_stats.aggregate([{"$group": {"_id": None, "n": {"$sum": "$count"}}}]).to_list(1)
+        return reviews, (totals[0]["n"] if totals else None)
+
+    async def _sync(self):
+        meta = await self.db.catalog_meta.find_one({"_id": "catalog"}) or {}
+        if meta.get("version", 0) != self.current.version:
+            await self.reload()
+        elif meta.get("review_version", 0) != self.current.review_version:
+            await self.refresh_reviews(meta.get("review_version", 0))
+
+    async def _watch(self):
+        try:
+            async with self.db.catalog_meta.watch() as stream:
+                async for _ in stream:
+                    await self._sync()
+        except OperationFailure:
+            # Standalone mongod: no change streams, fall back to polling the version
+            pass
+        except Exception:
+            logger.exception("Catalog change stream failed; polling instead")
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self._sync()
+            except Exception:
+                logger.exception("Catalog reload failed")
+
+    async def put_product(self, product: Dict):
+        await self.db.catalog_products.update_one(
+            {"product_id": product["product_id"]}, {"$set": product}, upsert=True
+        )
+        await self.bump()
+
+    async def update_product(self, product_id: str, fields: Dict):
+        await self.db.catalog_products.update_one({"product_id": product_id}, {"$set": fields})
+        await self.bump()
+
+    async def bump(self):
+        """Publish a new catalog version and load it here without waiting for the watcher."""
+        await self.db.catalog_meta.update_one({"_id": "catalog"}, {"$inc": {"version": 1}}, upsert=True)
+        await self.reload()
+
+    async def bump_reviews(self):
+        """Publish new reviews without a catalog version: only the review list and stats are re-rendered."""
+        meta = await self.db.catalog_meta.find_one_and_update(
+            {"_id": "catalog"}, {"$inc": {"review_version": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        await self.refresh_reviews(meta["review_version"])
+
+    def stats(self) -> Dict:
+        return {"version": self.current.version, "products": len(self.current.by_id), "reloads": self.reloads,
+                "review_version": self.current.review_version, "review_refreshes": self.review_refreshes}
@@ -0,0 +1,97 @@
+"""Negotiated gzip/brotli response compression.
+
+``CompressionMiddleware`` compresses complete (single-chunk) responses above
+a size threshold; streamed bodies such as SSE and NDJSON exports pass
+through untouched so events are never held back in a compressor buffer.
+Brotli is preferred when the client accepts it (``brotli`` is pinned in
+requirements.txt; without it only gzip is offered). Pre-rendered catalog bodies use ``compress`` directly
+and cache the result, so they are compressed once per process.
+"""
+import gzip
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = (b"application/json", b"text/", b"application/x-ndjson")
+
+settings = {"minimum_size": 1024, "gzip_level": 6, "brotli_quality": 5}
+
+
+def configure(minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 5):
+    settings.update(minimum_size=minimum_size, gzip_level=gzip_level, brotli_quality=brotli_quality)
+
+
+def negotiate(accept_encoding: Optional[str], size: int) -> Optional[str]:
+    """Pick "br" or "gzip" from an Accept-Encoding header, or None to send identity."""
+    if not accept_encoding or size < settings["minimum_size"]:
+        return None
+    accepted = set()
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        params = params.replace(" ", "")
+        try:
+            if params.startswith("q=") and float(params[2:] or 0) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding.strip().lower())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=settings["brotli_quality"])
+    return gzip.compress(body, compresslevel=settings["gzip_level"], mtime=0)
+
+
+class CompressionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        accept = None
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept = value.decode("latin-1")
+                break
+        if not accept:
+            return await self.app(scope, receive, send)
+
+        start_message = None
+
+        async def send_wrapper(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if start_message is None:
+                return await send(message)
+            start, start_message = start_message, None
+            body = message.get("body", b"")
+            headers = start["headers"]
+            content_type = next((v for n, v in headers if n == b"content-type"), b"")
+            encoding = None
+            if (not message.get("more_body", False)
+                    and not any(n == b"content-encoding" for n, _ in headers)
+                    and content_type.startswith(COMPRESSIBLE_TYPES)):
+                encoding = negotiate(accept, len(body))
+            if encoding:
+                body = compress(body, encoding)
+                headers = [(n, v) for n, v in headers if n != b"content-length"]
+                headers += [(b"content-encoding", encoding.encode()), (b"content-length", str(len(body)).encode()),
+                            (b"vary", b"Accept-Encoding")]
+                start = {**start, "headers": headers}
+                message = {**message, "body": body}
+            await send(start)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,66 @@
+"""Local stand-in for the payment provider.
+
+Only for benchmarks and local runs; never deploy it. Start it with
+
+    uvicorn fake_providers:app --port 8765
+
+and point the backend at it with
+
+    STRIPE_API_BASE=http://localhost:8765
+
+FAKE_PROVIDER_LATENCY_MS adds a fixed delay to every response to mimic a
+remote provider.
+"""
+import asyncio
+import os
+import time
+import uuid
+
+from fastapi import FastAPI, HTTPException, Request
+
+app = FastAPI()
+
+LATENCY = float(os.environ.get('FAKE_PROVIDER_LATENCY_MS', '0')) / 1000
+SESSIONS = {}
+
+
+@app.middleware("http")
+async def add_latency(request: Request, call_next):
+    if LATENCY:
+        await asyncio.sleep(LATENCY)
+    return await call_next(request)
+
+
+def checkout_session(session_id: str) -> dict:
+    session = SESSIONS[session_id]
+    return {
+        "id": session_id,
+        "object": "checkout.session",
+        "url": f"http://localhost/pay/{session_id}",
+        "status": "complete",
+        "payment_status": "paid",
+        "amount_total": session["amount_total"],
+        "currency": session["currency"],
+        "metadata": session["metadata"],
+        "created": session["created"],
+    }
+
+
+@app.post("/v1/checkout/sessions")
+async def create_checkout_session(request: Request):
+    form = await request.form()
+    session_id = f"cs_test_{uuid.uuid4().hex}"
+    SESSIONS[session_id] = {
+        "amount_total": int(form.get("line_items[0][price_data][unit_amount]", 0)),
+        "currency": form.get("line_items[0][price_data][currency]", "usd"),
+        "metadata": {k[len("metadata["):-1]: v for k, v in form.items() if k.startswith("metadata[")},
+        "created": int(time.time()),
+    }
+    return checkout_session(session_id)
+
+
+@app.get("/v1/checkout/sessions/{session_id}")
+async def get_checkout_session(session_id: str):
+    if session_id not in SESSIONS:
+        raise HTTPException(status_code=404, detail={"error": {"message": "No such checkout session"}})
+    return checkout_session(session_id)
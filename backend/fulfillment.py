@@ -0,0 +1,233 @@
+"""Background license fulfillment for paid checkouts.
+
+Paid transitions that are not made in a transaction enqueue the checkout
+session id; worker tasks mint the license. Fulfillment is idempotent: licenses carry the session_id under a
+unique index, so a second attempt for the same session hits
+DuplicateKeyError instead of issuing another key. Pollers can wait on
+``wait`` for fulfillment to finish instead of re-polling.
+
+``pay`` records the paid transition itself, for the webhook consumer and
+for reconciliation checks in checkout_status alike. On a replica set it
+issues the license in the same Mongo transaction as the transition, so a
+paid transaction is never observed without its license; elsewhere (or if
+the transaction aborts) it makes the transition and enqueues, and
+``recover`` covers a crash in between.
+Either way, once the license exists the sale and the license are folded
+into the sales rollups (see ``sales_rollups``).
+"""
+import asyncio
+import logging
+import secrets
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Dict, List, Optional, Set
+
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from payment_states import PAID, supports_transactions, transition
+
+logger = logging.getLogger(__name__)
+
+MAX_KEY_RETRIES = 5
+
+# Terms now come from the price book and are stored on the transaction (``days``);
+# this only covers transactions created before that
+LEGACY_DURATION_DAYS = {"1day": 1, "daily": 1, "3day": 3, "1week": 7, "weekly": 7, "1month": 30, "monthly": 30}
+
+
+def generate_license_keys(count: int) -> List[str]:
+    """``count`` distinct ``CC-XXXX-XXXX-XXXX-XXXX`` keys (64 random bits each) from one CSPRNG draw."""
+    keys = set()
+    while len(keys) < count:
+        missing = count - len(keys)
+        raw = secrets.token_bytes(8 * missing).hex().upper()
+        for i in range(0, len(raw), 16):
+            k = raw[i:i + 16]
+            keys.add(f"CC-{k[0:4]}-{k[4:8]}-{k[8:12]}-{k[12:16]}")
+    return list(keys)
+
+
+def build_license(txn: Dict) -> Dict:
+    license_key = generate_license_keys(1)[0]
+    duration = txn.get("duration", "1month")
+    days = txn.get("days") or LEGACY_DURATION_DAYS.get(duration, 30)
+    now = datetime.now(timezone.utc)
+    return {
+        "license_id": f"lic_{uuid.uuid4().hex[:12]}",
+        "session_id": txn["session_id"],
+        "product_id": txn["product_id"],
+        "product_name": txn["product_name"],
+        "game": txn.get("game", ""),
+        "user_id": txn["user_id"],
+        "license_key": license_key,
+        "status": "active",
+        "duration": duration,
+        "purchased_at": now.isoformat(),
+        "expires_at": (now + timedelta(days=days)).isoformat()
+    }
+
+
+class FulfillmentWorker:
+    def __init__(self, db, concurrency: int = 2, client=None, rollups=None):
+        self.db = db
+        self.client = client
+        self.rollups = rollups
+        self.transactional = False
+        self.concurrency = concurrency
+        self.queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._tasks = []
+        self._waiters: Dict[str, Set[asyncio.Future]] = {}
+        self.fulfilled = 0
+        self.duplicates = 0
+        self.failures = 0
+
+    async def start(self):
+        if self._tasks:
+            return
+        if self.client is not None:
+            self.transactional = await supports_transactions(self.client)
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.concurrency)]
+        await self.recover()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def recover(self):
+        """Re-enqueue paid transactions a previous process never fulfilled."""
+        cursor = self.db.payment_transactions.find(
+            {"payment_status": PAID, "license_id": {"$exists": False}}, {"_id": 0, "session_id": 1}
+        )
+        async for txn in cursor:
+            self.enqueue(txn["session_id"])
+
+    def enqueue(self, session_id: str):
+        self.queue.put_nowait(session_id)
+
+    async def _run(self):
+        while True:
+            session_id = await self.queue.get()
+            try:
+                await self.fulfill(session_id)
+            except Exception:
+                self.failures += 1
+                logger.exception(f"Fulfillment failed for {session_id}")
+            finally:
+                self.queue.task_done()
+
+    async def pay(self, session_id: str, status: str = "complete") -> Optional[Dict]:
+        """Mark a session paid and get its license issued; returns None if it was not payable."""
+        now = datetime.now(timezone.utc).isoformat()
+        if self.transactional:
+            try:
+                txn, license_doc = await self._pay_in_transaction(session_id, status, now)
+                if txn is not None:
+                    await self._roll_up(session_id, license_doc)
+                    self._notify(session_id)
+                return txn
+            except (DuplicateKeyError, PyMongoError):
+                # Aborted, nothing was written; fall through to the queued path
+                logger.exception(f"Transactional fulfillment failed for {session_id}")
+        txn = await transition(self.db.payment_transactions, session_id, PAID, {"status": status, "paid_at": now})
+        if txn is not None:
+            self.enqueue(session_id)
+        return txn
+
+    async def _pay_in_transaction(self, session_id: str, status: str, paid_at: str):
+        """Returns the transaction and the license this call inserted (None if it already had one)."""
+        async with await self.client.start_session() as session:
+            async with session.start_transaction():
+                txn = await transition(self.db.payment_transactions, session_id, PAID,
+                                       {"status": status, "paid_at": paid_at}, session=session)
+                if txn is None or txn.get("license_id"):
+                    return txn, None
+                license_doc = build_license(txn)
+                await self.db.licenses.insert_one(license_doc, session=session)
+                fulfilled = {"license_id": license_doc["license_id"],
+                             "fulfilled_at": datetime.now(timezone.utc).isoformat()}
+                await self.db.payment_transactions.update_one({"session_id": session_id}, {"$set": fulfilled},
+                                                              session=session)
+        self.fulfilled += 1
+        return {**txn, **fulfilled}, license_doc
+
+    async def fulfill(self, session_id: str) -> Optional[str]:
+        """Mint the license for a paid session; returns its license_id."""
+        txn = await self.db.payment_transactions.find_one({"session_id": session_id}, {"_id": 0})
+        if not txn or txn.get("payment_status") != PAID:
+            return None
+        license_id = txn.get("license_id")
+        license_doc = None
+        if not license_id:
+            license_doc, license_id = await self._insert_license(txn)
+            await self.db.payment_transactions.update_one(
+                {"session_id": session_id},
+                {"$set": {"license_id": license_id, "fulfilled_at": datetime.now(timezone.utc).isoformat()}}
+            )
+        await self._roll_up(session_id, license_doc)
+        self._notify(session_id)
+        return license_id
+
+    async def _insert_license(self, txn: Dict):
+        """Insert a license for ``txn``; returns it (None if the session already had one) and its id."""
+        license_doc = build_license(txn)
+        for _ in range(MAX_KEY_RETRIES):
+            try:
+                await self.db.licenses.insert_one(license_doc)
+                self.fulfilled += 1
+                return license_doc, license_doc["license_id"]
+            except DuplicateKeyError as e:
+                if "license_key" in (e.details or {}).get("keyPattern", {}):
+                    license_doc.pop("_id", None)
+                    license_doc["license_key"] = generate_license_keys(1)[0]
+                    continue
+                existing = await self.db.licenses.find_one({"session_id": txn["session_id"]},
+                                                           {"_id": 0, "license_id": 1})
+                if existing is None:
+                    raise
+                self.duplicates += 1
+                return None, existing["license_id"]
+        raise RuntimeError(f"license_key collisions persisted after {MAX_KEY_RETRIES} attempts")
+
+    async def _roll_up(self, session_id: str, license_doc: Optional[Dict]):
+        """Count the sale (once, whoever gets here first) and the license this process inserted."""
+        if self.rollups is None:
+            return
+        try:
+            if license_doc is not None:
+                await self.rollups.record_licenses([license_doc])
+            await self.rollups.record_sale(session_id)
+        except PyMongoError:
+            # The license is issued; a rollup backfill repairs the counts
+            logger.exception(f"Sales rollup failed for {session_id}")
+
+    def _notify(self, session_id: str):
+        for waiter in self._waiters.pop(session_id, ()):
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def wait(self, session_id: str, timeout: float) -> bool:
+        """Wait up to ``timeout`` seconds for this process to fulfill ``session_id``."""
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(session_id, set()).add(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            waiters = self._waiters.get(session_id)
+            if waiters is not None:
+                waiters.discard(waiter)
+                if not waiters:
+                    del self._waiters[session_id]
+
+    def stats(self) -> Dict:
+        return {
+            "queue_depth": self.queue.qsize(),
+            "fulfilled": self.fulfilled,
+            "duplicates": self.duplicates,
+            "failures": self.failures,
+            "waiters": sum(len(w) for w in self._waiters.values()),
+        }
@@ -0,0 +1,164 @@
+"""Declared MongoDB indexes and query-plan verification.
+
+``ensure_indexes`` runs at startup and is idempotent: ``create_index`` is a
+no-op for an index that already exists with the same keys and options.
+Run this module directly to create the indexes out of band, and pass
+``--verify-plans`` to ``explain()`` every hot query and exit non-zero if
+any of them falls back to a collection scan.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    collection: str
+    keys: Tuple[Tuple[str, int], ...]
+    name: str
+    options: Dict = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class HotQuery:
+    collection: str
+    filter: Dict
+    sort: Tuple[Tuple[str, int], ...] = ()
+
+
+INDEXES: List[IndexSpec] = [
+    IndexSpec("users", (("email", ASCENDING),), "email_unique", {"unique": True}),
+    IndexSpec("users", (("user_id", ASCENDING),), "user_id_unique", {"unique": True}),
+    IndexSpec("user_sessions", (("session_token", ASCENDING),), "session_token_unique", {"unique": True}),
+    # Sessions are reaped once expires_at (a BSON date) is in the past
+    IndexSpec("user_sessions", (("expires_at", ASCENDING),), "expires_at_ttl", {"expireAfterSeconds": 0}),
+    IndexSpec("payment_transactions", (("session_id", ASCENDING),), "session_id_unique", {"unique": True}),
+    IndexSpec("catalog_products", (("product_id", ASCENDING),), "product_id_unique", {"unique": True}),
+    IndexSpec("reviews", (("review_id", ASCENDING),), "review_id_unique", {"unique": True}),
+    IndexSpec("product_status", (("product_id", ASCENDING),), "product_id_unique", {"unique": True}),
+    # One license per checkout session; licenses issued outside checkout have no session_id
+    IndexSpec("licenses", (("session_id", ASCENDING),), "session_id_unique",
+              {"unique": True, "partialFilterExpression": {"session_id": {"$exists": True}}}),
+    # Per-product review pages, newest first; one review per user and product
+    IndexSpec("reviews", (("product_id", ASCENDING), ("created_at", DESCENDING), ("review_id", DESCENDING)),
+              "product_id_created_at"),
+    IndexSpec("reviews", (("product_id", ASCENDING), ("user_id", ASCENDING)), "product_id_user_id_unique",
+              {"unique": True, "partialFilterExpression": {"user_id": {"$exists": True}}}),
+    # Key lookups and the collision check for bulk issuance
+    IndexSpec("licenses", (("license_key", ASCENDING),), "license_key_unique", {"unique": True}),
+    # Serve the dashboard's keyset pagination (newest first) straight off the index
+    IndexSpec("payment_transactions", (("user_id", ASCENDING), ("created_at", DESCENDING), ("transaction_id", DESCENDING)),
+              "user_id_created_at"),
+    IndexSpec("licenses", (("user_id", ASCENDING), ("purchased_at", DESCENDING), ("license_id", DESCENDING)),
+              "user_id_purchased_at"),
+    # The archiver's scan for stale unpaid checkouts
+    IndexSpec("payment_transactions", (("payment_status", ASCENDING), ("created_at", ASCENDING)),
+              "payment_status_created_at"),
+    IndexSpec("payment_transactions_archive", (("session_id", ASCENDING),), "session_id_unique", {"unique": True}),
+    # Inbox drain order over unprocessed events only; processed ones expire after the retention window
+    IndexSpec("webhook_inbox", (("received_at", ASCENDING),), "unprocessed_received_at",
+              {"partialFilterExpression": {"processed": False}}),
+    IndexSpec("webhook_inbox", (("expire_at", ASCENDING),), "expire_at_ttl", {"expireAfterSeconds": 0}),
+    # Sales report bucket ranges
+    IndexSpec("sales_hourly", (("bucket", ASCENDING),), "bucket"),
+    IndexSpec("sales_daily", (("bucket", ASCENDING),), "bucket"),
+    # Rows left for a running rollup backfill to fold in after its swap
+    IndexSpec("payment_transactions", (("rollup_deferred", ASCENDING),), "rollup_deferred",
+              {"partialFilterExpression": {"rollup_deferred": True}}),
+    IndexSpec("licenses", (("rollup_deferred", ASCENDING),), "rollup_deferred",
+              {"partialFilterExpression": {"rollup_deferred": True}}),
+]
+
+# Every query the request path issues, with a representative filter shape
+HOT_QUERIES: List[HotQuery] = [
+    HotQuery("users", {"email": "plan-probe@example.com"}),
+    HotQuery("users", {"user_id": "user_planprobe"}),
+    HotQuery("user_sessions", {"session_token": "plan-probe"}),
+    HotQuery("payment_transactions", {"session_id": "cs_plan_probe"}),
+    HotQuery("payment_transactions", {"user_id": "user_planprobe"},
+             (("created_at", DESCENDING), ("transaction_id", DESCENDING))),
+    HotQuery("licenses", {"user_id": "user_planprobe"},
+             (("purchased_at", DESCENDING), ("license_id", DESCENDING))),
+    HotQuery("reviews", {"product_id": "plan-probe"}, (("created_at", DESCENDING), ("review_id", DESCENDING))),
+    HotQuery("payment_transactions", {"payment_status": {"$ne": "paid"}, "created_at": {"$lt": "2000-01-01"}}),
+    HotQuery("sales_daily", {"bucket": {"$gte": "2000-01-01"}}, (("bucket", ASCENDING),)),
+]
+
+
+async def ensure_indexes(db) -> List[str]:
+    """Create every declared index; returns the names that could not be built."""
+    failed = []
+    for spec in INDEXES:
+        try:
+            await db[spec.collection].create_index(list(spec.keys), name=spec.name, **spec.options)
+        except OperationFailure as e:
+            # Typically an existing index with conflicting options or duplicate keys
+            logger.error(f"Index {spec.collection}.{spec.name} not created: {e}")
+            failed.append(f"{spec.collection}.{spec.name}")
+    return failed
+
+
+def _plan_stages(plan: Dict):
+    yield plan.get("stage")
+    if "queryPlan" in plan:
+        yield from _plan_stages(plan["queryPlan"])
+    if "inputStage" in plan:
+        yield from _plan_stages(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+
+async def verify_plans(db) -> List[str]:
+    """Explain each hot query; returns a description of every one that does a COLLSCAN."""
+    offenders = []
+    for query in HOT_QUERIES:
+        cursor = db[query.collection].find(query.filter)
+        if query.sort:
+            cursor = cursor.sort(list(query.sort))
+        explained = await cursor.explain()
+        winning = explained["queryPlanner"]["winningPlan"]
+        if "COLLSCAN" in set(_plan_stages(winning)):
+            offenders.append(f"{query.collection} {query.filter}")
+    return offenders
+
+
+async def _main(argv=None) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description="Create MongoDB indexes for the backend")
+    parser.add_argument("--verify-plans", action="store_true", help="fail if any hot query does a COLLSCAN")
+    args = parser.parse_args(argv)
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        failed = await ensure_indexes(db)
+        for name in failed:
+            print(f"index not created: {name}")
+        if args.verify_plans:
+            offenders = await verify_plans(db)
+            for offender in offenders:
+                print(f"COLLSCAN: {offender}")
+            if offenders:
+                return 1
+            print(f"{len(HOT_QUERIES)} hot queries use an index")
+        return 1 if failed else 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main()))
@@ -0,0 +1,145 @@
+"""JWT signing keys shared by every worker, with ``kid``-based rotation.
+
+Keys come from, in order of precedence:
+
+* ``JWT_KEYS`` - ``kid:secret`` pairs separated by commas, with
+  ``JWT_ACTIVE_KID`` naming the signing key (defaults to the last pair);
+* ``JWT_SECRET`` - a single key with kid ``default``;
+* a JSON keyfile (``JWT_KEYFILE``, default ``backend/.jwt_keys.json``) of the
+  form ``{"active": kid, "keys": {kid: secret}}``, created on first use.
+
+Tokens carry the signing ``kid`` in their header, so verification is a dict
+lookup. Rotating (``python jwt_keys.py rotate``) adds a key and makes it
+active while older keys keep verifying tokens already issued; workers pick
+the change up from the keyfile without a restart.
+"""
+import argparse
+import json
+import os
+import secrets
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+import jwt as pyjwt
+
+ALGORITHM = "HS256"
+KEYFILE_CHECK_INTERVAL = 30.0
+
+
+def _new_secret() -> str:
+    return secrets.token_hex(32)
+
+
+def _new_kid() -> str:
+    return time.strftime("k%Y%m%d%H%M%S") + secrets.token_hex(2)
+
+
+def write_keyfile(path: Path, active: str, keys: Dict[str, str]):
+    tmp = path.with_name(path.name + ".tmp")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump({"active": active, "keys": keys}, f)
+    os.replace(tmp, path)
+
+
+def load_or_create_keyfile(path: Path) -> Dict:
+    if not path.exists():
+        # Write a complete candidate, then link it into place: exactly one
+        # worker's file wins and nobody ever reads a half-written keyfile
+        kid = _new_kid()
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        write_keyfile(tmp, kid, {kid: _new_secret()})
+        try:
+            os.link(tmp, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tmp)
+    with open(path) as f:
+        return json.load(f)
+
+
+class KeyRing:
+    def __init__(self, keys: Dict[str, str], active: str, keyfile: Optional[Path] = None):
+        if active not in keys:
+            raise ValueError(f"Active JWT kid {active!r} has no key")
+        self.keys = keys
+        self.active = active
+        self.keyfile = keyfile
+        self._keyfile_mtime = keyfile.stat().st_mtime if keyfile else None
+        self._checked_at = time.monotonic()
+
+    @classmethod
+    def from_env(cls, root: Path) -> "KeyRing":
+        if os.environ.get('JWT_KEYS'):
+            pairs = [p.split(":", 1) for p in os.environ['JWT_KEYS'].split(",") if p.strip()]
+            keys = {kid.strip(): secret.strip() for kid, secret in pairs}
+            return cls(keys, os.environ.get('JWT_ACTIVE_KID', pairs[-1][0].strip()))
+        if os.environ.get('JWT_SECRET'):
+            return cls({"default": os.environ['JWT_SECRET']}, "default")
+        keyfile = Path(os.environ.get('JWT_KEYFILE', root / '.jwt_keys.json'))
+        data = load_or_create_keyfile(keyfile)
+        return cls(data["keys"], data["active"], keyfile)
+
+    def _maybe_reload(self, force: bool = False):
+        if self.keyfile is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._checked_at < KEYFILE_CHECK_INTERVAL:
+            return
+        self._checked_at = now
+        mtime = self.keyfile.stat().st_mtime
+        if mtime != self._keyfile_mtime:
+            with open(self.keyfile) as f:
+                data = json.load(f)
+            self.keys, self.active, self._keyfile_mtime = data["keys"], data["active"], mtime
+
+    def sign(self, payload: Dict) -> str:
+        self._maybe_reload()
+        return pyjwt.encode(payload, self.keys[self.active], algorithm=ALGORITHM, headers={"kid": self.active})
+
+    def verify(self, token: str) -> Optional[Dict]:
+        try:
+            kid = pyjwt.get_unverified_header(token).get("kid", self.active)
+            key = self.keys.get(kid)
+            if key is None:
+                # Possibly rotated in by another process since we last looked
+                self._maybe_reload(force=True)
+                key = self.keys.get(kid)
+                if key is None:
+                    return None
+            return pyjwt.decode(token, key, algorithms=[ALGORITHM])
+        except pyjwt.InvalidTokenError:
+            return None
+
+
+def rotate(path: Path, keep: int):
+    data = load_or_create_keyfile(path)
+    kid = _new_kid()
+    keys = dict(data["keys"])
+    keys[kid] = _new_secret()
+    # Keyfile order is insertion order, so the oldest keys are dropped first
+    keys = dict(list(keys.items())[-keep:])
+    write_keyfile(path, kid, keys)
+    return kid
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Manage the JWT signing keyfile")
+    parser.add_argument("command", choices=["rotate", "show"])
+    parser.add_argument("--keyfile", default=os.environ.get('JWT_KEYFILE', Path(__file__).parent / '.jwt_keys.json'))
+    parser.add_argument("--keep", type=int, default=3, help="keys to retain for verifying older tokens")
+    args = parser.parse_args(argv)
+    path = Path(args.keyfile)
+    if args.command == "rotate":
+        print(f"active kid: {rotate(path, max(2, args.keep))}")
+    else:
+        data = load_or_create_keyfile(path)
+        print(f"active kid: {data['active']}; kids: {', '.join(data['keys'])}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""In-memory license key index for ``/api/licenses/validate``.
+
+Keys are held only as 128-bit SHA-256 prefixes mapped to
+``(product_id, expires_at timestamp, status)``. A Bloom filter in front
+rejects most unknown keys before the dict lookup; since it can't forget,
+revocations are carried by the stored status instead.
+
+The index is built once at startup and then kept fresh from a change
+stream on ``licenses``; on a standalone mongod, which has no change
+streams, it polls for recently inserted ids instead (``_id`` carries its
+creation time, and the poll re-reads an overlap window because ids from
+different writers are not strictly ordered). A periodic full rebuild picks
+up deletes and, when polling, status edits.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional, Tuple
+
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+PROJECTION = {"license_key": 1, "product_id": 1, "expires_at": 1, "status": 1}
+
+
+def key_digest(license_key: str) -> bytes:
+    return hashlib.sha256(license_key.strip().upper().encode()).digest()[:16]
+
+
+def to_timestamp(value) -> float:
+    if isinstance(value, datetime):
+        return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp()
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return 0.0
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.capacity = max(capacity, 1024)
+        self.size = int(math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, digest: bytes) -> Iterable[int]:
+        # Double hashing over the two halves of the (already uniform) digest
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:16], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, digest: bytes):
+        for pos in self._positions(digest):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, digest: bytes) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(digest))
+
+
+class LicenseIndex:
+    def __init__(self, db, poll_interval: float = 2.0, poll_overlap: float = 60.0, rebuild_interval: float = 900.0):
+        self.db = db
+        self.poll_interval = poll_interval
+        self.poll_overlap = poll_overlap
+        self.rebuild_interval = rebuild_interval
+        self.entries: Dict[bytes, Tuple[str, float, str]] = {}
+        self.bloom = BloomFilter(0)
+        self.watermark = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.bloom_rejections = 0
+        self.rebuilds = 0
+        self._during_rebuild: Optional[list] = None
+        self._tasks = []
+
+    async def start(self):
+        await self.rebuild()
+        self._tasks = [asyncio.create_task(self._watch()), asyncio.create_task(self._rebuild_periodically())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def add(self, doc: Dict):
+        if self._during_rebuild is not None:
+            self._during_rebuild.append(doc)
+        digest = key_digest(doc["license_key"])
+        self.entries[digest] = (doc["product_id"], to_timestamp(doc["expires_at"]), doc.get("status", "active"))
+        if len(self.entries) > self.bloom.capacity:
+            self._resize_bloom(len(self.entries) * 2)
+        else:
+            self.bloom.add(digest)
+        if isinstance(doc.get("_id"), ObjectId):
+            self.watermark = max(self.watermark, doc["_id"].generation_time.timestamp())
+
+    def _resize_bloom(self, capacity: int):
+        bloom = BloomFilter(capacity)
+        for digest in self.entries:
+            bloom.add(digest)
+        self.bloom = bloom
+
+    async def rebuild(self):
+        """Reload every license; the swap is atomic, lookups keep using the old index meanwhile."""
+        entries: Dict[bytes, Tuple[str, float, str]] = {}
+        watermark = 0.0
+        self._during_rebuild = []
+        try:
+            async for doc in self.db.licenses.find({"license_key": {"$exists": True}}, PROJECTION).batch_size(5000):
+                entries[key_digest(doc["license_key"])] = (doc["product_id"], to_timestamp(doc["expires_at"]),
+                                                           doc.get("status", "active"))
+                watermark = max(watermark, doc["_id"].generation_time.timestamp())
+        finally:
+            applied, self._during_rebuild = self._during_rebuild, None
+        self.entries = entries
+        self._resize_bloom(len(entries) * 2)
+        self.watermark = max(watermark, self.watermark)
+        # Changes seen while the scan ran may postdate the documents it read
+        for doc in applied:
+            self.add(doc)
+        self.rebuilds += 1
+
+    async def _rebuild_periodically(self):
+        while True:
+            await asyncio.sleep(self.rebuild_interval)
+            try:
+                await self.rebuild()
+            except Exception:
+                logger.exception("License index rebuild failed")
+
+    async def _watch(self):
+        try:
+            pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}]
+            async with self.db.licenses.watch(pipeline, full_document="updateLookup") as stream:
+                async for change in stream:
+                    if change.get("fullDocument"):
+                        self.add(change["fullDocument"])
+        except OperationFailure:
+            # Standalone mongod: no change streams, fall back to polling recent inserts
+            pass
+        except Exception:
+            logger.exception("License change stream failed; polling instead")
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.poll()
+            except Exception:
+                logger.exception("License index refresh failed")
+
+    async def poll(self):
+        # An empty index has no watermark yet; ObjectIds cannot predate the epoch
+        since = ObjectId.from_datetime(datetime.fromtimestamp(max(self.watermark - self.poll_overlap, 0),
+                                                              timezone.utc))
+        async for doc in self.db.licenses.find({"_id": {"$gte": since}}, PROJECTION):
+            if doc.get("license_key"):
+                self.add(doc)
+
+    def lookup(self, license_key: str) -> Optional[Tuple[str, float, str]]:
+        """``(product_id, expires_at, status)`` for a known key, else None."""
+        digest = key_digest(license_key)
+        if digest not in self.bloom:
+            self.bloom_rejections += 1
+            return None
+        entry = self.entries.get(digest)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def stats(self) -> Dict:
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses,
+                "bloom_rejections": self.bloom_rejections, "rebuilds": self.rebuilds}
@@ -0,0 +1,141 @@
+"""Bulk license issuance for reseller batches and promotions.
+
+Keys for a whole chunk come from one CSPRNG draw (``generate_license_keys``)
+and are written with one unordered ``insert_many``. ``license_key`` is
+unique in Mongo, so the (astronomically rare) collision with an existing
+key surfaces as a duplicate-key write error and only those documents are
+retried with fresh keys. Issued licenses are yielded chunk by chunk so the
+caller can stream them out while the rest are still being written, and
+each chunk is counted into the license rollups when one is configured.
+
+Run this module directly to issue a batch from the command line as NDJSON.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import uuid
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional
+
+import orjson
+from pymongo.errors import BulkWriteError
+
+from fulfillment import MAX_KEY_RETRIES, generate_license_keys
+from pricing import PriceBook, Quote
+from sales_rollups import SalesRollups
+
+
+class LicenseIssuer:
+    def __init__(self, db, chunk_size: int = 1000, rollups=None):
+        self.db = db
+        self.chunk_size = chunk_size
+        self.rollups = rollups
+        self.issued = 0
+        self.batches = 0
+        self.collisions = 0
+
+    def build(self, product: Dict, count: int, quote: Quote, batch_id: str, user_id: Optional[str],
+              issued_to: Optional[str]) -> List[Dict]:
+        now = datetime.now(timezone.utc)
+        purchased_at = now.isoformat()
+        expires_at = (now + timedelta(days=quote.days)).isoformat()
+        docs = []
+        for key in generate_license_keys(count):
+            doc = {
+                "license_id": f"lic_{uuid.uuid4().hex[:12]}",
+                "product_id": product["product_id"],
+                "product_name": product["name"],
+                "game": product["game"],
+                "license_key": key,
+                "status": "active",
+                "duration": quote.duration,
+                "purchased_at": purchased_at,
+                "expires_at": expires_at,
+                "batch_id": batch_id,
+            }
+            if user_id:
+                doc["user_id"] = user_id
+            if issued_to:
+                doc["issued_to"] = issued_to
+            docs.append(doc)
+        return docs
+
+    async def _insert_chunk(self, docs: List[Dict]) -> List[Dict]:
+        pending = docs
+        for _ in range(MAX_KEY_RETRIES):
+            try:
+                await self.db.licenses.insert_many(pending, ordered=False)
+                return docs
+            except BulkWriteError as e:
+                errors = e.details.get("writeErrors", ())
+                if any(err.get("code") != 11000 or "license_key" not in err.get("keyPattern", {})
+                       for err in errors):
+                    raise
+                self.collisions += len(errors)
+                pending = [pending[err["index"]] for err in errors]
+                for doc, key in zip(pending, generate_license_keys(len(pending))):
+                    doc.pop("_id", None)
+                    doc["license_key"] = key
+        raise RuntimeError(f"license_key collisions persisted after {MAX_KEY_RETRIES} attempts")
+
+    async def issue(self, product: Dict, count: int, quote: Quote, user_id: Optional[str] = None,
+                    issued_to: Optional[str] = None) -> AsyncIterator[List[Dict]]:
+        """Issue ``count`` licenses for ``product`` on the term of ``quote``; yields each inserted chunk."""
+        batch_id = f"batch_{uuid.uuid4().hex[:12]}"
+        self.batches += 1
+        remaining = count
+        while remaining > 0:
+            size = min(self.chunk_size, remaining)
+            docs = await self._insert_chunk(self.build(product, size, quote, batch_id, user_id, issued_to))
+            remaining -= size
+            self.issued += size
+            if self.rollups is not None:
+                await self.rollups.record_licenses(docs)
+            for doc in docs:
+                doc.pop("_id", None)
+            yield docs
+
+    def stats(self) -> Dict:
+        return {"issued": self.issued, "batches": self.batches, "collisions": self.collisions}
+
+
+async def _main(argv=None) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description="Issue a batch of licenses, written to stdout as NDJSON")
+    parser.add_argument("--product", required=True, help="product_id from the catalog")
+    parser.add_argument("--count", type=int, required=True)
+    parser.add_argument("--duration", default="1month", help="a duration key from the product's price book")
+    parser.add_argument("--user-id", help="assign every license to this user")
+    parser.add_argument("--issued-to", help="reseller or promotion label stored on each license")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        product = await db.catalog_products.find_one({"product_id": args.product}, {"_id": 0})
+        if not product:
+            print(f"unknown product: {args.product}", file=sys.stderr)
+            return 1
+        quote = PriceBook([product]).quote(args.product, args.duration)
+        if quote is None:
+            print(f"unknown duration for {args.product}: {args.duration}", file=sys.stderr)
+            return 1
+        issuer = LicenseIssuer(db, args.chunk_size, SalesRollups(db))
+        out = sys.stdout.buffer
+        async for chunk in issuer.issue(product, args.count, quote, args.user_id, args.issued_to):
+            out.write(b"".join(orjson.dumps(doc) + b"\n" for doc in chunk))
+            out.flush()
+        print(f"issued {issuer.issued} licenses ({issuer.collisions} key collisions retried)", file=sys.stderr)
+        return 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main()))
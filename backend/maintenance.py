@@ -0,0 +1,123 @@
+"""Background compaction of the hot collections.
+
+Sessions are reaped by Mongo itself: ``expires_at`` is a BSON date under a
+TTL index. ``migrate_session_expiry`` converts rows written before that as
+ISO strings, which the TTL monitor ignores.
+
+``TransactionArchiver`` periodically moves checkouts that never got paid
+out of ``payment_transactions`` into ``payment_transactions_archive`` in
+bounded batches, so the live collection (and its indexes) only holds
+recent and paid rows. A late webhook for an archived session restores the
+row first (``restore``). Running it in several workers at once is safe:
+the archive is keyed by session_id and deletes only match rows that are
+still unpaid.
+"""
+import asyncio
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_COLLECTION = "payment_transactions_archive"
+
+
+def as_utc(value: datetime) -> datetime:
+    """Motor returns naive datetimes (UTC) unless the client is tz_aware."""
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+async def migrate_session_expiry(db, batch_size: int = 1000) -> int:
+    """Rewrite string ``expires_at`` values as dates; returns the number converted."""
+    converted = 0
+    while True:
+        rows = await db.user_sessions.find(
+            {"expires_at": {"$type": "string"}}, {"_id": 1, "expires_at": 1}
+        ).limit(batch_size).to_list(batch_size)
+        if not rows:
+            return converted
+        ops = []
+        for row in rows:
+            expires_at = as_utc(datetime.fromisoformat(row["expires_at"].replace("Z", "+00:00")))
+            ops.append(UpdateOne({"_id": row["_id"], "expires_at": row["expires_at"]}, {"$set": {"expires_at": expires_at}}))
+        await db.user_sessions.bulk_write(ops, ordered=False)
+        converted += len(ops)
+
+
+class TransactionArchiver:
+    def __init__(self, db, max_age: float = 48 * 3600, interval: float = 3600.0, batch_size: int = 500):
+        self.db = db
+        self.max_age = max_age
+        self.interval = interval
+        self.batch_size = batch_size
+        self.archived = 0
+        self.restored = 0
+        self.runs = 0
+        self.last_run: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Transaction archiving failed")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self) -> int:
+        """Archive every unpaid transaction older than ``max_age``; returns how many moved."""
+        cutoff = (datetime.now(timezone.utc) - timedelta(seconds=self.max_age)).isoformat()
+        moved = 0
+        while True:
+            batch = await self.db.payment_transactions.find(
+                {"payment_status": {"$ne": "paid"}, "created_at": {"$lt": cutoff}}
+            ).limit(self.batch_size).to_list(self.batch_size)
+            if not batch:
+                break
+            try:
+                await self.db[ARCHIVE_COLLECTION].insert_many(batch, ordered=False)
+            except BulkWriteError as e:
+                # Another worker archived some of these already; anything else is real
+                if any(err.get("code") != 11000 for err in e.details.get("writeErrors", ())):
+                    raise
+            deleted = await self.db.payment_transactions.delete_many(
+                {"_id": {"$in": [t["_id"] for t in batch]}, "payment_status": {"$ne": "paid"}}
+            )
+            moved += deleted.deleted_count
+            if len(batch) < self.batch_size:
+                break
+        self.archived += moved
+        self.runs += 1
+        self.last_run = datetime.now(timezone.utc).isoformat()
+        if moved:
+            logger.info(f"Archived {moved} stale unpaid transactions")
+        return moved
+
+    async def restore(self, session_id: str) -> bool:
+        """Move an archived transaction back into the live collection, e.g. for a late webhook."""
+        txn = await self.db[ARCHIVE_COLLECTION].find_one({"session_id": session_id})
+        if not txn:
+            return False
+        try:
+            await self.db.payment_transactions.insert_one(txn)
+        except DuplicateKeyError:
+            pass
+        await self.db[ARCHIVE_COLLECTION].delete_one({"session_id": session_id})
+        self.restored += 1
+        return True
+
+    def stats(self) -> Dict:
+        return {"archived": self.archived, "restored": self.restored, "runs": self.runs, "last_run": self.last_run}
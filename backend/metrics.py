@@ -0,0 +1,281 @@
+"""In-process request and dependency metrics in Prometheus text format.
+
+``MetricsMiddleware`` is plain ASGI (no per-request task or body buffering)
+and records per-route latency histograms, status counts and in-flight
+gauges, all labelled by the route template. ``timed`` wraps any object so its coroutine methods report into a
+dependency histogram - the Mongo database, the payment client and the
+password hasher are all wrapped this way - and each call is also added to
+the current request's stage breakdown, which the slow-request log prints.
+"""
+import inspect
+import logging
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from starlette.routing import Match
+
+logger = logging.getLogger("slow_requests")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Motor returns futures from plain functions, so its async methods are listed by name
+MOTOR_ASYNC_METHODS = frozenset((
+    "find_one", "insert_one", "insert_many", "update_one", "update_many", "replace_one",
+    "delete_one", "delete_many", "find_one_and_update", "find_one_and_replace", "find_one_and_delete",
+    "bulk_write", "count_documents", "estimated_document_count", "distinct", "create_index",
+    "create_indexes", "drop_index", "index_information", "command",
+))
+
+_stages: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_stages", default=None)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{str(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metrics:
+    def __init__(self, prefix: str = "cc", slow_request_seconds: float = 1.0):
+        self.prefix = prefix
+        self.slow_request_seconds = slow_request_seconds
+        self.request_latency: Dict[Tuple[str, str], Histogram] = {}
+        self.request_count: Dict[Tuple[str, str, int], int] = {}
+        self.in_flight: Dict[Tuple[str, str], int] = {}
+        self.dependency_latency: Dict[Tuple[str, str], Histogram] = {}
+        self.dependency_errors: Dict[Tuple[str, str], int] = {}
+        self.collectors: Dict[str, Callable[[], Dict]] = {}
+
+    def observe_dependency(self, kind: str, operation: str, seconds: float, failed: bool = False):
+        key = (kind, operation)
+        hist = self.dependency_latency.get(key)
+        if hist is None:
+            hist = self.dependency_latency[key] = Histogram()
+        hist.observe(seconds)
+        if failed:
+            self.dependency_errors[key] = self.dependency_errors.get(key, 0) + 1
+        stages = _stages.get()
+        if stages is not None:
+            stages.append((f"{kind}:{operation}", seconds))
+
+    def add_collector(self, name: str, collect: Callable[[], Dict]):
+        """Export the numeric values of ``collect()`` as gauges named after ``name``."""
+        self.collectors[name] = collect
+
+    def render(self) -> str:
+        p = self.prefix
+        lines = [f"# TYPE {p}_http_request_duration_seconds histogram"]
+        for (method, route), hist in sorted(self.request_latency.items()):
+            self._render_histogram(lines, f"{p}_http_request_duration_seconds", ("method", "route"), (method, route), hist)
+        lines.append(f"# TYPE {p}_http_requests_total counter")
+        for key, value in sorted(self.request_count.items()):
+            lines.append(f"{p}_http_requests_total{_labels(('method', 'route', 'status'), key)} {value}")
+        lines.append(f"# TYPE {p}_http_requests_in_flight gauge")
+        for key, value in sorted(self.in_flight.items()):
+            lines.append(f"{p}_http_requests_in_flight{_labels(('method', 'route'), key)} {value}")
+        lines.append(f"# TYPE {p}_dependency_duration_seconds histogram")
+        for key, hist in sorted(self.dependency_latency.items()):
+            self._render_histogram(lines, f"{p}_dependency_duration_seconds", ("kind", "operation"), key, hist)
+        lines.append(f"# TYPE {p}_dependency_errors_total counter")
+        for key, value in sorted(self.dependency_errors.items()):
+            lines.append(f"{p}_dependency_errors_total{_labels(('kind', 'operation'), key)} {value}")
+        for name, collect in self.collectors.items():
+            for field, value in collect().items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                lines.append(f"# TYPE {p}_{name}_{field} gauge")
+                lines.append(f"{p}_{name}_{field} {value}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render_histogram(lines: List[str], name: str, label_names, label_values, hist: Histogram):
+        cumulative = 0
+        for bound, count in zip(hist.buckets, hist.counts):
+            cumulative += count
+            le = 'le="%s"' % bound
+            lines.append(f"{name}_bucket{_labels(label_names, label_values, le)} {cumulative}")
+        le = 'le="+Inf"'
+        lines.append(f"{name}_bucket{_labels(label_names, label_values, le)} {hist.count}")
+        lines.append(f"{name}_sum{_labels(label_names, label_values)} {hist.sum}")
+        lines.append(f"{name}_count{_labels(label_names, label_values)} {hist.count}")
+
+
+class MetricsMiddleware:
+    def __init__(self, app, metrics: Metrics, routes: Optional[Sequence] = None):
+        self.app = app
+        self.metrics = metrics
+        # The app's routes, so in-flight requests are labelled before routing runs
+        self.routes = routes
+
+    def _route_template(self, scope) -> str:
+        if self.routes is None:
+            return "*"
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        metrics = self.metrics
+        method = scope["method"]
+        started = time.perf_counter()
+        stages: List[Tuple[str, float]] = []
+        token = _stages.set(stages)
+        status = 500
+        streaming = False
+        flight_key = (method, self._route_template(scope))
+        metrics.in_flight[flight_key] = metrics.in_flight.get(flight_key, 0) + 1
+
+        async def send_wrapper(message):
+            nonlocal status, streaming
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                for name, value in message.get("headers", ()):
+                    if name == b"content-type" and value.startswith(b"text/event-stream"):
+                        # Long-lived streams are timed to their first byte
+                        streaming = True
+                        self._record(scope, method, status, time.perf_counter() - started, stages)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            metrics.in_flight[flight_key] -= 1
+            _stages.reset(token)
+            if not streaming:
+                self._record(scope, method, status, time.perf_counter() - started, stages)
+
+    def _record(self, scope, method: str, status: int, elapsed: float, stages: List[Tuple[str, float]]):
+        metrics = self.metrics
+        route_path = (getattr(scope.get("route"), "path", None)
+                      or getattr(scope.get("endpoint"), "__name__", "unmatched"))
+        key = (method, route_path)
+        hist = metrics.request_latency.get(key)
+        if hist is None:
+            hist = metrics.request_latency[key] = Histogram()
+        hist.observe(elapsed)
+        count_key = (method, route_path, status)
+        metrics.request_count[count_key] = metrics.request_count.get(count_key, 0) + 1
+        if elapsed >= metrics.slow_request_seconds:
+            breakdown: Dict[str, List[float]] = {}
+            for stage, seconds in stages:
+                entry = breakdown.setdefault(stage, [0, 0.0])
+                entry[0] += 1
+                entry[1] += seconds
+            accounted = sum(s for _, s in stages)
+            parts = ", ".join(f"{stage} x{n} {total * 1000:.1f}ms" for stage, (n, total) in
+                              sorted(breakdown.items(), key=lambda kv: -kv[1][1]))
+            logger.warning(f"Slow request {method} {scope.get('path')} -> {status} in {elapsed * 1000:.1f}ms "
+                           f"[{parts or 'no instrumented stages'}; other {(elapsed - accounted) * 1000:.1f}ms]")
+
+
+class _TimedCursor:
+    """Wraps a Motor cursor so draining it is timed as one dependency call."""
+
+    def __init__(self, cursor, metrics: Metrics, kind: str, operation: str):
+        self._cursor = cursor
+        self._metrics = metrics
+        self._kind = kind
+        self._operation = operation
+
+    def __getattr__(self, name):
+        attr = getattr(self._cursor, name)
+        if name in ("sort", "limit", "skip", "batch_size", "hint", "max_time_ms"):
+            def chain(*args, **kwargs):
+                attr(*args, **kwargs)
+                return self
+            return chain
+        return attr
+
+    async def to_list(self, length=None):
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = await self._cursor.to_list(length)
+            failed = False
+            return result
+        finally:
+            self._metrics.observe_dependency(self._kind, self._operation, time.perf_counter() - started, failed)
+
+    async def explain(self):
+        return await self._cursor.explain()
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        # Streams are timed per document fetch so a slow consumer isn't billed to Mongo
+        iterator = self._cursor.__aiter__()
+        while True:
+            started = time.perf_counter()
+            try:
+                doc = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+            finally:
+                self._metrics.observe_dependency(self._kind, self._operation, time.perf_counter() - started)
+            yield doc
+
+
+class timed:
+    """Proxy that times every coroutine method of ``target`` as ``kind:prefix.method``.
+
+    Attribute and item access on a wrapped Motor database or collection
+    returns wrapped children, so ``timed(db, metrics, "mongo").users.find_one``
+    is reported as ``mongo:users.find_one``.
+    """
+
+    def __init__(self, target, metrics: Metrics, kind: str, prefix: str = ""):
+        self._target = target
+        self._metrics = metrics
+        self._kind = kind
+        self._prefix = prefix
+
+    def _child(self, name: str, attr):
+        operation = f"{self._prefix}.{name}" if self._prefix else name
+        if inspect.iscoroutinefunction(attr) or (self._kind == "mongo" and name in MOTOR_ASYNC_METHODS):
+            async def call(*args, **kwargs):
+                started = time.perf_counter()
+                failed = True
+                try:
+                    result = await attr(*args, **kwargs)
+                    failed = False
+                    return result
+                finally:
+                    self._metrics.observe_dependency(self._kind, operation, time.perf_counter() - started, failed)
+            return call
+        if name in ("find", "aggregate"):
+            def cursor(*args, **kwargs):
+                return _TimedCursor(attr(*args, **kwargs), self._metrics, self._kind, operation)
+            return cursor
+        if self._kind == "mongo" and not self._prefix and type(attr).__name__.endswith("Collection"):
+            return timed(attr, self._metrics, self._kind, name)
+        return attr
+
+    def __getattr__(self, name):
+        return self._child(name, getattr(self._target, name))
+
+    def __getitem__(self, name):
+        return self._child(name, self._target[name])
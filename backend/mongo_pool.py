@@ -0,0 +1,126 @@
+"""Mongo client settings, connection-pool warm-up and pool statistics.
+
+Pool sizes, timeouts and wire compression come from the environment
+(``MONGO_*``, see ``client_options``). Motor connects lazily, so the client
+can still be built at import time; ``warm_up`` runs at startup and opens
+``minPoolSize`` connections through concurrent pings, so the first real
+requests find server selection done and sockets already established.
+``PoolMonitor`` is a pymongo pool listener whose counters back ``/healthz``,
+``/readyz`` and the ``mongo_pool`` gauges in ``/metrics``.
+"""
+import asyncio
+import os
+import time
+from typing import Dict
+
+from pymongo import monitoring
+
+# env var -> (client option, parser)
+POOL_SETTINGS = {
+    "MONGO_MAX_POOL_SIZE": ("maxPoolSize", int),
+    "MONGO_MIN_POOL_SIZE": ("minPoolSize", int),
+    "MONGO_MAX_IDLE_TIME_MS": ("maxIdleTimeMS", int),
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": ("waitQueueTimeoutMS", int),
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": ("serverSelectionTimeoutMS", int),
+    "MONGO_CONNECT_TIMEOUT_MS": ("connectTimeoutMS", int),
+    "MONGO_SOCKET_TIMEOUT_MS": ("socketTimeoutMS", int),
+    # e.g. "zstd,snappy,zlib"; zstd and snappy need the zstandard / python-snappy packages
+    "MONGO_COMPRESSORS": ("compressors", str),
+}
+DEFAULTS = {"maxPoolSize": 100, "minPoolSize": 10, "serverSelectionTimeoutMS": 5000,
+            "connectTimeoutMS": 5000, "waitQueueTimeoutMS": 2000}
+
+
+def client_options(monitor: "PoolMonitor") -> Dict:
+    options = dict(DEFAULTS)
+    for env, (option, parse) in POOL_SETTINGS.items():
+        if os.environ.get(env):
+            options[option] = parse(os.environ[env])
+    options["appname"] = os.environ.get('MONGO_APP_NAME', 'cheatcore-backend')
+    options["event_listeners"] = [monitor]
+    return options
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Connection counters across every pool of the client (one per server).
+
+    Called from the driver's threads; plain int updates are good enough for stats.
+    """
+
+    def __init__(self):
+        self.open = 0
+        self.checked_out = 0
+        self.created = 0
+        self.closed = 0
+        self.checkout_failures = 0
+        self.pools_cleared = 0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self.pools_cleared += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self.created += 1
+        self.open += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self.closed += 1
+        self.open -= 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        self.checked_out += 1
+
+    def connection_checked_in(self, event):
+        self.checked_out -= 1
+
+    def stats(self) -> Dict:
+        return {"open": self.open, "checked_out": self.checked_out, "created": self.created,
+                "closed": self.closed, "checkout_failures": self.checkout_failures,
+                "pools_cleared": self.pools_cleared}
+
+
+async def warm_up(client, connections: int) -> float:
+    """Ping once (server selection), then ``connections`` pings at once to fill the pool; returns seconds."""
+    started = time.perf_counter()
+    await client.admin.command("ping")
+    if connections > 1:
+        await asyncio.gather(*(client.admin.command("ping") for _ in range(connections)))
+    return time.perf_counter() - started
+
+
+class Readiness:
+    """Ready once startup has finished; a readiness probe also needs a live ping."""
+
+    def __init__(self, client, ping_timeout: float = 1.0):
+        self.client = client
+        self.ping_timeout = ping_timeout
+        self.ready = False
+        self.started_at = time.time()
+        self.warm_up_seconds = None
+
+    async def check(self) -> Dict:
+        if not self.ready:
+            return {"ready": False, "reason": "starting"}
+        try:
+            started = time.perf_counter()
+            await asyncio.wait_for(self.client.admin.command("ping"), self.ping_timeout)
+            return {"ready": True, "ping_ms": round((time.perf_counter() - started) * 1000, 2)}
+        except Exception as e:
+            return {"ready": False, "reason": f"mongo: {type(e).__name__}"}
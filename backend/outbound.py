@@ -0,0 +1,76 @@
+"""Application-lifetime clients for outbound calls (payment provider, OAuth).
+
+Created on startup and closed on shutdown, so requests reuse warm keep-alive
+connections instead of paying client construction and a TLS handshake on
+every checkout or Google login.
+
+The checkout integration goes through the Stripe SDK's module-level HTTP
+client, so ``start`` configures that one too: bounded connect/read
+timeouts instead of the SDK's 80 s default, and network retries (the SDK
+sends idempotency keys, so a retried create cannot charge twice). It keeps
+one requests session per thread, so its connections stay alive as well.
+"""
+import importlib.util
+import os
+from typing import Dict, Optional
+
+import httpx
+import stripe
+from emergentintegrations.payments.stripe.checkout import StripeCheckout
+
+from metrics import Metrics, timed
+
+MAX_CACHED_CHECKOUTS = 32
+
+
+class OutboundClients:
+    def __init__(self, stripe_api_key: Optional[str], metrics: Optional[Metrics] = None):
+        self.stripe_api_key = stripe_api_key
+        self.metrics = metrics
+        self.http: Optional[httpx.AsyncClient] = None
+        self._checkouts: Dict[str, StripeCheckout] = {}
+
+    async def start(self):
+        if self.http is not None:
+            return
+        # Pointing the SDK at a local fake provider (see fake_providers.py) for benchmarks
+        if os.environ.get('STRIPE_API_BASE'):
+            stripe.api_base = os.environ['STRIPE_API_BASE']
+        connect_timeout = float(os.environ.get('HTTP_CONNECT_TIMEOUT', '5'))
+        stripe.max_network_retries = int(os.environ.get('STRIPE_MAX_NETWORK_RETRIES', '2'))
+        stripe.default_http_client = stripe.RequestsClient(
+            timeout=(connect_timeout, float(os.environ.get('STRIPE_TIMEOUT', '20')))
+        )
+        self.http = self._timed(httpx.AsyncClient(
+            http2=importlib.util.find_spec("h2") is not None,
+            limits=httpx.Limits(
+                max_connections=int(os.environ.get('HTTP_MAX_CONNECTIONS', '100')),
+                max_keepalive_connections=int(os.environ.get('HTTP_MAX_KEEPALIVE', '20')),
+                keepalive_expiry=float(os.environ.get('HTTP_KEEPALIVE_EXPIRY', '30')),
+            ),
+            timeout=httpx.Timeout(
+                float(os.environ.get('HTTP_TIMEOUT', '10')),
+                connect=connect_timeout,
+            ),
+        ), "http", "outbound")
+
+    def _timed(self, target, kind: str, prefix: str = ""):
+        return timed(target, self.metrics, kind, prefix) if self.metrics is not None else target
+
+    async def close(self):
+        if self.http is not None:
+            await self.http.aclose()
+            self.http = None
+            stripe.default_http_client.close()
+        self._checkouts.clear()
+
+    def stripe_checkout(self, webhook_url: str) -> StripeCheckout:
+        # The webhook URL is derived from the request host, which is fixed per deployment
+        checkout = self._checkouts.get(webhook_url)
+        if checkout is None:
+            if len(self._checkouts) >= MAX_CACHED_CHECKOUTS:
+                # Host headers are client-supplied; don't let them grow this without bound
+                self._checkouts.clear()
+            checkout = self._timed(StripeCheckout(api_key=self.stripe_api_key, webhook_url=webhook_url), "stripe")
+            self._checkouts[webhook_url] = checkout
+        return checkout
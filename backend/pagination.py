@@ -0,0 +1,53 @@
+"""Keyset pagination over (sort field, id) pairs, newest first.
+
+A cursor is the opaque, URL-safe encoding of the last row's sort value and
+id. The next page is everything strictly before that pair, so each page is
+one index range scan no matter how deep the client has paged.
+"""
+import base64
+import json
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from pymongo import DESCENDING
+
+
+def encode_cursor(sort_value, row_id: str) -> str:
+    raw = json.dumps([sort_value, row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_value, row_id = json.loads(raw)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return sort_value, row_id
+
+
+class Keyset:
+    def __init__(self, sort_field: str, id_field: str):
+        self.sort_field = sort_field
+        self.id_field = id_field
+        self.sort = [(sort_field, DESCENDING), (id_field, DESCENDING)]
+
+    def query(self, base: Dict, cursor: Optional[str]) -> Dict:
+        if not cursor:
+            return base
+        sort_value, row_id = decode_cursor(cursor)
+        return {
+            **base,
+            "$or": [
+                {self.sort_field: {"$lt": sort_value}},
+                {self.sort_field: sort_value, self.id_field: {"$lt": row_id}},
+            ],
+        }
+
+    def split_page(self, rows: List[Dict], limit: int) -> Tuple[List[Dict], Optional[str]]:
+        """Trim a ``limit + 1`` fetch to one page and the cursor for the next, if any."""
+        if len(rows) <= limit:
+            return rows, None
+        page = rows[:limit]
+        last = page[-1]
+        return page, encode_cursor(last.get(self.sort_field), last[self.id_field])
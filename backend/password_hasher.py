@@ -0,0 +1,134 @@
+"""Password hashing off the event loop.
+
+bcrypt is deliberately slow (hundreds of milliseconds per call at production
+rounds), so hashing and verification run on a bounded executor instead of
+inside the async handlers. A semaphore caps how many hashes can be in flight
+at once; callers beyond the cap wait in an asyncio queue whose depth is
+tracked for the metrics endpoint.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from passlib.context import CryptContext
+
+DEFAULT_BCRYPT_ROUNDS = 12
+
+
+def build_crypt_context(rounds: int = DEFAULT_BCRYPT_ROUNDS) -> CryptContext:
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+
+
+# Each process-pool worker builds its own context once; CryptContext is not
+# worth pickling on every call.
+_worker_context: Optional[CryptContext] = None
+
+
+def _init_worker(rounds: int):
+    global _worker_context
+    _worker_context = build_crypt_context(rounds)
+
+
+def _hash(password: str) -> str:
+    return _worker_context.hash(password)
+
+
+def _verify_and_update(password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+    return _worker_context.verify_and_update(password, password_hash)
+
+
+class PasswordHasher:
+    """Runs bcrypt on a bounded thread or process pool.
+
+    ``verify_and_update`` returns a replacement hash whenever the stored one
+    was produced with different rounds than the current policy, so raising
+    ``BCRYPT_ROUNDS`` migrates users gradually as they log in.
+    """
+
+    def __init__(self, rounds: int = DEFAULT_BCRYPT_ROUNDS, workers: int = 4,
+                 max_concurrency: Optional[int] = None, use_processes: bool = False):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_concurrency = max_concurrency or workers
+        self.use_processes = use_processes
+        self._executor: Optional[Executor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._waiting = 0
+        self._in_flight = 0
+        self._max_waiting = 0
+        self._completed = 0
+        self._total_wait = 0.0
+        self._total_run = 0.0
+
+    @classmethod
+    def from_env(cls) -> "PasswordHasher":
+        workers = int(os.environ.get("PASSWORD_HASH_WORKERS", "4"))
+        return cls(
+            rounds=int(os.environ.get("BCRYPT_ROUNDS", str(DEFAULT_BCRYPT_ROUNDS))),
+            workers=workers,
+            max_concurrency=int(os.environ.get("PASSWORD_HASH_MAX_CONCURRENCY", str(workers))),
+            use_processes=os.environ.get("PASSWORD_HASH_EXECUTOR", "thread") == "process",
+        )
+
+    def start(self):
+        if self._executor is not None:
+            return
+        if self.use_processes:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, initializer=_init_worker, initargs=(self.rounds,)
+            )
+        else:
+            # bcrypt releases the GIL while hashing, so threads scale across cores.
+            _init_worker(self.rounds)
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pwhash")
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _run(self, fn, *args):
+        if self._executor is None:
+            self.start()
+        queued_at = time.perf_counter()
+        self._waiting += 1
+        self._max_waiting = max(self._max_waiting, self._waiting)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        started_at = time.perf_counter()
+        self._in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self._in_flight -= 1
+            self._semaphore.release()
+            self._completed += 1
+            self._total_wait += started_at - queued_at
+            self._total_run += time.perf_counter() - started_at
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    async def verify_and_update(self, password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+        return await self._run(_verify_and_update, password, password_hash)
+
+    def stats(self) -> Dict:
+        completed = self._completed or 1
+        return {
+            "executor": "process" if self.use_processes else "thread",
+            "workers": self.workers,
+            "max_concurrency": self.max_concurrency,
+            "rounds": self.rounds,
+            "in_flight": self._in_flight,
+            "queue_depth": self._waiting,
+            "max_queue_depth": self._max_waiting,
+            "completed": self._completed,
+            "avg_wait_ms": round(self._total_wait / completed * 1000, 3),
+            "avg_run_ms": round(self._total_run / completed * 1000, 3),
+        }
@@ -0,0 +1,66 @@
+"""Legal ``payment_status`` transitions for payment_transactions.
+
+Every transition is one conditional ``find_one_and_update``: the filter only
+matches a transaction whose current status may move to the target, so the
+check and the write happen atomically in a single round trip and two
+racing writers (a webhook and a poll) cannot both win. ``None`` back means
+the transition was not legal from the stored state, or there is no such
+transaction.
+"""
+import time
+import uuid
+from typing import Dict, FrozenSet, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+PENDING = "pending"
+UNPAID = "unpaid"
+NO_PAYMENT_REQUIRED = "no_payment_required"
+PAID = "paid"
+
+# target status -> statuses it may be entered from
+TRANSITIONS: Dict[str, FrozenSet[str]] = {
+    UNPAID: frozenset((PENDING, UNPAID)),
+    NO_PAYMENT_REQUIRED: frozenset((PENDING, UNPAID)),
+    PAID: frozenset((PENDING, UNPAID, NO_PAYMENT_REQUIRED)),
+}
+
+
+def can_transition(current: str, target: str) -> bool:
+    return current in TRANSITIONS.get(target, ())
+
+
+async def transition(collection, session_id: str, target: str, fields: Optional[Dict] = None,
+                     session=None) -> Optional[Dict]:
+    """Move a transaction to ``target``; returns the updated document, or None if not allowed."""
+    sources = TRANSITIONS.get(target)
+    if not sources:
+        return None
+    return await collection.find_one_and_update(
+        {"session_id": session_id, "payment_status": {"$in": list(sources)}},
+        {"$set": {**(fields or {}), "payment_status": target}},
+        projection={"_id": 0}, return_document=ReturnDocument.AFTER, session=session,
+    )
+
+
+async def read_and_claim_check(collection, session_id: str, interval: float) -> Tuple[Optional[Dict], bool]:
+    """Read a transaction and, if it is unpaid and unchecked for ``interval`` seconds, claim
+    the next provider check - in one round trip. Returns ``(transaction, claimed)``."""
+    now = time.time()
+    # Identifies this claim even if another poll read the same clock value
+    claim = uuid.uuid4().hex
+    due = {"$and": [{"$ne": ["$payment_status", PAID]},
+                    {"$lt": [{"$ifNull": ["$provider_checked_at", 0]}, now - interval]}]}
+    txn = await collection.find_one_and_update(
+        {"session_id": session_id},
+        [{"$set": {"provider_checked_at": {"$cond": [due, now, {"$ifNull": ["$provider_checked_at", "$$REMOVE"]}]},
+                   "provider_check_claim": {"$cond": [due, claim, {"$ifNull": ["$provider_check_claim", "$$REMOVE"]}]}}}],
+        projection={"_id": 0}, return_document=ReturnDocument.AFTER,
+    )
+    return txn, txn is not None and txn.get("provider_check_claim") == claim
+
+
+async def supports_transactions(client) -> bool:
+    """Multi-document transactions need a replica set or a sharded cluster."""
+    hello = await client.admin.command("hello")
+    return "setName" in hello or hello.get("msg") == "isdbgrid"
@@ -0,0 +1,64 @@
+"""Compiled price book: ``(product_id, duration)`` -> integer cents, days and currency.
+
+Built once per catalog snapshot, so checkout, fulfillment and the quote
+endpoint all read the same precomputed terms with a dict lookup instead of
+scanning ``pricing_tiers`` and dividing floats per request. Products
+without ``pricing_tiers`` get the standard day/week/month durations priced
+from their base price, the same way the product page shows them.
+"""
+from dataclasses import asdict, dataclass
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, List, Optional, Tuple
+
+CURRENCY = "usd"
+
+# key, label, days, divisor of the base price
+STANDARD_DURATIONS = (("1day", "1 Day", 1, 4), ("1week", "1 Week", 7, 2), ("1month", "1 Month", 30, 1))
+ALIASES = {"daily": "1day", "weekly": "1week", "monthly": "1month"}
+
+
+def to_cents(price, divisor: int = 1) -> int:
+    return int((Decimal(str(price)) * 100 / divisor).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+@dataclass(frozen=True)
+class Quote:
+    product_id: str
+    duration: str
+    label: str
+    amount_cents: int
+    days: int
+    currency: str = CURRENCY
+
+    @property
+    def amount(self) -> float:
+        return self.amount_cents / 100
+
+    def payload(self) -> Dict:
+        return {**asdict(self), "amount": self.amount}
+
+
+def product_quotes(product: Dict) -> List[Quote]:
+    pid = product["product_id"]
+    tiers = product.get("pricing_tiers")
+    if tiers:
+        return [Quote(pid, t["key"], t.get("label", t["key"]), to_cents(t["price"]), int(t["days"])) for t in tiers]
+    return [Quote(pid, key, label, to_cents(product["price"], divisor), days)
+            for key, label, days, divisor in STANDARD_DURATIONS]
+
+
+class PriceBook:
+    def __init__(self, products: List[Dict]):
+        self.quotes: Dict[Tuple[str, str], Quote] = {}
+        self.by_product: Dict[str, List[Quote]] = {}
+        for product in products:
+            quotes = product_quotes(product)
+            self.by_product[product["product_id"]] = quotes
+            for quote in quotes:
+                self.quotes[(quote.product_id, quote.duration)] = quote
+
+    def quote(self, product_id: str, duration: str) -> Optional[Quote]:
+        quote = self.quotes.get((product_id, duration))
+        if quote is None and duration in ALIASES:
+            quote = self.quotes.get((product_id, ALIASES[duration]))
+        return quote
@@ -0,0 +1,224 @@
+"""Two-tier cache of authenticated principals for get_current_user.
+
+Tier one is an in-process LRU with a short TTL; tier two is an optional shared
+store (Redis, or the in-memory stand-in below for local runs) so a user warmed
+on one worker is warm on all of them. Entries are keyed by a SHA-256 of the
+bearer token, never the token itself, and never outlive the session they were
+resolved from.
+"""
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set
+
+
+def token_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class InMemorySharedTier:
+    """Local stand-in for the shared tier, with the same surface as RedisSharedTier.
+
+    Like Redis it honours TTLs on values and on member sets (each member keeps
+    the expiry it was added with); expired entries are dropped when read and
+    swept every ``sweep_every`` writes, so keys nobody reads again do not pile up.
+    """
+
+    def __init__(self, sweep_every: int = 1000):
+        self._values: Dict[str, tuple] = {}
+        self._sets: Dict[str, Dict[str, float]] = {}
+        self.sweep_every = sweep_every
+        self._writes = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        item = self._values.get(key)
+        if item is None:
+            return None
+        value, expires = item
+        if expires < time.time():
+            self._values.pop(key, None)
+            return None
+        return value
+
+    async def set(self, key: str, value: str, ttl: float):
+        self._values[key] = (value, time.time() + ttl)
+        self._written()
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self._values.pop(key, None)
+            self._sets.pop(key, None)
+
+    async def add_member(self, key: str, member: str, ttl: float):
+        self._sets.setdefault(key, {})[member] = time.time() + ttl
+        self._written()
+
+    async def members(self, key: str) -> Set[str]:
+        now = time.time()
+        members = self._sets.get(key)
+        if members is None:
+            return set()
+        live = {m: expires for m, expires in members.items() if expires >= now}
+        if live:
+            self._sets[key] = live
+        else:
+            del self._sets[key]
+        return set(live)
+
+    def _written(self):
+        self._writes += 1
+        if self._writes % self.sweep_every == 0:
+            self.sweep()
+
+    def sweep(self):
+        now = time.time()
+        self._values = {k: item for k, item in self._values.items() if item[1] >= now}
+        sets = {}
+        for key, members in self._sets.items():
+            live = {m: expires for m, expires in members.items() if expires >= now}
+            if live:
+                sets[key] = live
+        self._sets = sets
+
+
+class RedisSharedTier:
+    """Shared tier backed by redis.asyncio; requires the optional ``redis`` package."""
+
+    def __init__(self, url: str, prefix: str = "principal:"):
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(url, decode_responses=True)
+        self._prefix = prefix
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self._redis.get(self._prefix + key)
+
+    async def set(self, key: str, value: str, ttl: float):
+        await self._redis.set(self._prefix + key, value, px=max(1, int(ttl * 1000)))
+
+    async def delete(self, *keys: str):
+        if keys:
+            await self._redis.delete(*(self._prefix + k for k in keys))
+
+    async def add_member(self, key: str, member: str, ttl: float):
+        pipe = self._redis.pipeline()
+        pipe.sadd(self._prefix + key, member)
+        pipe.pexpire(self._prefix + key, max(1, int(ttl * 1000)))
+        await pipe.execute()
+
+    async def members(self, key: str) -> Set[str]:
+        return await self._redis.smembers(self._prefix + key)
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+class PrincipalCache:
+    """LRU/TTL cache of resolved users keyed by token hash.
+
+    Each entry carries the session expiry (``not_after``) it was resolved
+    under, so a cached principal is dropped the moment its session lapses
+    even if the cache TTL has not. ``invalidate_user`` clears every token of
+    a user, which is what profile updates need; the local tier of other
+    workers converges within ``ttl`` seconds.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 30.0, shared=None, shared_ttl: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared = shared
+        self.shared_ttl = shared_ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._by_user: Dict[str, Set[str]] = {}
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _store_local(self, key: str, user: Dict, not_after: float):
+        self._entries[key] = (user, min(not_after, time.time() + self.ttl), not_after)
+        self._entries.move_to_end(key)
+        self._by_user.setdefault(user["user_id"], set()).add(key)
+        while len(self._entries) > self.max_entries:
+            old_key, (old_user, _, _) = self._entries.popitem(last=False)
+            self._forget_user_key(old_user["user_id"], old_key)
+            self.evictions += 1
+
+    def _forget_user_key(self, user_id: str, key: str):
+        keys = self._by_user.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[user_id]
+
+    def _drop_local(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._forget_user_key(entry[0]["user_id"], key)
+
+    async def get(self, token: str) -> Optional[Dict]:
+        key = token_key(token)
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            user, fresh_until, _ = entry
+            if fresh_until > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return user
+            self._drop_local(key)
+
+        if self.shared is not None:
+            raw = await self.shared.get(key)
+            if raw is not None:
+                cached = json.loads(raw)
+                if cached["not_after"] > now:
+                    self._store_local(key, cached["user"], cached["not_after"])
+                    self.shared_hits += 1
+                    return cached["user"]
+                await self.shared.delete(key)
+
+        self.misses += 1
+        return None
+
+    async def put(self, token: str, user: Dict, not_after: float):
+        key = token_key(token)
+        self._store_local(key, user, not_after)
+        if self.shared is not None:
+            ttl = min(self.shared_ttl, not_after - time.time())
+            if ttl > 0:
+                await self.shared.set(key, json.dumps({"user": user, "not_after": not_after}), ttl)
+                await self.shared.add_member(f"user:{user['user_id']}", key, self.shared_ttl)
+
+    async def invalidate_token(self, token: str):
+        key = token_key(token)
+        self._drop_local(key)
+        if self.shared is not None:
+            await self.shared.delete(key)
+        self.invalidations += 1
+
+    async def invalidate_user(self, user_id: str):
+        for key in self._by_user.pop(user_id, set()):
+            self._entries.pop(key, None)
+        if self.shared is not None:
+            index_key = f"user:{user_id}"
+            keys = await self.shared.members(index_key)
+            await self.shared.delete(index_key, *keys)
+        self.invalidations += 1
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "shared_tier": type(self.shared).__name__ if self.shared is not None else None,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.shared_hits) / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
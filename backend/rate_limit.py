@@ -0,0 +1,138 @@
+"""Sliding-window rate limiting for the credential endpoints.
+
+Each rule allows ``limit`` hits per ``window`` seconds per key (client IP,
+email, ...). The sliding window is approximated from two fixed windows:
+``previous * (1 - elapsed) + current``, which needs two counters per key
+and no per-hit timestamps. Every attempt counts, including rejected ones,
+so a client that keeps hammering stays throttled. ``enforce`` stops at the
+first rule that rejects, so a blocked IP cannot spend the budget of the
+email it is attacking.
+
+Client IPs come from ``client_ip``, which reads X-Forwarded-For as written
+by a known number of trusted proxies: behind an ingress the socket peer
+is the ingress itself, shared by every client.
+
+Counters live in process memory by default; ``RedisLimiterBackend`` shares
+them across workers (requires the optional ``redis`` package).
+"""
+import hashlib
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request
+
+
+def client_ip(request: Request, proxy_hops: int) -> Optional[str]:
+    """The client address as seen by the outermost of ``proxy_hops`` trusted proxies.
+
+    Each proxy appends the peer it saw to X-Forwarded-For, so the entry
+    ``proxy_hops`` from the right is the last one a client cannot forge.
+    """
+    if proxy_hops > 0:
+        forwarded = [ip.strip() for ip in request.headers.get("x-forwarded-for", "").split(",") if ip.strip()]
+        if forwarded:
+            return forwarded[-min(proxy_hops, len(forwarded))]
+    return request.client.host if request.client else None
+
+
+@dataclass(frozen=True)
+class Rule:
+    limit: int
+    window: float
+
+    @classmethod
+    def parse(cls, spec: str) -> "Rule":
+        """``"20/60"`` means 20 hits per 60 seconds."""
+        limit, window = spec.split("/")
+        return cls(int(limit), float(window))
+
+
+class InMemoryLimiterBackend:
+    """Counters in least-recently-hit order, so stale keys and the LRU overflow are popped from the front."""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._windows: "OrderedDict[str, list]" = OrderedDict()
+
+    async def incr(self, key: str, window: float) -> Tuple[int, int, float]:
+        now = time.time()
+        index = int(now // window)
+        entry = self._windows.pop(key, None)
+        if entry is None or entry[0] < index - 1:
+            entry = [index, 0, 0, window]
+        elif entry[0] == index - 1:
+            entry = [index, 0, entry[1], window]
+        entry[1] += 1
+        self._windows[key] = entry
+        self._prune(now)
+        return entry[1], entry[2], (now - index * window) / window
+
+    def _prune(self, now: float):
+        while self._windows:
+            key, entry = next(iter(self._windows.items()))
+            if entry[0] >= int(now // entry[3]) - 1 and len(self._windows) <= self.max_keys:
+                break
+            self._windows.popitem(last=False)
+
+
+class RedisLimiterBackend:
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(url)
+        self._prefix = prefix
+
+    async def incr(self, key: str, window: float) -> Tuple[int, int, float]:
+        now = time.time()
+        index = int(now // window)
+        current_key = f"{self._prefix}{key}:{index}"
+        pipe = self._redis.pipeline()
+        pipe.incr(current_key)
+        pipe.expire(current_key, int(math.ceil(window * 2)))
+        pipe.get(f"{self._prefix}{key}:{index - 1}")
+        current, _, previous = await pipe.execute()
+        return int(current), int(previous or 0), (now - index * window) / window
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+class RateLimiter:
+    def __init__(self, rules: Dict[str, Rule], backend=None):
+        self.rules = rules
+        self.backend = backend or InMemoryLimiterBackend()
+        self.allowed: Dict[str, int] = {name: 0 for name in rules}
+        self.rejected: Dict[str, int] = {name: 0 for name in rules}
+
+    async def hit(self, rule_name: str, value: str) -> Optional[float]:
+        """Count one attempt; returns seconds to wait if the rule is exceeded, else None."""
+        rule = self.rules[rule_name]
+        # Keys are hashed so emails and IPs never sit in a shared store in clear text
+        key = rule_name + ":" + hashlib.sha256(value.encode()).hexdigest()[:32]
+        current, previous, elapsed = await self.backend.incr(key, rule.window)
+        estimate = previous * (1 - elapsed) + current
+        if estimate <= rule.limit:
+            self.allowed[rule_name] += 1
+            return None
+        self.rejected[rule_name] += 1
+        return max(1.0, (1 - elapsed) * rule.window)
+
+    async def enforce(self, *checks: Tuple[str, Optional[str]]):
+        """Raise 429 at the first ``(rule_name, value)`` check that is over its limit; later ones are not counted."""
+        for rule_name, value in checks:
+            if not value:
+                continue
+            wait = await self.hit(rule_name, value)
+            if wait is not None:
+                raise HTTPException(status_code=429, detail="Too many attempts, try again later",
+                                    headers={"Retry-After": str(int(math.ceil(wait)))})
+
+    def stats(self) -> Dict:
+        stats = {}
+        for name in self.rules:
+            stats[f"{name}_allowed"] = self.allowed[name]
+            stats[f"{name}_rejected"] = self.rejected[name]
+        return stats
@@ -0,0 +1,99 @@
+"""Per-product review storage with incrementally maintained rating aggregates.
+
+Reviews reference their product by ``product_id`` and are paged per product
+with a keyset over ``(created_at, review_id)``. Every write also ``$inc``s
+the product's document in ``review_stats`` (count, rating sum and a
+1-5 histogram), so a product's rating summary is a single ``_id`` lookup
+that never aggregates the reviews themselves. ``rebuild_stats``
+recomputes the aggregates from scratch, for the first start after
+migrating and as a repair tool.
+"""
+import logging
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from pymongo import UpdateOne
+
+from pagination import Keyset
+
+logger = logging.getLogger(__name__)
+
+REVIEW_KEYSET = Keyset("created_at", "review_id")
+RATINGS = ("1", "2", "3", "4", "5")
+
+
+def rating_summary(stats: Optional[Dict]) -> Dict:
+    count = stats.get("count", 0) if stats else 0
+    histogram = {r: (stats or {}).get("histogram", {}).get(r, 0) for r in RATINGS}
+    average = round(stats["sum"] / count, 2) if count else None
+    return {"count": count, "average": average, "histogram": histogram}
+
+
+async def backfill_product_ids(db, products: List[Dict]) -> int:
+    """Link reviews stored before ``product_id`` existed, by product name; returns how many changed."""
+    by_name: Dict[str, List[str]] = {}
+    for p in products:
+        by_name.setdefault(p["name"], []).append(p["product_id"])
+    ops = []
+    for name, product_ids in by_name.items():
+        if len(product_ids) > 1:
+            logger.warning(f"Reviews for {name!r} not linked: the name is shared by {product_ids}")
+            continue
+        ops.append(UpdateOne({"product_name": name, "product_id": {"$exists": False}},
+                             {"$set": {"product_id": product_ids[0]}}))
+    if not ops:
+        return 0
+    result = await db.reviews.bulk_write(ops, ordered=False)
+    return result.modified_count
+
+
+async def rebuild_stats(db):
+    """Recompute every product's aggregate from the reviews collection."""
+    pipeline = [
+        {"$match": {"product_id": {"$exists": True}}},
+        {"$group": {"_id": {"product_id": "$product_id", "rating": "$rating"}, "n": {"$sum": 1}}},
+    ]
+    stats: Dict[str, Dict] = {}
+    async for row in db.reviews.aggregate(pipeline):
+        product_id, rating = row["_id"]["product_id"], str(row["_id"]["rating"])
+        entry = stats.setdefault(product_id, {"count": 0, "sum": 0, "histogram": {}})
+        entry["count"] += row["n"]
+        entry["sum"] += row["n"] * int(rating)
+        entry["histogram"][rating] = row["n"]
+    await db.review_stats.delete_many({"_id": {"$nin": list(stats)}})
+    if stats:
+        await db.review_stats.bulk_write([
+            UpdateOne({"_id": product_id}, {"$set": entry}, upsert=True) for product_id, entry in stats.items()
+        ], ordered=False)
+
+
+async def rating(db, product_id: str) -> Dict:
+    return rating_summary(await db.review_stats.find_one({"_id": product_id}))
+
+
+async def add_review(db, product: Dict, user: Dict, rating: int, text: str) -> Dict:
+    """Store a review and fold it into the product's aggregate; raises DuplicateKeyError on a second review."""
+    review = {
+        "review_id": f"rev_{uuid.uuid4().hex[:12]}",
+        "product_id": product["product_id"],
+        "product_name": product["name"],
+        "user_id": user["user_id"],
+        "user_name": user["name"],
+        "rating": rating,
+        "text": text,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    await db.reviews.insert_one(review)
+    await db.review_stats.update_one(
+        {"_id": product["product_id"]},
+        {"$inc": {"count": 1, "sum": rating, f"histogram.{rating}": 1}}, upsert=True
+    )
+    review.pop("_id", None)
+    return review
+
+
+async def page(db, product_id: str, projection: Dict, limit: int, cursor: Optional[str]):
+    query = REVIEW_KEYSET.query({"product_id": product_id}, cursor)
+    rows = await db.reviews.find(query, projection).sort(REVIEW_KEYSET.sort).limit(limit + 1).to_list(limit + 1)
+    return REVIEW_KEYSET.split_page(rows, limit)
@@ -0,0 +1,384 @@
+"""Materialized sales, revenue and license rollups.
+
+``sales_hourly`` and ``sales_daily`` hold one document per
+(bucket, product, duration) with the sale count and revenue in cents;
+``license_daily`` holds per (day, product) how many licenses were issued
+and how many expire that day, so the active count is a running difference.
+Reports read only these collections, so their cost follows the number of
+buckets, not the number of transactions.
+
+Writes are incremental. A paid transaction or a new license is folded in
+once, by whoever first claims it (``rolled_up_at`` is set atomically
+before the ``$inc``). ``backfill`` rebuilds everything from scratch with
+aggregation pipelines over ``created_at`` windows into staging
+collections and renames them over the live ones, so reports never see a
+half-built rollup. Only one worker backfills at a time: it holds a lease
+in ``rollup_meta`` and renews it after every window.
+
+A backfill counts whatever it claims itself plus whatever was claimed
+before its cutoff. Live writes made while the lease is held would land in
+collections that are about to be replaced, so they only claim and mark
+the rows ``rollup_deferred``; after the swap the backfill folds in the
+deferred rows claimed after its cutoff. ``start`` runs a backfill once in
+the background on a database that has never been rolled up; run it again
+(from the CLI) to repair drift, e.g. after a crash between claim and
+``$inc``.
+
+Run this module directly to backfill from the command line.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import uuid
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from payment_states import PAID
+
+logger = logging.getLogger(__name__)
+
+GRANULARITY = {"hour": ("sales_hourly", 13), "day": ("sales_daily", 10)}
+ROLLUPS = ("sales_hourly", "sales_daily", "license_daily")
+STAGING = "_staging"
+LEASE_SECONDS = 300
+
+SALE_FIELDS = {"_id": 0, "product_id": 1, "game": 1, "duration": 1, "amount": 1, "amount_cents": 1,
+               "paid_at": 1, "created_at": 1, "rolled_up_at": 1}
+LICENSE_FIELDS = {"_id": 0, "product_id": 1, "purchased_at": 1, "expires_at": 1, "rolled_up_at": 1}
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def sale_ops(rows: List[Dict], length: int) -> List[UpdateOne]:
+    """``$inc`` upserts for rows of (timestamp, product_id, game, duration, sales, revenue_cents)."""
+    ops = []
+    for row in rows:
+        bucket = row["ts"][:length]
+        ops.append(UpdateOne(
+            {"_id": f"{bucket}|{row['product_id']}|{row['duration']}"},
+            {"$setOnInsert": {"bucket": bucket, "product_id": row["product_id"], "game": row["game"],
+                              "duration": row["duration"]},
+             "$inc": {"sales": row["sales"], "revenue_cents": row["revenue_cents"]}},
+            upsert=True,
+        ))
+    return ops
+
+
+def license_ops(counts: Dict) -> List[UpdateOne]:
+    return [UpdateOne({"_id": f"{day}|{product_id}"},
+                      {"$setOnInsert": {"bucket": day, "product_id": product_id}, "$inc": inc}, upsert=True)
+            for (day, product_id), inc in counts.items()]
+
+
+class SalesRollups:
+    def __init__(self, db, lease_seconds: int = LEASE_SECONDS):
+        self.db = db
+        self.lease_seconds = lease_seconds
+        self.owner = uuid.uuid4().hex
+        self.sales_recorded = 0
+        self.licenses_recorded = 0
+        self.deferred = 0
+        self.backfills = 0
+        self._backfill: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if await self.db.rollup_meta.find_one({"_id": "sales"}) is None:
+            self._backfill = asyncio.create_task(self._initial_backfill())
+
+    async def stop(self):
+        if self._backfill is not None:
+            self._backfill.cancel()
+            await asyncio.gather(self._backfill, return_exceptions=True)
+            self._backfill = None
+
+    async def _initial_backfill(self):
+        try:
+            result = await self.backfill()
+            if result is None:
+                logger.info("Sales rollups are being backfilled by another worker")
+            else:
+                logger.info(f"Rolled up {result['sales']} sales and {result['licenses']} licenses")
+        except Exception:
+            logger.exception("Sales rollup backfill failed")
+
+    async def _acquire_lease(self) -> bool:
+        now = datetime.now(timezone.utc)
+        try:
+            # Matches only a free (expired) lease; otherwise the upsert collides on _id
+            await self.db.rollup_meta.find_one_and_update(
+                {"_id": "backfill", "expires_at": {"$lte": now.isoformat()}},
+                {"$set": {"owner": self.owner,
+                          "expires_at": (now + timedelta(seconds=self.lease_seconds)).isoformat()}},
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def _renew_lease(self):
+        expires_at = (datetime.now(timezone.utc) + timedelta(seconds=self.lease_seconds)).isoformat()
+        result = await self.db.rollup_meta.update_one({"_id": "backfill", "owner": self.owner},
+                                                      {"$set": {"expires_at": expires_at}})
+        if result.matched_count == 0:
+            raise RuntimeError("Lost the sales rollup backfill lease")
+
+    async def _release_lease(self):
+        await self.db.rollup_meta.delete_one({"_id": "backfill", "owner": self.owner})
+
+    async def _backfilling(self) -> bool:
+        lease = await self.db.rollup_meta.find_one({"_id": "backfill"}, {"expires_at": 1})
+        return lease is not None and lease["expires_at"] > _now()
+
+    async def _backfilled_at(self) -> str:
+        meta = await self.db.rollup_meta.find_one({"_id": "sales"}, {"backfilled_at": 1})
+        return meta["backfilled_at"] if meta else ""
+
+    async def _add_sales(self, txns: List[Dict]):
+        if not txns:
+            return
+        rows = [{"ts": txn.get("paid_at") or txn["created_at"], "product_id": txn["product_id"],
+                 "game": txn.get("game", ""), "duration": txn.get("duration", ""), "sales": 1,
+                 "revenue_cents": txn.get("amount_cents", int(round(txn["amount"] * 100)))} for txn in txns]
+        await asyncio.gather(*(self.db[collection].bulk_write(sale_ops(rows, length))
+                               for collection, length in GRANULARITY.values()))
+        self.sales_recorded += len(txns)
+
+    async def _add_licenses(self, licenses: List[Dict]):
+        counts: Dict = {}
+        for lic in licenses:
+            for day, field in ((lic["purchased_at"][:10], "issued"), (lic["expires_at"][:10], "expiring")):
+                inc = counts.setdefault((day, lic["product_id"]), {})
+                inc[field] = inc.get(field, 0) + 1
+        if counts:
+            await self.db.license_daily.bulk_write(license_ops(counts), ordered=False)
+        self.licenses_recorded += len(licenses)
+
+    async def _take_deferred(self, collection, query: Dict, projection: Dict, started: str) -> List[Dict]:
+        """Unmark deferred rows one at a time; returns those claimed at or after ``started``.
+
+        Unmarking is the arbitration between the backfill and a live writer
+        that saw the lease go away, so each row is folded in by one of them.
+        """
+        taken = []
+        while True:
+            doc = await collection.find_one_and_update({**query, "rollup_deferred": True},
+                                                       {"$unset": {"rollup_deferred": ""}}, projection=projection)
+            if doc is None:
+                return taken
+            # Claimed before the cutoff means the backfill already counted it
+            if doc["rolled_up_at"] >= started:
+                taken.append(doc)
+
+    async def _fold_deferred(self, started: str, sales_query: Optional[Dict] = None,
+                             licenses_query: Optional[Dict] = None) -> int:
+        txns, licenses = [], []
+        if sales_query is not None:
+            txns = await self._take_deferred(self.db.payment_transactions, sales_query, SALE_FIELDS, started)
+        if licenses_query is not None:
+            licenses = await self._take_deferred(self.db.licenses, licenses_query, LICENSE_FIELDS, started)
+        await self._add_sales(txns)
+        await self._add_licenses(licenses)
+        return len(txns) + len(licenses)
+
+    async def _defer(self, sales_query: Optional[Dict] = None, licenses_query: Optional[Dict] = None) -> bool:
+        """Leave claimed rows to the running backfill; returns whether this call folded them in after all."""
+        for collection, query in ((self.db.payment_transactions, sales_query), (self.db.licenses, licenses_query)):
+            if query is not None:
+                await collection.update_many(query, {"$set": {"rollup_deferred": True}})
+        self.deferred += 1
+        if await self._backfilling():
+            return False
+        # The backfill swapped and released the lease in between and may have missed the mark
+        return await self._fold_deferred(await self._backfilled_at(), sales_query, licenses_query) > 0
+
+    async def record_sale(self, session_id: str) -> bool:
+        """Fold a paid transaction into the sales rollups, once; returns whether this call did it."""
+        txn = await self.db.payment_transactions.find_one_and_update(
+            {"session_id": session_id, "payment_status": PAID, "rolled_up_at": {"$exists": False}},
+            {"$set": {"rolled_up_at": _now()}},
+            projection=SALE_FIELDS,
+        )
+        if txn is None:
+            return False
+        if await self._backfilling():
+            return await self._defer(sales_query={"session_id": session_id})
+        await self._add_sales([txn])
+        return True
+
+    async def record_licenses(self, licenses: List[Dict]):
+        """Count newly inserted licenses on their issue day and their expiry day."""
+        if not licenses:
+            return
+        claim = uuid.uuid4().hex
+        query = {"license_key": {"$in": [lic["license_key"] for lic in licenses]}}
+        result = await self.db.licenses.update_many({**query, "rolled_up_at": {"$exists": False}},
+                                                    {"$set": {"rolled_up_at": _now(), "rollup_claim": claim}})
+        claimed = {**query, "rollup_claim": claim}
+        if await self._backfilling():
+            await self._defer(licenses_query=claimed)
+            return
+        if result.modified_count < len(licenses):
+            # A backfill claimed some of them first and counts those itself
+            licenses = await self.db.licenses.find(claimed, LICENSE_FIELDS).to_list(None)
+        await self._add_licenses(licenses)
+
+    async def backfill(self, window_days: int = 7) -> Optional[Dict]:
+        """Rebuild every rollup from payment_transactions and licenses, one window at a time.
+
+        Returns None without touching anything when another worker holds the backfill lease.
+        """
+        if not await self._acquire_lease():
+            return None
+        run_id = uuid.uuid4().hex
+        previous = await self._backfilled_at()
+        # Taken after the lease is visible: live writes claimed before this were not deferred
+        started = _now()
+        swapped = False
+        try:
+            for collection in ROLLUPS:
+                await self.db[collection + STAGING].drop()
+                await self.db.create_collection(collection + STAGING)
+            for collection, _ in GRANULARITY.values():
+                await self.db[collection + STAGING].create_index([("bucket", ASCENDING)], name="bucket")
+
+            first = await self.db.payment_transactions.find_one({}, {"created_at": 1}, sort=[("created_at", 1)])
+            sales = 0
+            if first:
+                window_start = datetime.fromisoformat(first["created_at"]).replace(hour=0, minute=0, second=0,
+                                                                                   microsecond=0)
+                now = datetime.now(timezone.utc)
+                while window_start <= now:
+                    window_end = window_start + timedelta(days=window_days)
+                    sales += await self._backfill_sales(window_start.isoformat(), window_end.isoformat(),
+                                                        run_id, started)
+                    window_start = window_end
+                    await self._renew_lease()
+            licenses = await self._backfill_licenses(run_id, started)
+
+            await self._renew_lease()
+            for collection in ROLLUPS:
+                await self.db[collection + STAGING].rename(collection, dropTarget=True)
+            swapped = True
+            await self.db.rollup_meta.update_one({"_id": "sales"}, {"$set": {"backfilled_at": started}}, upsert=True)
+        finally:
+            await self._release_lease()
+            # Without a swap the old rollups are still live and get the deferred rows instead
+            deferred = await self._fold_deferred(started if swapped else previous, {}, {})
+        self.backfills += 1
+        return {"sales": sales, "licenses": licenses, "deferred": deferred}
+
+    async def _backfill_sales(self, start: str, end: str, run_id: str, started: str) -> int:
+        window = {"payment_status": PAID, "created_at": {"$gte": start, "$lt": end}}
+        await self.db.payment_transactions.update_many(
+            {**window, "rolled_up_at": {"$exists": False}},
+            {"$set": {"rolled_up_at": started, "rollup_run": run_id}}
+        )
+        sales = 0
+        for collection, length in GRANULARITY.values():
+            pipeline = [
+                # Claimed live after the cutoff means deferred and folded in after the swap
+                {"$match": {**window, "$or": [{"rollup_run": run_id}, {"rolled_up_at": {"$lt": started}}]}},
+                {"$group": {
+                    "_id": {"ts": {"$substrBytes": [{"$ifNull": ["$paid_at", "$created_at"]}, 0, length]},
+                            "product_id": "$product_id", "duration": {"$ifNull": ["$duration", ""]}},
+                    "game": {"$first": {"$ifNull": ["$game", ""]}},
+                    "sales": {"$sum": 1},
+                    "revenue_cents": {"$sum": {"$ifNull": ["$amount_cents",
+                                                           {"$round": [{"$multiply": ["$amount", 100]}, 0]}]}},
+                }},
+            ]
+            rows = [{**row["_id"], "game": row["game"], "sales": row["sales"], "revenue_cents": int(row["revenue_cents"])}
+                    async for row in self.db.payment_transactions.aggregate(pipeline)]
+            if rows:
+                await self.db[collection + STAGING].bulk_write(sale_ops(rows, length), ordered=False)
+            # Both granularities count the same transactions
+            sales = sum(r["sales"] for r in rows)
+        return sales
+
+    async def _backfill_licenses(self, run_id: str, started: str) -> int:
+        await self.db.licenses.update_many({"rolled_up_at": {"$exists": False}},
+                                           {"$set": {"rolled_up_at": started, "rollup_run": run_id}})
+        counts: Dict = {}
+        total = 0
+        for field, source in (("issued", "$purchased_at"), ("expiring", "$expires_at")):
+            pipeline = [
+                {"$match": {"$or": [{"rollup_run": run_id}, {"rolled_up_at": {"$lt": started}}]}},
+                {"$group": {"_id": {"day": {"$substrBytes": [source, 0, 10]}, "product_id": "$product_id"},
+                            "n": {"$sum": 1}}},
+            ]
+            async for row in self.db.licenses.aggregate(pipeline, allowDiskUse=True):
+                inc = counts.setdefault((row["_id"]["day"], row["_id"]["product_id"]), {})
+                inc[field] = row["n"]
+                if field == "issued":
+                    total += row["n"]
+        ops = license_ops(counts)
+        for i in range(0, len(ops), 1000):
+            await self.db["license_daily" + STAGING].bulk_write(ops[i:i + 1000], ordered=False)
+        return total
+
+    async def report(self, granularity: str, start: Optional[str], end: Optional[str], group_by: str) -> Dict:
+        collection, _ = GRANULARITY[granularity]
+        query: Dict = {}
+        if start or end:
+            query["bucket"] = {**({"$gte": start} if start else {}), **({"$lte": end} if end else {})}
+        series: Dict[str, Dict] = {}
+        totals: Dict[str, Dict] = {}
+        async for doc in self.db[collection].find(query, {"_id": 0}).sort("bucket", 1):
+            key = doc[group_by]
+            for target in (series.setdefault(doc["bucket"], {}).setdefault(key, {"sales": 0, "revenue_cents": 0}),
+                           totals.setdefault(key, {"sales": 0, "revenue_cents": 0})):
+                target["sales"] += doc["sales"]
+                target["revenue_cents"] += doc["revenue_cents"]
+        return {"granularity": granularity, "group_by": group_by, "totals": totals,
+                "series": [{"bucket": b, "groups": groups} for b, groups in series.items()],
+                "active_licenses": await self.active_licenses()}
+
+    async def active_licenses(self) -> Dict[str, int]:
+        """Licenses issued so far minus those already expired, per product."""
+        today = datetime.now(timezone.utc).date().isoformat()
+        active: Dict[str, int] = {}
+        async for doc in self.db.license_daily.find({}, {"_id": 0}):
+            count = doc.get("issued", 0) if doc["bucket"] <= today else 0
+            if doc["bucket"] < today:
+                count -= doc.get("expiring", 0)
+            active[doc["product_id"]] = active.get(doc["product_id"], 0) + count
+        return active
+
+    def stats(self) -> Dict:
+        return {"sales_recorded": self.sales_recorded, "licenses_recorded": self.licenses_recorded,
+                "deferred": self.deferred, "backfills": self.backfills,
+                "backfilling": self._backfill is not None and not self._backfill.done()}
+
+
+async def _main(argv=None) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description="Rebuild the sales and license rollups")
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--window-days", type=int, default=7, help="transactions aggregated per pipeline run")
+    args = parser.parse_args(argv)
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    try:
+        result = await SalesRollups(client[os.environ['DB_NAME']]).backfill(args.window_days)
+        if result is None:
+            print("another worker is backfilling the rollups", file=sys.stderr)
+            return 1
+        print(f"rolled up {result['sales']} sales and {result['licenses']} licenses")
+        return 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main()))
@@ -0,0 +1,162 @@
+"""In-memory catalog search: inverted index, prefix matching and facet counts.
+
+Each catalog snapshot builds a ``SearchIndex``. Products are tokenized per
+field with a field weight; tokenized terms are cached by the content of the
+indexed fields, so a rebuild after an edit only re-tokenizes the products
+that changed. Query terms match index terms by prefix (an exact match
+scores higher) and every query term must match. Prefixes are expanded with
+a binary search over the sorted vocabulary, and filters and facets are
+set intersections over product ordinals, so query cost follows the size of
+the result rather than the size of the catalog.
+
+Facet counts are disjunctive: each facet is counted with every filter
+applied except its own, so selecting one tier still shows the counts for
+the other tiers.
+"""
+import re
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+FIELD_WEIGHTS = {"name": 5.0, "features": 3.0, "tagline": 2.0, "feature_categories": 1.0}
+PREFIX_FACTOR = 0.5
+MAX_PREFIX_EXPANSION = 256
+FACETS = ("game", "tier", "status")
+PRICE_BUCKETS = ((0, 10, "0-10"), (10, 20, "10-20"), (20, 30, "20-30"), (30, 50, "30-50"), (50, float("inf"), "50+"))
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+def price_bucket(price: float) -> str:
+    for low, high, label in PRICE_BUCKETS:
+        if low <= price < high:
+            return label
+    return PRICE_BUCKETS[-1][2]
+
+
+def _indexed_fields(product: Dict) -> Tuple:
+    categories = product.get("feature_categories") or {}
+    return (product["name"], product.get("tagline") or "", tuple(product.get("features") or ()),
+            tuple((k, tuple(v)) for k, v in sorted(categories.items())))
+
+
+def _term_weights(fields: Tuple) -> Dict[str, float]:
+    name, tagline, features, categories = fields
+    weights: Dict[str, float] = {}
+
+    def add(texts: Iterable[str], weight: float):
+        for term in {t for text in texts for t in tokenize(text)}:
+            weights[term] = weights.get(term, 0.0) + weight
+
+    add([name], FIELD_WEIGHTS["name"])
+    add(features, FIELD_WEIGHTS["features"])
+    add([tagline], FIELD_WEIGHTS["tagline"])
+    add([k for k, _ in categories] + [v for _, values in categories for v in values], FIELD_WEIGHTS["feature_categories"])
+    return weights
+
+
+class SearchIndex:
+    # Indexed-field content -> term weights, shared across snapshots
+    _term_cache: Dict[Tuple, Dict[str, float]] = {}
+
+    def __init__(self, products: List[Dict]):
+        self.products = products
+        self.postings: Dict[str, Dict[int, float]] = {}
+        self.facets: Dict[str, Dict[str, Set[int]]] = {f: {} for f in (*FACETS, "price")}
+        self.labels: Dict[str, Dict[str, str]] = {f: {} for f in (*FACETS, "price")}
+        self.retokenized = 0
+        cache = {}
+        for ordinal, product in enumerate(products):
+            fields = _indexed_fields(product)
+            weights = self._term_cache.get(fields)
+            if weights is None:
+                weights = _term_weights(fields)
+                self.retokenized += 1
+            cache[fields] = weights
+            for term, weight in weights.items():
+                self.postings.setdefault(term, {})[ordinal] = weight
+            for facet in FACETS:
+                self._add_facet(facet, product[facet], ordinal)
+            self._add_facet("price", price_bucket(product["price"]), ordinal)
+        # Only the current catalog's products stay cached
+        SearchIndex._term_cache = cache
+        self.vocabulary = sorted(self.postings)
+        self.all = set(range(len(products)))
+
+    def _add_facet(self, facet: str, value: str, ordinal: int):
+        key = value.lower()
+        self.facets[facet].setdefault(key, set()).add(ordinal)
+        self.labels[facet].setdefault(key, value)
+
+    def _expand(self, prefix: str) -> List[str]:
+        start = bisect_left(self.vocabulary, prefix)
+        terms = []
+        for term in self.vocabulary[start:start + MAX_PREFIX_EXPANSION]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def _match(self, query: str) -> Dict[int, float]:
+        """Ordinal -> relevance for products matching every query term (by prefix)."""
+        terms = tokenize(query)
+        if not terms:
+            return {ordinal: 0.0 for ordinal in self.all}
+        scores: Optional[Dict[int, float]] = None
+        for term in dict.fromkeys(terms):
+            term_scores: Dict[int, float] = {}
+            for candidate in self._expand(term):
+                factor = 1.0 if candidate == term else PREFIX_FACTOR
+                for ordinal, weight in self.postings[candidate].items():
+                    score = weight * factor
+                    if score > term_scores.get(ordinal, 0.0):
+                        term_scores[ordinal] = score
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {o: s + term_scores[o] for o, s in scores.items() if o in term_scores}
+            if not scores:
+                return {}
+        return scores
+
+    def _filtered(self, facet: str, values: List[str]) -> Set[int]:
+        selected: Set[int] = set()
+        for value in values:
+            selected |= self.facets[facet].get(value.lower(), set())
+        return selected
+
+    def search(self, query: str = "", filters: Optional[Dict[str, List[str]]] = None,
+               limit: int = 20, offset: int = 0) -> Dict:
+        filters = {f: v for f, v in (filters or {}).items() if v}
+        scores = self._match(query)
+        matched = set(scores)
+        selections = {facet: self._filtered(facet, values) for facet, values in filters.items()}
+
+        hits = matched
+        for selected in selections.values():
+            hits = hits & selected
+
+        facet_counts = {}
+        for facet in self.facets:
+            # Every filter but this facet's own
+            base = matched
+            for other, selected in selections.items():
+                if other != facet:
+                    base = base & selected
+            facet_counts[facet] = {self.labels[facet][key]: len(base & ordinals)
+                                   for key, ordinals in self.facets[facet].items() if base & ordinals}
+
+        # Relevance first, then catalog order
+        ranked = sorted(hits, key=lambda o: (-scores[o], o))
+        page = ranked[offset:offset + limit]
+        return {
+            "total": len(ranked),
+            "results": [(self.products[o], round(scores[o], 3)) for o in page],
+            "facets": facet_counts,
+        }
+
+    def stats(self) -> Dict:
+        return {"products": len(self.products), "terms": len(self.vocabulary), "retokenized": self.retokenized}
@@ -1,37 +1,118 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Request, Response, Depends
+from fastapi import FastAPI, APIRouter, HTTPException, Request, Response, Depends, Query
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
 import os
 import logging
-import httpx
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
 from typing import List, Optional, Dict
+import time
 import uuid
+import orjson
 import secrets
 from datetime import datetime, timezone, timedelta
-from passlib.context import CryptContext
-import jwt as pyjwt
-from emergentintegrations.payments.stripe.checkout import StripeCheckout, CheckoutSessionResponse, CheckoutStatusResponse, CheckoutSessionRequest
+from emergentintegrations.payments.stripe.checkout import CheckoutSessionRequest
+from password_hasher import PasswordHasher
+from jwt_keys import KeyRing
+from maintenance import TransactionArchiver, as_utc, migrate_session_expiry
+from metrics import Metrics, MetricsMiddleware, timed
+from mongo_pool import PoolMonitor, Readiness, client_options, warm_up
+from rate_limit import RateLimiter, Rule, InMemoryLimiterBackend, RedisLimiterBackend, client_ip
+import compression
+from principal_cache import PrincipalCache, InMemorySharedTier, RedisSharedTier
+from indexes import ensure_indexes, verify_plans
+from catalog import CatalogStore, CompiledCatalog, SUMMARY_FIELDS, VIEWS, rendered_response
+from outbound import OutboundClients
+from pagination import Keyset
+import reviews as review_store
+from fulfillment import FulfillmentWorker
+from license_issuer import LicenseIssuer
+from sales_rollups import SalesRollups
+from license_index import LicenseIndex
+from payment_states import PAID, PENDING, TRANSITIONS, read_and_claim_check, transition
+from webhook_inbox import WebhookInbox
+from status_feed import StatusFeed, STATUSES
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
+# Request, Mongo, payment and bcrypt timings, exported at /metrics
+metrics = Metrics(slow_request_seconds=float(os.environ.get('SLOW_REQUEST_MS', '1000')) / 1000)
+
+# MongoDB connection; pool settings from MONGO_* (see mongo_pool.py), warmed up at startup
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+mongo_pool = PoolMonitor()
+mongo_options = client_options(mongo_pool)
+client = AsyncIOMotorClient(mongo_url, **mongo_options)
+readiness = Readiness(client)
+db = timed(client[os.environ['DB_NAME']], metrics, "mongo")
+
+# JWT signing keys shared by all workers (see jwt_keys.py for configuration)
+jwt_keyring = KeyRing.from_env(ROOT_DIR)
+
+# bcrypt runs on a bounded worker pool so logins never block the event loop
+password_hasher = timed(PasswordHasher.from_env(), metrics, "bcrypt")
+
+# Resolved principals cached per token hash; PRINCIPAL_CACHE_SHARED=memory|redis://...
+def build_principal_cache() -> PrincipalCache:
+    shared_url = os.environ.get('PRINCIPAL_CACHE_SHARED')
+    if not shared_url:
+        shared = None
+    elif shared_url == "memory":
+        shared = InMemorySharedTier()
+    else:
+        shared = RedisSharedTier(shared_url)
+    return PrincipalCache(
+        max_entries=int(os.environ.get('PRINCIPAL_CACHE_SIZE', '10000')),
+        ttl=float(os.environ.get('PRINCIPAL_CACHE_TTL', '30')),
+        shared=shared,
+        shared_ttl=float(os.environ.get('PRINCIPAL_CACHE_SHARED_TTL', '300')),
+    )
+
+principal_cache = build_principal_cache()
 
-# JWT config
-JWT_SECRET = secrets.token_hex(32)
-JWT_ALGORITHM = "HS256"
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Responses above COMPRESS_MIN_SIZE bytes are gzip/brotli encoded when the client accepts it
+compression.configure(minimum_size=int(os.environ.get('COMPRESS_MIN_SIZE', '1024')))
+
+# Credential endpoints are throttled per IP and per email before any hashing
+# or DB work; limits are "hits/seconds", RATE_LIMIT_SHARED=redis://... shares counters
+def build_rate_limiter() -> RateLimiter:
+    rules = {
+        "login_ip": Rule.parse(os.environ.get('RATE_LIMIT_LOGIN_IP', '30/60')),
+        "login_email": Rule.parse(os.environ.get('RATE_LIMIT_LOGIN_EMAIL', '10/300')),
+        "register_ip": Rule.parse(os.environ.get('RATE_LIMIT_REGISTER_IP', '10/600')),
+        "google_session_ip": Rule.parse(os.environ.get('RATE_LIMIT_GOOGLE_SESSION_IP', '30/60')),
+    }
+    shared_url = os.environ.get('RATE_LIMIT_SHARED')
+    backend = RedisLimiterBackend(shared_url) if shared_url else InMemoryLimiterBackend()
+    return RateLimiter(rules, backend)
+
+rate_limiter = build_rate_limiter()
 
 # Stripe
 stripe_api_key = os.environ.get('STRIPE_API_KEY')
 
-app = FastAPI()
+# Mints licenses for paid checkouts off the request path
+sales_rollups = SalesRollups(db)
+fulfillment = FulfillmentWorker(db, client=client, rollups=sales_rollups)
+license_index = LicenseIndex(db, poll_interval=float(os.environ.get('LICENSE_INDEX_POLL_INTERVAL', '2')))
+license_issuer = LicenseIssuer(db, chunk_size=int(os.environ.get('LICENSE_ISSUE_CHUNK', '1000')),
+                               rollups=sales_rollups)
+transaction_archiver = TransactionArchiver(
+    db,
+    max_age=float(os.environ.get('PENDING_TXN_MAX_AGE_HOURS', '48')) * 3600,
+    interval=float(os.environ.get('PENDING_TXN_ARCHIVE_INTERVAL', '3600')),
+    batch_size=int(os.environ.get('PENDING_TXN_ARCHIVE_BATCH', '500')),
+)
+
+# Shared payment/OAuth clients, opened on startup and closed on shutdown
+outbound = OutboundClients(stripe_api_key, metrics)
+
+app = FastAPI(default_response_class=ORJSONResponse)
 api_router = APIRouter(prefix="/api")
 
 # Configure logging
@@ -83,6 +164,9 @@ class ProductStatusResponse(BaseModel):
     status: str
     last_updated: str
 
+class ProductStatusUpdate(BaseModel):
+    status: str
+
 class LicenseResponse(BaseModel):
     license_id: str
     product_id: str
@@ -93,6 +177,21 @@ class LicenseResponse(BaseModel):
     purchased_at: str
     expires_at: str
 
+class BulkLicenseRequest(BaseModel):
+    product_id: str
+    count: int = Field(ge=1, le=100000)
+    duration: str = "1month"
+    user_id: Optional[str] = None
+    issued_to: Optional[str] = None
+
+class LicenseValidateRequest(BaseModel):
+    license_key: str = Field(max_length=64)
+    product_id: Optional[str] = None
+
+class ReviewCreate(BaseModel):
+    rating: int = Field(ge=1, le=5)
+    text: str = Field(min_length=1, max_length=2000)
+
 class TransactionResponse(BaseModel):
     transaction_id: str
     product_id: str
@@ -104,6 +203,7 @@ class TransactionResponse(BaseModel):
 
 class ReviewResponse(BaseModel):
     review_id: str
+    product_id: Optional[str] = None
     user_name: str
     product_name: str
     rating: int
@@ -118,48 +218,57 @@ def create_jwt_token(user_id: str, email: str):
         "email": email,
         "exp": datetime.now(timezone.utc) + timedelta(days=7)
     }
-    return pyjwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+    return jwt_keyring.sign(payload)
 
 def verify_jwt_token(token: str):
-    try:
-        payload = pyjwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload
-    except pyjwt.ExpiredSignatureError:
-        return None
-    except pyjwt.InvalidTokenError:
-        return None
+    return jwt_keyring.verify(token)
 
-async def get_current_user(request: Request):
+def get_request_token(request: Request) -> Optional[str]:
     token = request.cookies.get("session_token")
     if not token:
         auth_header = request.headers.get("Authorization")
         if auth_header and auth_header.startswith("Bearer "):
             token = auth_header.split(" ")[1]
+    return token
+
+async def get_current_user(request: Request):
+    token = get_request_token(request)
     if not token:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
+    cached = await principal_cache.get(token)
+    if cached:
+        return cached
+
     # Check if it's a Google OAuth session token
-    session_doc = await db.user_sessions.find_one({"session_token": token}, {"_id": 0})
+    # Expiry is compared server-side; the TTL index deletes the row shortly after
+    session_doc = await db.user_sessions.find_one(
+        {"session_token": token, "expires_at": {"$gt": datetime.now(timezone.utc)}}, {"_id": 0}
+    )
     if session_doc:
-        expires_at = session_doc["expires_at"]
-        if isinstance(expires_at, str):
-            expires_at = datetime.fromisoformat(expires_at)
-        if expires_at.tzinfo is None:
-            expires_at = expires_at.replace(tzinfo=timezone.utc)
-        if expires_at < datetime.now(timezone.utc):
-            raise HTTPException(status_code=401, detail="Session expired")
-        user = await db.users.find_one({"user_id": session_doc["user_id"]}, {"_id": 0})
+        expires_at = as_utc(session_doc["expires_at"])
+        user = await db.users.find_one({"user_id": session_doc["user_id"]}, {"_id": 0, "password_hash": 0})
         if not user:
             raise HTTPException(status_code=401, detail="User not found")
+        await principal_cache.put(token, user, expires_at.timestamp())
         return user
 
     # Check JWT token
     payload = verify_jwt_token(token)
     if not payload:
         raise HTTPException(status_code=401, detail="Invalid token")
-    user = await db.users.find_one({"user_id": payload["user_id"]}, {"_id": 0})
+    user = await db.users.find_one({"user_id": payload["user_id"]}, {"_id": 0, "password_hash": 0})
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
+    await principal_cache.put(token, user, float(payload["exp"]))
+    return user
+
+# Comma-separated emails allowed to use the admin endpoints
+ADMIN_EMAILS = {e.strip().lower() for e in os.environ.get('ADMIN_EMAILS', '').split(',') if e.strip()}
+
+async def require_admin(user=Depends(get_current_user)):
+    if user["email"].lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin access required")
     return user
 
 async def get_optional_user(request: Request):
@@ -170,14 +279,20 @@ async def get_optional_user(request: Request):
 
 # ======================== AUTH ROUTES ========================
 
+# The app is deployed behind the ingress, which appends the peer it saw to X-Forwarded-For;
+# without reading it every client would share the ingress IP and the per-IP limits would be
+# site-wide. Raise for each extra proxy in front (e.g. a CDN), set 0 when exposed directly.
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', '1'))
+
 @api_router.post("/auth/register")
-async def register(data: UserRegister, response: Response):
+async def register(data: UserRegister, request: Request, response: Response):
+    await rate_limiter.enforce(("register_ip", client_ip(request, TRUSTED_PROXY_HOPS)))
     existing = await db.users.find_one({"email": data.email}, {"_id": 0})
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
     
     user_id = f"user_{uuid.uuid4().hex[:12]}"
-    hashed_pw = pwd_context.hash(data.password)
+    hashed_pw = await password_hasher.hash(data.password)
     now = datetime.now(timezone.utc).isoformat()
     
     user_doc = {
@@ -198,12 +313,17 @@ async def register(data: UserRegister, response: Response):
     return {"token": token, "user": {"user_id": user_id, "email": data.email, "name": data.name, "picture": None, "created_at": now}}
 
 @api_router.post("/auth/login")
-async def login(data: UserLogin, response: Response):
+async def login(data: UserLogin, request: Request, response: Response):
+    await rate_limiter.enforce(("login_ip", client_ip(request, TRUSTED_PROXY_HOPS)), ("login_email", data.email.strip().lower()))
     user = await db.users.find_one({"email": data.email}, {"_id": 0})
     if not user or "password_hash" not in user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
-    if not pwd_context.verify(data.password, user["password_hash"]):
+    valid, new_hash = await password_hasher.verify_and_update(data.password, user["password_hash"])
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    if new_hash:
+        # Stored hash predates the current bcrypt policy; upgrade it transparently
+        await db.users.update_one({"user_id": user["user_id"]}, {"$set": {"password_hash": new_hash}})
     
     token = create_jwt_token(user["user_id"], user["email"])
     response.set_cookie(
@@ -218,28 +338,29 @@ async def auth_me(user=Depends(get_current_user)):
 
 @api_router.post("/auth/logout")
 async def logout(request: Request, response: Response):
-    token = request.cookies.get("session_token")
+    token = get_request_token(request)
     if token:
         await db.user_sessions.delete_one({"session_token": token})
+        await principal_cache.invalidate_token(token)
     response.delete_cookie(key="session_token", path="/", secure=True, samesite="none")
     return {"message": "Logged out"}
 
 # REMINDER: DO NOT HARDCODE THE URL, OR ADD ANY FALLBACKS OR REDIRECT URLS, THIS BREAKS THE AUTH
 @api_router.post("/auth/google/session")
 async def google_session(request: Request, response: Response):
+    await rate_limiter.enforce(("google_session_ip", client_ip(request, TRUSTED_PROXY_HOPS)))
     body = await request.json()
     session_id = body.get("session_id")
     if not session_id:
         raise HTTPException(status_code=400, detail="Missing session_id")
     
-    async with httpx.AsyncClient() as http_client:
-        resp = await http_client.get(
-            "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
-            headers={"X-Session-ID": session_id}
-        )
-        if resp.status_code != 200:
-            raise HTTPException(status_code=401, detail="Invalid session")
-        data = resp.json()
+    resp = await outbound.http.get(
+        "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
+        headers={"X-Session-ID": session_id}
+    )
+    if resp.status_code != 200:
+        raise HTTPException(status_code=401, detail="Invalid session")
+    data = resp.json()
     
     email = data["email"]
     name = data.get("name", "")
@@ -250,6 +371,7 @@ async def google_session(request: Request, response: Response):
     if existing:
         user_id = existing["user_id"]
         await db.users.update_one({"email": email}, {"$set": {"name": name, "picture": picture}})
+        await principal_cache.invalidate_user(user_id)
     else:
         user_id = f"user_{uuid.uuid4().hex[:12]}"
         await db.users.insert_one({
@@ -263,7 +385,7 @@ async def google_session(request: Request, response: Response):
     await db.user_sessions.insert_one({
         "user_id": user_id,
         "session_token": session_token,
-        "expires_at": (datetime.now(timezone.utc) + timedelta(days=7)).isoformat(),
+        "expires_at": datetime.now(timezone.utc) + timedelta(days=7),
         "created_at": datetime.now(timezone.utc).isoformat()
     })
     
@@ -326,54 +448,171 @@ PRODUCTS = [
 ]
 
 REVIEWS = [
-    {"review_id": "r1", "user_name": "Skyline", "product_name": "Disconnect", "rating": 5, "text": "Best external Rust tool I've used. ESP is crystal clear.", "created_at": "2025-12-01T10:00:00Z"},
-    {"review_id": "r2", "user_name": "Arcturus", "product_name": "Division", "rating": 5, "text": "Been using Division for 3 months. Absolutely solid.", "created_at": "2025-11-20T14:00:00Z"},
-    {"review_id": "r3", "user_name": "NotFlokii", "product_name": "Phantom", "rating": 5, "text": "Phantom is unmatched for Valorant. Stream proof is a game changer.", "created_at": "2025-11-15T09:00:00Z"},
-    {"review_id": "r4", "user_name": "rzvisualz", "product_name": "Infinity", "rating": 5, "text": "Marvel Rivals domination. Hero tracker is insane.", "created_at": "2025-10-28T16:00:00Z"},
-    {"review_id": "r5", "user_name": "SpinXO_", "product_name": "Vortex", "rating": 5, "text": "Vortex prediction system is next level for OW2.", "created_at": "2025-10-15T11:00:00Z"},
-    {"review_id": "r6", "user_name": "Jake2154", "product_name": "Obsidian", "rating": 5, "text": "Best MC client on the market. KillAura is smooth.", "created_at": "2025-09-20T13:00:00Z"},
-    {"review_id": "r7", "user_name": "Hekieee", "product_name": "Quantum", "rating": 5, "text": "Great budget CS2 option. Radar is super useful.", "created_at": "2025-09-10T08:00:00Z"},
-    {"review_id": "r8", "user_name": "Dayne20", "product_name": "Fluent", "rating": 5, "text": "Fluent is perfect for legit play. Clean and smooth.", "created_at": "2025-08-25T15:00:00Z"},
-    {"review_id": "r9", "user_name": "twat2", "product_name": "Titan", "rating": 4, "text": "Arc Raiders tool works great. Waiting for more features.", "created_at": "2025-08-10T12:00:00Z"},
-    {"review_id": "r10", "user_name": "1pacAday", "product_name": "Spectre", "rating": 5, "text": "Lightweight and reliable. Exactly what I needed for ranked.", "created_at": "2025-07-30T10:00:00Z"},
+    {"review_id": "r1", "user_name": "Skyline", "product_id": "rust-disconnect", "product_name": "Disconnect", "rating": 5, "text": "Best external Rust tool I've used. ESP is crystal clear.", "created_at": "2025-12-01T10:00:00Z"},
+    {"review_id": "r2", "user_name": "Arcturus", "product_id": "cs2-division", "product_name": "Division", "rating": 5, "text": "Been using Division for 3 months. Absolutely solid.", "created_at": "2025-11-20T14:00:00Z"},
+    {"review_id": "r3", "user_name": "NotFlokii", "product_id": "val-phantom", "product_name": "Phantom", "rating": 5, "text": "Phantom is unmatched for Valorant. Stream proof is a game changer.", "created_at": "2025-11-15T09:00:00Z"},
+    {"review_id": "r4", "user_name": "rzvisualz", "product_id": "mr-infinity", "product_name": "Infinity", "rating": 5, "text": "Marvel Rivals domination. Hero tracker is insane.", "created_at": "2025-10-28T16:00:00Z"},
+    {"review_id": "r5", "user_name": "SpinXO_", "product_id": "ow-vortex", "product_name": "Vortex", "rating": 5, "text": "Vortex prediction system is next level for OW2.", "created_at": "2025-10-15T11:00:00Z"},
+    {"review_id": "r6", "user_name": "Jake2154", "product_id": "mc-obsidian", "product_name": "Obsidian", "rating": 5, "text": "Best MC client on the market. KillAura is smooth.", "created_at": "2025-09-20T13:00:00Z"},
+    {"review_id": "r7", "user_name": "Hekieee", "product_id": "cs2-quantum", "product_name": "Quantum", "rating": 5, "text": "Great budget CS2 option. Radar is super useful.", "created_at": "2025-09-10T08:00:00Z"},
+    {"review_id": "r8", "user_name": "Dayne20", "product_id": "rust-fluent", "product_name": "Fluent", "rating": 5, "text": "Fluent is perfect for legit play. Clean and smooth.", "created_at": "2025-08-25T15:00:00Z"},
+    {"review_id": "r9", "user_name": "twat2", "product_id": "arc-titan", "product_name": "Titan", "rating": 4, "text": "Arc Raiders tool works great. Waiting for more features.", "created_at": "2025-08-10T12:00:00Z"},
+    {"review_id": "r10", "user_name": "1pacAday", "product_id": "val-spectre", "product_name": "Spectre", "rating": 5, "text": "Lightweight and reliable. Exactly what I needed for ranked.", "created_at": "2025-07-30T10:00:00Z"},
 ]
 
+def shape_reviews(reviews: List[Dict]) -> List[Dict]:
+    return [ReviewResponse(**r).model_dump() for r in reviews]
+
+def compile_catalog(products: List[Dict], reviews: List[Dict], version: int,
+                    total_reviews: Optional[int]) -> CompiledCatalog:
+    return CompiledCatalog(
+        products=[ProductResponse(**p).model_dump() for p in products],
+        reviews=shape_reviews(reviews),
+        version=version,
+        total_reviews=total_reviews,
+    )
+
+# Mongo-backed catalog, seeded from the lists above on first start; handlers
+# only ever read the in-memory snapshot, which is swapped when the version moves
+catalog_store = CatalogStore(db, compile_catalog, shape_reviews, PRODUCTS, REVIEWS,
+                             poll_interval=float(os.environ.get('CATALOG_POLL_INTERVAL', '5')))
+
+# Live status: versioned, persisted in Mongo and pushed to SSE subscribers
+status_feed = StatusFeed(db, PRODUCTS, default_updated="2025-12-15T08:00:00Z",
+                         poll_interval=float(os.environ.get('STATUS_POLL_INTERVAL', '1')))
+catalog_store.listeners.append(lambda catalog: status_feed.sync_products(catalog.product_list))
+
+PRODUCT_FIELDS = tuple(ProductResponse.model_fields)
+
+VIEW_PATTERN = f"^({'|'.join(VIEWS)})$"
+
+def product_view(view: str, fields: Optional[str]) -> str:
+    """Resolve ?fields=/?view= to a named catalog view; a field list must match one exactly."""
+    if not fields:
+        return view
+    requested = {f.strip() for f in fields.split(",") if f.strip()} | {"product_id"}
+    for name, view_fields in VIEWS.items():
+        if requested == set(view_fields or PRODUCT_FIELDS):
+            return name
+    named = "; ".join(f"{name}: {','.join(view_fields)}" for name, view_fields in VIEWS.items() if view_fields)
+    raise HTTPException(status_code=400, detail=f"fields must match a named view ({named}), or omit it for all")
+
 @api_router.get("/products", response_model=List[ProductResponse])
-async def get_products(game: Optional[str] = None):
+async def get_products(request: Request, game: Optional[str] = None,
+                       view: str = Query("full", pattern=VIEW_PATTERN), fields: Optional[str] = None):
+    catalog_view = catalog_store.current.view(product_view(view, fields))
     if game:
-        return [p for p in PRODUCTS if p["game"].lower() == game.lower()]
-    return PRODUCTS
+        return rendered_response(request, catalog_view.products_for_game(game))
+    return rendered_response(request, catalog_view.products)
 
 @api_router.get("/products/{product_id}", response_model=ProductResponse)
-async def get_product(product_id: str):
-    for p in PRODUCTS:
-        if p["product_id"] == product_id:
-            return p
-    raise HTTPException(status_code=404, detail="Product not found")
+async def get_product(product_id: str, request: Request,
+                      view: str = Query("full", pattern=VIEW_PATTERN), fields: Optional[str] = None):
+    rendered = catalog_store.current.view(product_view(view, fields)).product_by_id.get(product_id)
+    if rendered is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return rendered_response(request, rendered)
+
+@api_router.get("/products/{product_id}/quote")
+async def get_product_quote(product_id: str, request: Request, duration: Optional[str] = None):
+    """Every duration's price for a product, or one quote with ``duration``; from the compiled price book."""
+    catalog = catalog_store.current
+    if product_id not in catalog.quotes:
+        raise HTTPException(status_code=404, detail="Product not found")
+    if duration is None:
+        return rendered_response(request, catalog.quotes[product_id])
+    quote = catalog.prices.quote(product_id, duration)
+    if quote is None:
+        raise HTTPException(status_code=404, detail="Unknown duration")
+    return quote.payload()
+
+@api_router.get("/search")
+async def search_products(q: str = Query("", max_length=200), game: List[str] = Query([]), tier: List[str] = Query([]),
+                          status: List[str] = Query([]), price: List[str] = Query([]),
+                          limit: int = Query(20, ge=1, le=100), offset: int = Query(0, ge=0)):
+    """Prefix search over names, taglines and features, with game/tier/status/price facets."""
+    found = catalog_store.current.search.search(
+        q, {"game": game, "tier": tier, "status": status, "price": price}, limit, offset
+    )
+    results = [{**{f: product.get(f) for f in SUMMARY_FIELDS}, "score": score} for product, score in found["results"]]
+    return {"total": found["total"], "results": results, "facets": found["facets"]}
 
 @api_router.get("/product-status", response_model=List[ProductStatusResponse])
-async def get_product_status():
-    return [{"product_id": p["product_id"], "name": p["name"], "game": p["game"], "status": p["status"], "last_updated": "2025-12-15T08:00:00Z"} for p in PRODUCTS]
+async def get_product_status(request: Request):
+    return rendered_response(request, status_feed.rendered)
+
+@api_router.get("/product-status/stream")
+async def stream_product_status(request: Request, last_event_id: Optional[int] = None):
+    """SSE feed: a snapshot (or the deltas missed since Last-Event-ID), then one event per change."""
+    header_id = request.headers.get("last-event-id")
+    if header_id and header_id.isdigit():
+        last_event_id = int(header_id)
+    return StreamingResponse(
+        status_feed.events(last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_router.put("/product-status/{product_id}", response_model=ProductStatusResponse)
+async def update_product_status(product_id: str, data: ProductStatusUpdate, admin=Depends(require_admin)):
+    if product_id not in status_feed.statuses:
+        raise HTTPException(status_code=404, detail="Product not found")
+    if data.status not in STATUSES:
+        raise HTTPException(status_code=400, detail="Invalid status")
+    record = await status_feed.set_status(product_id, data.status)
+    # Keep the catalog's own status badge in step with the feed
+    await catalog_store.update_product(product_id, {"status": data.status, "status_label": data.status.title()})
+    return record
+
+@api_router.put("/admin/catalog/products/{product_id}", response_model=ProductResponse)
+async def put_catalog_product(product_id: str, data: ProductResponse, admin=Depends(require_admin)):
+    if data.product_id != product_id:
+        raise HTTPException(status_code=400, detail="product_id mismatch")
+    await catalog_store.put_product(data.model_dump(exclude_none=True))
+    return catalog_store.current.by_id[product_id]
 
 @api_router.get("/reviews", response_model=List[ReviewResponse])
-async def get_reviews():
-    return REVIEWS
+async def get_reviews(request: Request):
+    return rendered_response(request, catalog_store.current.reviews)
+
+REVIEW_PROJECTION = {"_id": 0, **{f: 1 for f in ReviewResponse.model_fields}}
+
+@api_router.get("/products/{product_id}/reviews", response_model=List[ReviewResponse])
+async def get_product_reviews(product_id: str, response: Response, limit: int = Query(20, ge=1, le=100),
+                              cursor: Optional[str] = None):
+    if product_id not in catalog_store.current.by_id:
+        raise HTTPException(status_code=404, detail="Product not found")
+    page, next_cursor = await review_store.page(db, product_id, REVIEW_PROJECTION, limit, cursor)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return page
+
+@api_router.post("/products/{product_id}/reviews", response_model=ReviewResponse)
+async def create_product_review(product_id: str, data: ReviewCreate, user=Depends(get_current_user)):
+    product = catalog_store.current.by_id.get(product_id)
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    try:
+        review = await review_store.add_review(db, product, user, data.rating, data.text.strip())
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="You have already reviewed this product")
+    # Refresh the featured reviews and review total everywhere; product bodies stay as they are
+    await catalog_store.bump_reviews()
+    return review
+
+@api_router.get("/products/{product_id}/rating")
+async def get_product_rating(product_id: str):
+    """Count, average and 1-5 histogram, read from the incrementally maintained aggregate."""
+    if product_id not in catalog_store.current.by_id:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return await review_store.rating(db, product_id)
 
 @api_router.get("/games")
-async def get_games():
-    games = list(set(p["game"] for p in PRODUCTS))
-    games.sort()
-    game_data = []
-    for g in games:
-        products = [{"product_id": p["product_id"], "name": p["name"], "tier": p["tier"], "price": p["price"], "status": p["status"]} for p in PRODUCTS if p["game"] == g]
-        game_data.append({"name": g, "products": products})
-    return game_data
+async def get_games(request: Request):
+    return rendered_response(request, catalog_store.current.games)
 
 # ======================== STRIPE CHECKOUT ========================
 
-# Backend defines all packages - never accept amounts from frontend
-PRODUCT_PACKAGES = {p["product_id"]: {"name": p["name"], "game": p["game"], "price": p["price"], "pricing_tiers": p.get("pricing_tiers")} for p in PRODUCTS}
-
 @api_router.post("/checkout/create")
 async def create_checkout(request: Request, user=Depends(get_current_user)):
     body = await request.json()
@@ -381,33 +620,18 @@ async def create_checkout(request: Request, user=Depends(get_current_user)):
     origin_url = body.get("origin_url")
     duration = body.get("duration", "1month")
     
-    if not product_id or product_id not in PRODUCT_PACKAGES:
+    # Backend defines all packages - never accept amounts from frontend.
+    # One snapshot for the whole request so a concurrent reload can't mix prices.
+    catalog = catalog_store.current
+    if not product_id or product_id not in catalog.by_id:
         raise HTTPException(status_code=400, detail="Invalid product")
     if not origin_url:
         raise HTTPException(status_code=400, detail="Missing origin URL")
     
-    pkg = PRODUCT_PACKAGES[product_id]
-    
-    # Use pricing_tiers if available, else fall back to base price calculations
-    pricing_tiers = pkg.get("pricing_tiers")
-    if pricing_tiers:
-        tier = next((t for t in pricing_tiers if t["key"] == duration), None)
-        if tier:
-            price = float(tier["price"])
-            days = tier["days"]
-        else:
-            price = float(pkg["price"])
-            days = 30
-    else:
-        price = float(pkg["price"])
-        if duration == "1day" or duration == "daily":
-            price = round(price / 4, 2)
-            days = 1
-        elif duration == "1week" or duration == "weekly":
-            price = round(price / 2, 2)
-            days = 7
-        else:
-            days = 30
+    pkg = catalog.by_id[product_id]
+    quote = catalog.prices.quote(product_id, duration)
+    if quote is None:
+        raise HTTPException(status_code=400, detail="Invalid duration")
     
     success_url = f"{origin_url}/checkout/success?session_id={{CHECKOUT_SESSION_ID}}"
     cancel_url = f"{origin_url}/product/{product_id}"
@@ -415,18 +639,18 @@ async def create_checkout(request: Request, user=Depends(get_current_user)):
     metadata = {
         "product_id": product_id,
         "user_id": user["user_id"],
-        "duration": duration,
+        "duration": quote.duration,
         "product_name": pkg["name"],
         "game": pkg["game"]
     }
     
     host_url = str(request.base_url)
     webhook_url = f"{host_url}api/webhook/stripe"
-    stripe_checkout = StripeCheckout(api_key=stripe_api_key, webhook_url=webhook_url)
+    stripe_checkout = outbound.stripe_checkout(webhook_url)
     
     checkout_req = CheckoutSessionRequest(
-        amount=price,
-        currency="usd",
+        amount=quote.amount,
+        currency=quote.currency,
         success_url=success_url,
         cancel_url=cancel_url,
         metadata=metadata
@@ -442,107 +666,278 @@ async def create_checkout(request: Request, user=Depends(get_current_user)):
         "product_name": pkg["name"],
         "game": pkg["game"],
         "user_id": user["user_id"],
-        "amount": price,
-        "currency": "usd",
-        "duration": duration,
-        "payment_status": "pending",
+        "amount": quote.amount,
+        "amount_cents": quote.amount_cents,
+        "currency": quote.currency,
+        "duration": quote.duration,
+        "days": quote.days,
+        "payment_status": PENDING,
         "status": "initiated",
         "created_at": datetime.now(timezone.utc).isoformat()
     })
     
     return {"url": session.url, "session_id": session.session_id}
 
-@api_router.get("/checkout/status/{session_id}")
-async def checkout_status(session_id: str, request: Request, user=Depends(get_current_user)):
-    host_url = str(request.base_url)
-    webhook_url = f"{host_url}api/webhook/stripe"
-    stripe_checkout = StripeCheckout(api_key=stripe_api_key, webhook_url=webhook_url)
-    
-    checkout_stat = await stripe_checkout.get_checkout_status(session_id)
-    
-    # Update transaction
-    txn = await db.payment_transactions.find_one({"session_id": session_id}, {"_id": 0})
-    if txn and txn.get("payment_status") != "paid":
-        new_status = checkout_stat.payment_status
-        update_data = {"payment_status": new_status, "status": checkout_stat.status}
-        
-        if new_status == "paid":
-            # Generate license key
-            license_key = f"CC-{uuid.uuid4().hex[:4].upper()}-{uuid.uuid4().hex[:4].upper()}-{uuid.uuid4().hex[:4].upper()}-{uuid.uuid4().hex[:4].upper()}"
-            duration = txn.get("duration", "1month")
-            days = {"1day": 1, "daily": 1, "3day": 3, "1week": 7, "weekly": 7, "1month": 30, "monthly": 30}.get(duration, 30)
-            expires = (datetime.now(timezone.utc) + timedelta(days=days)).isoformat()
-            
-            await db.licenses.insert_one({
-                "license_id": f"lic_{uuid.uuid4().hex[:12]}",
-                "product_id": txn["product_id"],
-                "product_name": txn["product_name"],
-                "game": txn.get("game", ""),
-                "user_id": txn["user_id"],
-                "license_key": license_key,
-                "status": "active",
-                "duration": duration,
-                "purchased_at": datetime.now(timezone.utc).isoformat(),
-                "expires_at": expires
-            })
-        
-        await db.payment_transactions.update_one(
-            {"session_id": session_id},
-            {"$set": update_data}
-        )
-    
+# How often a poll may fall back to asking the provider, per session, when no webhook arrived
+PROVIDER_RECONCILE_INTERVAL = float(os.environ.get('PROVIDER_RECONCILE_INTERVAL', '15'))
+
+async def mark_paid(session_id: str, status: str = "complete", missing: Optional[bool] = None) -> Optional[Dict]:
+    """Mark a session paid, restoring it first if it was archived as abandoned.
+
+    ``missing`` says whether the caller already knows the live row is gone;
+    when None it is looked up, and only if the payment did not apply.
+    """
+    txn = await fulfillment.pay(session_id, status)
+    if txn is not None:
+        return txn
+    # Usually the row is already paid (a webhook and a poll both got here)
+    if missing is None:
+        missing = await db.payment_transactions.count_documents({"session_id": session_id}, limit=1) == 0
+    if missing and await transaction_archiver.restore(session_id):
+        # Paid after the abandoned checkout was archived
+        txn = await fulfillment.pay(session_id, status)
+    return txn
+
+async def reconcile_with_provider(request: Request, txn: Dict) -> Dict:
+    """Ask the provider directly; callers hold the per-interval claim from read_and_claim_check."""
+    session_id = txn["session_id"]
+    webhook_url = f"{str(request.base_url)}api/webhook/stripe"
+    checkout_stat = await outbound.stripe_checkout(webhook_url).get_checkout_status(session_id)
+    if checkout_stat.payment_status == PAID:
+        updated = await mark_paid(session_id, checkout_stat.status)
+    else:
+        updated = await transition(db.payment_transactions, session_id, checkout_stat.payment_status,
+                                   {"status": checkout_stat.status})
+    return updated or txn
+
+def checkout_status_body(txn: Dict) -> Dict:
     return {
-        "status": checkout_stat.status,
-        "payment_status": checkout_stat.payment_status,
-        "amount_total": checkout_stat.amount_total,
-        "currency": checkout_stat.currency,
-        "metadata": checkout_stat.metadata
+        "status": txn.get("status"),
+        "payment_status": txn.get("payment_status"),
+        "amount_total": txn.get("amount_cents", int(round(txn["amount"] * 100))),
+        "currency": txn.get("currency", "usd"),
+        "metadata": {
+            "product_id": txn["product_id"],
+            "user_id": txn["user_id"],
+            "duration": txn.get("duration"),
+            "product_name": txn["product_name"],
+            "game": txn.get("game", "")
+        },
+        "fulfilled": bool(txn.get("license_id"))
     }
 
+@api_router.get("/checkout/status/{session_id}")
+async def checkout_status(session_id: str, request: Request, wait: float = Query(0, ge=0, le=25),
+                          user=Depends(get_current_user)):
+    """Local read of the transaction; pass ``wait`` to long-poll until the license is issued."""
+    # One round trip: the read also claims the provider check when one is due
+    txn, claimed = await read_and_claim_check(db.payment_transactions, session_id, PROVIDER_RECONCILE_INTERVAL)
+    if not txn:
+        raise HTTPException(status_code=404, detail="Transaction not found")
+
+    if claimed:
+        txn = await reconcile_with_provider(request, txn)
+    if not txn.get("license_id") and wait:
+        # Wakes early when this worker fulfills; otherwise re-reads after the timeout
+        await fulfillment.wait(session_id, wait)
+        # Archived or deleted meanwhile: answer with what was already read
+        txn = await db.payment_transactions.find_one({"session_id": session_id}, {"_id": 0}) or txn
+
+    return checkout_status_body(txn)
+
+async def apply_webhook_events(events: List[Dict]):
+    """Inbox consumer: marks every paid session in the batch.
+
+    With transaction support each session goes through ``fulfillment.pay``, so
+    the paid transition and the license commit together; otherwise one bulk
+    write marks them all and the worker issues the licenses afterwards.
+    """
+    paid = {e["session_id"]: e.get("status") or "complete" for e in events
+            if e.get("payment_status") == PAID and e.get("session_id")}
+    if not paid:
+        return
+    known = set(await db.payment_transactions.distinct("session_id", {"session_id": {"$in": list(paid)}}))
+    if fulfillment.transactional:
+        for sid, status in paid.items():
+            await mark_paid(sid, status, missing=sid not in known)
+        return
+    paid_at = datetime.now(timezone.utc).isoformat()
+    await db.payment_transactions.bulk_write([
+        UpdateOne({"session_id": sid, "payment_status": {"$in": list(TRANSITIONS[PAID])}},
+                  {"$set": {"payment_status": PAID, "status": status, "paid_at": paid_at}})
+        for sid, status in paid.items()
+    ], ordered=False)
+    for sid, status in paid.items():
+        if sid in known:
+            fulfillment.enqueue(sid)
+        else:
+            # Archived as abandoned before the payment landed
+            await mark_paid(sid, status, missing=True)
+
+webhook_inbox = WebhookInbox(
+    db, apply_webhook_events,
+    batch_size=int(os.environ.get('WEBHOOK_INBOX_BATCH', '200')),
+    poll_interval=float(os.environ.get('WEBHOOK_INBOX_POLL_INTERVAL', '5')),
+    max_attempts=int(os.environ.get('WEBHOOK_INBOX_MAX_ATTEMPTS', '5')),
+)
+
 @api_router.post("/webhook/stripe")
 async def stripe_webhook(request: Request):
+    """Verify, store in the inbox and ack; the inbox consumer applies the event."""
     body = await request.body()
     signature = request.headers.get("Stripe-Signature")
     host_url = str(request.base_url)
     webhook_url = f"{host_url}api/webhook/stripe"
-    stripe_checkout = StripeCheckout(api_key=stripe_api_key, webhook_url=webhook_url)
+    stripe_checkout = outbound.stripe_checkout(webhook_url)
     
     try:
         webhook_response = await stripe_checkout.handle_webhook(body, signature)
-        if webhook_response.payment_status == "paid":
-            txn = await db.payment_transactions.find_one({"session_id": webhook_response.session_id}, {"_id": 0})
-            if txn and txn.get("payment_status") != "paid":
-                await db.payment_transactions.update_one(
-                    {"session_id": webhook_response.session_id},
-                    {"$set": {"payment_status": "paid", "status": "complete"}}
-                )
-        return {"status": "ok"}
     except Exception as e:
         logger.error(f"Webhook error: {e}")
         return {"status": "error"}
+    session_id = webhook_response.session_id
+    event_id = webhook_response.event_id or f"{session_id}:{webhook_response.payment_status}"
+    await webhook_inbox.record(event_id, {
+        "event_type": webhook_response.event_type,
+        "session_id": session_id,
+        "payment_status": webhook_response.payment_status,
+    })
+    return {"status": "ok"}
 
 # ======================== USER DASHBOARD ========================
 
+LICENSE_KEYSET = Keyset("purchased_at", "license_id")
+TRANSACTION_KEYSET = Keyset("created_at", "transaction_id")
+
+# Only the fields the dashboard renders leave the database
+LICENSE_PROJECTION = {"_id": 0, **{f: 1 for f in LicenseResponse.model_fields}}
+TRANSACTION_PROJECTION = {"_id": 0, "payment_status": 1, **{f: 1 for f in TransactionResponse.model_fields}}
+
+async def stream_ndjson(cursor):
+    async for doc in cursor:
+        yield orjson.dumps(doc) + b"\n"
+
+async def paginated_dashboard(collection, keyset: Keyset, projection: Dict, user_id: str,
+                              response: Response, limit: int, cursor: Optional[str], format: str):
+    query = keyset.query({"user_id": user_id}, cursor)
+    if format == "ndjson":
+        # Exports stream the whole remaining history in driver-sized batches
+        rows = collection.find(query, projection).sort(keyset.sort).batch_size(500)
+        return StreamingResponse(stream_ndjson(rows), media_type="application/x-ndjson")
+    rows = await collection.find(query, projection).sort(keyset.sort).limit(limit + 1).to_list(limit + 1)
+    page, next_cursor = keyset.split_page(rows, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return page
+
 @api_router.get("/licenses")
-async def get_licenses(user=Depends(get_current_user)):
-    licenses = await db.licenses.find({"user_id": user["user_id"]}, {"_id": 0}).to_list(100)
-    return licenses
+async def get_licenses(response: Response, limit: int = Query(100, ge=1, le=500), cursor: Optional[str] = None,
+                       format: str = Query("json", pattern="^(json|ndjson)$"), user=Depends(get_current_user)):
+    return await paginated_dashboard(db.licenses, LICENSE_KEYSET, LICENSE_PROJECTION, user["user_id"],
+                                     response, limit, cursor, format)
 
 @api_router.get("/transactions")
-async def get_transactions(user=Depends(get_current_user)):
-    txns = await db.payment_transactions.find({"user_id": user["user_id"]}, {"_id": 0}).to_list(100)
-    return txns
+async def get_transactions(response: Response, limit: int = Query(100, ge=1, le=500), cursor: Optional[str] = None,
+                           format: str = Query("json", pattern="^(json|ndjson)$"), user=Depends(get_current_user)):
+    return await paginated_dashboard(db.payment_transactions, TRANSACTION_KEYSET, TRANSACTION_PROJECTION, user["user_id"],
+                                     response, limit, cursor, format)
+
+# ======================== LICENSE VALIDATION ========================
+
+@api_router.post("/licenses/validate")
+async def validate_license(data: LicenseValidateRequest):
+    """Check a key against the in-memory license index; no database round trip."""
+    entry = license_index.lookup(data.license_key)
+    if entry is None:
+        return {"valid": False, "reason": "unknown"}
+    product_id, expires_at, status = entry
+    if data.product_id and data.product_id != product_id:
+        return {"valid": False, "reason": "wrong_product"}
+    expires_iso = datetime.fromtimestamp(expires_at, timezone.utc).isoformat()
+    if status != "active":
+        return {"valid": False, "reason": status, "product_id": product_id, "expires_at": expires_iso}
+    if expires_at <= datetime.now(timezone.utc).timestamp():
+        return {"valid": False, "reason": "expired", "product_id": product_id, "expires_at": expires_iso}
+    return {"valid": True, "product_id": product_id, "expires_at": expires_iso}
+
+# ======================== LICENSE ISSUANCE ========================
+
+async def stream_issued(batch):
+    async for chunk in batch:
+        yield b"".join(orjson.dumps(doc) + b"\n" for doc in chunk)
+
+@api_router.post("/admin/licenses/bulk")
+async def issue_licenses_bulk(data: BulkLicenseRequest, admin=Depends(require_admin)):
+    """Issue up to 100k licenses for a reseller batch or promotion, streamed back as NDJSON."""
+    product = catalog_store.current.by_id.get(data.product_id)
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    quote = catalog_store.current.prices.quote(data.product_id, data.duration)
+    if quote is None:
+        raise HTTPException(status_code=400, detail="Unknown duration")
+    batch = license_issuer.issue(product, data.count, quote, data.user_id, data.issued_to)
+    return StreamingResponse(stream_issued(batch), media_type="application/x-ndjson")
+
+@api_router.get("/admin/sales")
+async def sales_report(granularity: str = Query("day", pattern="^(hour|day)$"),
+                       start: Optional[str] = None, end: Optional[str] = None,
+                       group_by: str = Query("product_id", pattern="^(product_id|game|duration)$"),
+                       admin=Depends(require_admin)):
+    """Sales, revenue and active licenses from the rollups only; ``start``/``end`` are inclusive bucket
+    prefixes (``2024-05-01`` by day, ``2024-05-01T13`` by hour)."""
+    return await sales_rollups.report(granularity, start, end, group_by)
 
 # ======================== STATS ========================
 
 @api_router.get("/stats")
-async def get_stats():
-    return {
-        "total_products": len(PRODUCTS),
-        "total_games": len(set(p["game"] for p in PRODUCTS)),
-        "undetected_count": len([p for p in PRODUCTS if p["status"] == "undetected"]),
-        "total_reviews": len(REVIEWS)
-    }
+async def get_stats(request: Request):
+    return rendered_response(request, catalog_store.current.stats)
+
+# ======================== INTERNAL ========================
+
+@api_router.get("/internal/stats")
+async def get_internal_stats(admin=Depends(require_admin)):
+    return {"password_hasher": password_hasher.stats(), "principal_cache": principal_cache.stats(),
+            "fulfillment": fulfillment.stats(), "status_feed": status_feed.stats(),
+            "catalog": catalog_store.stats(), "search": catalog_store.current.search.stats(),
+            "rate_limiter": rate_limiter.stats(), "mongo_pool": mongo_pool.stats(),
+            "transaction_archiver": transaction_archiver.stats(),
+            "webhook_inbox": webhook_inbox.stats(),
+            "license_issuer": license_issuer.stats(),
+            "license_index": license_index.stats(),
+            "sales_rollups": sales_rollups.stats()}
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the event loop is serving; never touches Mongo."""
+    return {"status": "ok", "uptime_s": round(time.time() - readiness.started_at, 1),
+            "warm_up_s": readiness.warm_up_seconds, "mongo_pool": mongo_pool.stats()}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: startup (pool warm-up, indexes, caches) is done and Mongo answers a ping."""
+    result = await readiness.check()
+    body = {**result, "mongo_pool": mongo_pool.stats()}
+    return ORJSONResponse(body, status_code=200 if result["ready"] else 503)
+
+# Prometheus scrapes /metrics with "Authorization: Bearer <METRICS_TOKEN>"; unset disables the endpoint
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+async def require_metrics_token(request: Request):
+    supplied = request.headers.get("authorization", "").encode()
+    if not METRICS_TOKEN or not secrets.compare_digest(supplied, f"Bearer {METRICS_TOKEN}".encode()):
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+
+@app.get("/metrics")
+async def get_metrics(scraper=Depends(require_metrics_token)):
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
+for name, component in (("mongo_pool", mongo_pool), ("password_hasher", password_hasher), ("principal_cache", principal_cache),
+                        ("fulfillment", fulfillment), ("status_feed", status_feed), ("catalog", catalog_store),
+                        ("rate_limiter", rate_limiter), ("transaction_archiver", transaction_archiver),
+                        ("webhook_inbox", webhook_inbox), ("license_issuer", license_issuer),
+                        ("license_index", license_index), ("sales_rollups", sales_rollups)):
+    metrics.add_collector(name, component.stats)
 
 # Include router and middleware
 app.include_router(api_router)
@@ -553,8 +948,55 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
+app.add_middleware(compression.CompressionMiddleware)
+app.add_middleware(MetricsMiddleware, metrics=metrics, routes=app.router.routes)
+
+@app.on_event("startup")
+async def startup_workers():
+    password_hasher.start()
+    await outbound.start()
+
+@app.on_event("startup")
+async def startup_db():
+    readiness.warm_up_seconds = round(await warm_up(client, mongo_options["minPoolSize"]), 3)
+    await ensure_indexes(db)
+    converted = await migrate_session_expiry(db)
+    if converted:
+        logger.info(f"Converted expires_at to a date on {converted} sessions")
+    await fulfillment.start()
+    await transaction_archiver.start()
+    await sales_rollups.start()
+    await webhook_inbox.start()
+    await license_index.start()
+    await catalog_store.start()
+    # Reviews stored before product_id existed, and their first aggregates
+    backfilled = await review_store.backfill_product_ids(db, catalog_store.current.product_list)
+    if backfilled or (not await db.review_stats.find_one({}) and await db.reviews.find_one({"product_id": {"$exists": True}})):
+        await review_store.rebuild_stats(db)
+        await catalog_store.bump_reviews()
+    await status_feed.start()
+    if os.environ.get('VERIFY_QUERY_PLANS') == '1':
+        offenders = await verify_plans(db)
+        if offenders:
+            raise RuntimeError(f"Hot queries without an index: {offenders}")
+    readiness.ready = True
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    readiness.ready = False
+    await webhook_inbox.stop()
+    await license_index.stop()
+    await fulfillment.stop()
+    await transaction_archiver.stop()
+    await sales_rollups.stop()
+    await status_feed.stop()
+    await catalog_store.stop()
     client.close()
+    password_hasher.shutdown()
+    await outbound.close()
+    if isinstance(principal_cache.shared, RedisSharedTier):
+        await principal_cache.shared.close()
+    if isinstance(rate_limiter.backend, RedisLimiterBackend):
+        await rate_limiter.backend.close()
@@ -0,0 +1,193 @@
+"""Versioned product status store with a Server-Sent Events fan-out.
+
+Every status change gets a global version from a Mongo counter and is
+persisted in ``product_status``. Each worker polls that (tiny) collection
+once per interval, applies anything newer than what it has, and pushes the
+deltas to its connected SSE clients through one in-process broadcaster, so
+an idle viewer costs a parked coroutine rather than a request per poll.
+
+Subscribers get a bounded queue; one that falls behind is marked lagged and
+receives a fresh snapshot instead of the backlog. A bounded history of
+recent deltas lets reconnecting clients resume from ``Last-Event-ID``.
+"""
+import asyncio
+import json
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from pymongo import ReturnDocument
+
+from catalog import render_json
+
+logger = logging.getLogger(__name__)
+
+STATUSES = ("undetected", "testing", "updating", "detected")
+PUBLIC_FIELDS = ("product_id", "name", "game", "status", "last_updated")
+
+
+def public_record(record: Dict) -> Dict:
+    return {f: record[f] for f in PUBLIC_FIELDS}
+
+
+def sse_event(event: str, data, event_id: Optional[int] = None) -> str:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+class Subscriber:
+    def __init__(self, maxsize: int):
+        self.queue: "asyncio.Queue" = asyncio.Queue(maxsize)
+        self.lagged = False
+
+
+class StatusFeed:
+    def __init__(self, db, products: List[Dict], default_updated: str, poll_interval: float = 1.0,
+                 history: int = 1024, queue_size: int = 64, keepalive: float = 15.0):
+        self.db = db
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self.keepalive = keepalive
+        self.statuses: Dict[str, Dict] = {
+            p["product_id"]: {"product_id": p["product_id"], "name": p["name"], "game": p["game"],
+                              "status": p["status"], "last_updated": default_updated, "version": 0}
+            for p in products
+        }
+        self.version = 0
+        self.history: deque = deque(maxlen=history)
+        self.subscribers = set()
+        self.rendered = render_json(self.snapshot())
+        self.dropped_backlogs = 0
+        self._poller: Optional[asyncio.Task] = None
+
+    def sync_products(self, products: List[Dict]):
+        """Track catalog additions, removals and renames; status itself stays owned by the feed."""
+        statuses = {}
+        for p in products:
+            current = self.statuses.get(p["product_id"])
+            if current is None:
+                current = {"product_id": p["product_id"], "status": p["status"], "version": 0,
+                           "last_updated": datetime.now(timezone.utc).isoformat()}
+            statuses[p["product_id"]] = {**current, "name": p["name"], "game": p["game"]}
+        if statuses != self.statuses:
+            self.statuses = statuses
+            self.rendered = render_json(self.snapshot())
+            for sub in self.subscribers:
+                self._resync(sub)
+
+    def snapshot(self) -> List[Dict]:
+        return [public_record(r) for r in self.statuses.values()]
+
+    async def start(self):
+        await self.refresh()
+        self._poller = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        if self._poller is not None:
+            self._poller.cancel()
+            await asyncio.gather(self._poller, return_exceptions=True)
+            self._poller = None
+
+    async def refresh(self):
+        docs = await self.db.product_status.find({}, {"_id": 0}).to_list(None)
+        self._apply(docs)
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Product status refresh failed")
+
+    async def set_status(self, product_id: str, status: str) -> Dict:
+        counter = await self.db.counters.find_one_and_update(
+            {"_id": "product_status"}, {"$inc": {"seq": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        record = {**self.statuses[product_id], "status": status, "version": counter["seq"],
+                  "last_updated": datetime.now(timezone.utc).isoformat()}
+        await self.db.product_status.update_one({"product_id": product_id}, {"$set": record}, upsert=True)
+        self._apply([record])
+        return public_record(record)
+
+    def _apply(self, records: List[Dict]):
+        changed = False
+        for record in sorted(records, key=lambda r: r["version"]):
+            current = self.statuses.get(record["product_id"])
+            if current is None or current["version"] >= record["version"]:
+                continue
+            merged = {**current, "status": record["status"], "last_updated": record["last_updated"],
+                      "version": record["version"]}
+            self.statuses[record["product_id"]] = merged
+            self.version = max(self.version, merged["version"])
+            self.history.append((merged["version"], public_record(merged)))
+            self._broadcast(merged["version"], public_record(merged))
+            changed = True
+        if changed:
+            self.rendered = render_json(self.snapshot())
+
+    def _broadcast(self, version: int, record: Dict):
+        for sub in self.subscribers:
+            if sub.lagged:
+                continue
+            try:
+                sub.queue.put_nowait((version, record))
+            except asyncio.QueueFull:
+                # Slow consumer: drop its backlog, it gets a snapshot instead
+                self._resync(sub)
+                self.dropped_backlogs += 1
+
+    def _resync(self, sub: Subscriber):
+        sub.lagged = True
+        try:
+            # Wake a consumer parked on an empty queue
+            sub.queue.put_nowait(None)
+        except asyncio.QueueFull:
+            pass
+
+    def since(self, last_id: int) -> Optional[List]:
+        """Deltas after ``last_id``, or None if the history no longer reaches back that far."""
+        if last_id > self.version:
+            return None
+        if last_id == self.version:
+            return []
+        if not self.history or self.history[0][0] > last_id + 1:
+            return None
+        return [(v, r) for v, r in self.history if v > last_id]
+
+    async def events(self, last_event_id: Optional[int] = None):
+        sub = Subscriber(self.queue_size)
+        self.subscribers.add(sub)
+        try:
+            missed = self.since(last_event_id) if last_event_id is not None else None
+            if missed is None:
+                yield sse_event("snapshot", self.snapshot(), self.version)
+            else:
+                for version, record in missed:
+                    yield sse_event("status", record, version)
+            while True:
+                if sub.lagged:
+                    while not sub.queue.empty():
+                        sub.queue.get_nowait()
+                    sub.lagged = False
+                    yield sse_event("snapshot", self.snapshot(), self.version)
+                try:
+                    item = await asyncio.wait_for(sub.queue.get(), self.keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if item is None or sub.lagged:
+                    continue
+                version, record = item
+                yield sse_event("status", record, version)
+        finally:
+            self.subscribers.discard(sub)
+
+    def stats(self) -> Dict:
+        return {
+            "version": self.version,
+            "subscribers": len(self.subscribers),
+            "lagged_subscribers": sum(1 for s in self.subscribers if s.lagged),
+            "dropped_backlogs": self.dropped_backlogs,
+        }
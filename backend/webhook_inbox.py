@@ -0,0 +1,161 @@
+"""Durable inbox for payment provider webhooks.
+
+The webhook endpoint only verifies the signature and inserts the event
+under its provider event id (``_id``), then acks: a redelivered event is a
+single DuplicateKeyError and never reaches the payment logic twice. A
+consumer task drains unprocessed events in batches and hands each batch to
+``handler``; events are leased before handling so several workers can
+drain the same inbox without double-processing a batch, and an event whose
+lease expires (its worker died) is picked up again. Processed events are
+kept for ``retention`` seconds so late provider retries are still deduped.
+
+Every lease counts an attempt. If a batch fails, its events are retried
+one by one, so one bad event cannot hold back the rest. Events that fail
+stay leased until the lease runs out. An event leased more than
+``max_attempts`` times is copied to ``webhook_dead_letter`` with its last
+error, and marked processed in the inbox so redeliveries are still deduped.
+"""
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookInbox:
+    def __init__(self, db, handler: Callable[[List[Dict]], Awaitable[None]], batch_size: int = 200,
+                 poll_interval: float = 5.0, lease: float = 60.0, retention: float = 7 * 86400,
+                 max_attempts: int = 5):
+        self.db = db
+        self.handler = handler
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.retention = retention
+        self.max_attempts = max_attempts
+        self.owner = uuid.uuid4().hex
+        self.received = 0
+        self.duplicates = 0
+        self.processed = 0
+        self.batches = 0
+        self.failures = 0
+        self.dead_lettered = 0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def record(self, event_id: str, event: Dict) -> bool:
+        """Store an event unless already seen; returns False for a duplicate delivery."""
+        try:
+            await self.db.webhook_inbox.insert_one({
+                "_id": event_id, **event, "processed": False, "received_at": datetime.now(timezone.utc),
+            })
+        except DuplicateKeyError:
+            self.duplicates += 1
+            return False
+        self.received += 1
+        self._wakeup.set()
+        return True
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                while await self.drain_batch() == self.batch_size:
+                    pass
+            except Exception:
+                self.failures += 1
+                logger.exception("Webhook inbox batch failed")
+
+    async def drain_batch(self) -> int:
+        """Lease, handle and mark one batch of events; returns how many were handled."""
+        now = datetime.now(timezone.utc)
+        available = {"processed": False,
+                     "$or": [{"lease_until": {"$lt": now}}, {"lease_until": {"$exists": False}}]}
+        candidates = await self.db.webhook_inbox.find(available, {"_id": 1}).sort("received_at", 1) \
+            .limit(self.batch_size).to_list(self.batch_size)
+        if not candidates:
+            return 0
+        ids = [c["_id"] for c in candidates]
+        await self.db.webhook_inbox.update_many(
+            {"_id": {"$in": ids}, **available},
+            {"$set": {"lease_owner": self.owner, "lease_until": now + timedelta(seconds=self.lease)},
+             "$inc": {"attempts": 1}}
+        )
+        events = await self.db.webhook_inbox.find({"_id": {"$in": ids}, "lease_owner": self.owner,
+                                                   "processed": False}).to_list(len(ids))
+        if not events:
+            return 0
+        exhausted = [e for e in events if e.get("attempts", 0) > self.max_attempts]
+        if exhausted:
+            await self._dead_letter(exhausted)
+        handled, errors = await self._handle([e for e in events if e.get("attempts", 0) <= self.max_attempts])
+        for event_id, error in errors.items():
+            await self.db.webhook_inbox.update_one({"_id": event_id}, {"$set": {"last_error": error}})
+        if handled:
+            await self._mark_processed([e["_id"] for e in handled], {})
+        self.processed += len(handled)
+        self.batches += 1
+        return len(candidates)
+
+    async def _handle(self, events: List[Dict]):
+        """Run the handler on the batch, or event by event if the batch fails; returns (handled, errors by id)."""
+        if not events:
+            return [], {}
+        try:
+            await self.handler(events)
+            return events, {}
+        except Exception as e:
+            if len(events) == 1:
+                self.failures += 1
+                logger.exception(f"Webhook event {events[0]['_id']} failed")
+                return [], {events[0]["_id"]: repr(e)}
+        handled, errors = [], {}
+        for event in events:
+            try:
+                await self.handler([event])
+                handled.append(event)
+            except Exception as e:
+                self.failures += 1
+                logger.exception(f"Webhook event {event['_id']} failed")
+                errors[event["_id"]] = repr(e)
+        return handled, errors
+
+    async def _dead_letter(self, events: List[Dict]):
+        now = datetime.now(timezone.utc)
+        for event in events:
+            logger.error(f"Webhook event {event['_id']} failed {event['attempts'] - 1} times; dead-lettered")
+            await self.db.webhook_dead_letter.replace_one({"_id": event["_id"]}, {**event, "dead_at": now},
+                                                          upsert=True)
+        await self._mark_processed([e["_id"] for e in events], {"dead_lettered": True})
+        self.dead_lettered += len(events)
+
+    async def _mark_processed(self, ids: List, fields: Dict):
+        done = datetime.now(timezone.utc)
+        await self.db.webhook_inbox.update_many(
+            {"_id": {"$in": ids}},
+            {"$set": {"processed": True, "processed_at": done, "expire_at": done + timedelta(seconds=self.retention),
+                      **fields},
+             "$unset": {"lease_owner": "", "lease_until": ""}}
+        )
+
+    def stats(self) -> Dict:
+        return {"received": self.received, "duplicates": self.duplicates, "processed": self.processed,
+                "batches": self.batches, "failures": self.failures, "dead_lettered": self.dead_lettered}
@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of latencies"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(samples: List[float], elapsed: float) -> Dict:
+    """Summarize latencies (seconds) as milliseconds plus throughput"""
+    return {
+        "requests": len(samples),
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p95_ms": round(percentile(samples, 95) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2),
+        "max_ms": round(max(samples) * 1000, 2) if samples else 0.0,
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class LocalStack:
+    """Boot the backend plus fake_providers.py locally so runs don't depend on a remote preview
+
+    Needs a local mongod (BENCH_MONGO_URL); each run uses a fresh database that is dropped afterwards.
+    """
+
+    def __init__(self, mongo_url=os.environ.get("BENCH_MONGO_URL", "mongodb://localhost:27017"),
+                 workers: int = 1, provider_latency_ms: float = 0.0):
+        self.backend_dir = Path(__file__).parent / "backend"
+        self.mongo_url = mongo_url
+        self.db_name = f"bench_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        self.workers = workers
+        self.provider_latency_ms = provider_latency_ms
+        self.processes: List[subprocess.Popen] = []
+        self.base_url = ""
+
+    def spawn(self, app: str, port: int, env: Dict, workers: int = 1):
+        cmd = [sys.executable, "-m", "uvicorn", app, "--port", str(port), "--workers", str(workers),
+               "--log-level", "warning"]
+        self.processes.append(subprocess.Popen(cmd, cwd=self.backend_dir, env={**os.environ, **env}))
+
+    async def wait_ready(self, url: str, timeout: float = 30.0):
+        deadline = time.perf_counter() + timeout
+        async with httpx.AsyncClient(timeout=2) as client:
+            while time.perf_counter() < deadline:
+                try:
+                    if (await client.get(url)).status_code < 500:
+                        return
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.2)
+        raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+    async def __aenter__(self):
+        provider_port, backend_port = free_port(), free_port()
+        provider_url = f"http://127.0.0.1:{provider_port}"
+        self.spawn("fake_providers:app", provider_port, {"FAKE_PROVIDER_LATENCY_MS": str(self.provider_latency_ms)})
+        self.spawn("server:app", backend_port, {
+            "MONGO_URL": self.mongo_url,
+            "DB_NAME": self.db_name,
+            "STRIPE_API_KEY": "sk_test_bench",
+            "STRIPE_API_BASE": provider_url,
+            "JWT_SECRET": "bench-secret",
+            # Every virtual user shares one IP here
+            "RATE_LIMIT_LOGIN_IP": "1000000/1",
+            "RATE_LIMIT_LOGIN_EMAIL": "1000000/1",
+            "RATE_LIMIT_REGISTER_IP": "1000000/1",
+        }, self.workers)
+        self.base_url = f"http://127.0.0.1:{backend_port}"
+        try:
+            await self.wait_ready(f"{provider_url}/v1/checkout/sessions/probe")
+            await self.wait_ready(f"{self.base_url}/api/games")
+        except Exception:
+            await self.__aexit__()
+            raise
+        return self
+
+    async def __aexit__(self, *exc):
+        for proc in self.processes:
+            proc.terminate()
+        for proc in self.processes:
+            try:
+                proc.wait(10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        self.processes = []
+        try:
+            from pymongo import MongoClient
+            MongoClient(self.mongo_url).drop_database(self.db_name)
+        except Exception as e:
+            print(f"⚠️ Could not drop {self.db_name}: {e}")
+
+
+# Weighted routes of the mixed scenario, roughly what a storefront sees
+TRAFFIC_MIX = [
+    ("GET /products", 30), ("GET /products/{id}", 15), ("GET /product-status", 10), ("GET /reviews", 5),
+    ("GET /auth/me", 15), ("POST /auth/login", 5), ("GET /licenses", 5), ("GET /transactions", 5),
+    ("POST /checkout/create", 5), ("GET /checkout/status/{id}", 5),
+]
+
+
+def compare_results(current: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """List every p99 in `current` that is more than `threshold` (fractional) slower than `baseline`"""
+    regressions = []
+
+    def walk(cur, base, path):
+        if not isinstance(cur, dict) or not isinstance(base, dict):
+            return
+        if "p99_ms" in cur and "p99_ms" in base:
+            if base["p99_ms"] and cur["p99_ms"] > base["p99_ms"] * (1 + threshold):
+                regressions.append(f"{path}: p99 {base['p99_ms']} -> {cur['p99_ms']} ms")
+            return
+        for key, value in cur.items():
+            walk(value, base.get(key), f"{path}/{key}" if path else key)
+
+    walk(current.get("benchmarks", {}), baseline.get("benchmarks", {}), "")
+    return regressions
+
+
+class CheatcoreAPIBenchmark:
+    def __init__(self, base_url=os.environ.get("BENCH_BASE_URL", "http://localhost:8001")):
+        self.base_url = base_url
+        self.api_url = f"{base_url}/api"
+        self.results = {}
+        # 429s from the login/register limits; kept out of every latency sample
+        self.rate_limited = 0
+
+    async def timed_get(self, client: httpx.AsyncClient, path: str, samples: List[float], **kwargs):
+        """Issue a GET and record its latency"""
+        started = time.perf_counter()
+        resp = await client.get(f"{self.api_url}{path}", **kwargs)
+        samples.append(time.perf_counter() - started)
+        return resp
+
+    async def hammer(self, client: httpx.AsyncClient, path: str, duration: float, concurrency: int) -> Dict:
+        """Run `concurrency` GET loops against `path` for `duration` seconds"""
+        samples: List[float] = []
+        deadline = time.perf_counter() + duration
+
+        async def worker():
+            while time.perf_counter() < deadline:
+                await self.timed_get(client, path, samples)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return summarize(samples, time.perf_counter() - started)
+
+    async def register_user(self, client: httpx.AsyncClient) -> Dict:
+        """Register a throwaway user and return its credentials"""
+        stamp = datetime.now().strftime("%H%M%S%f")
+        creds = {"email": f"bench_{stamp}@example.com", "password": "BenchPass123!", "name": f"Bench {stamp}"}
+        resp = await client.post(f"{self.api_url}/auth/register", json=creds)
+        if resp.status_code == 429:
+            raise RuntimeError("Registering bench users was rate limited: raise RATE_LIMIT_REGISTER_IP "
+                               "on the target, or run with --local")
+        resp.raise_for_status()
+        creds["token"] = resp.json()["token"]
+        return creds
+
+    async def bench_products_under_login_load(self, duration: float = 10.0, login_concurrency: int = 16):
+        """Compare /api/products latency alone and while logins are hammered"""
+        print("\n🔍 Benchmarking /api/products under login load...")
+        async with httpx.AsyncClient(timeout=60) as client:
+            creds = await self.register_user(client)
+            baseline = await self.hammer(client, "/products", duration, concurrency=8)
+
+            login_samples: List[float] = []
+            limited = 0
+            deadline = time.perf_counter() + duration
+
+            async def login_worker():
+                nonlocal limited
+                while time.perf_counter() < deadline:
+                    started = time.perf_counter()
+                    resp = await client.post(f"{self.api_url}/auth/login",
+                                             json={"email": creds["email"], "password": creds["password"]})
+                    if resp.status_code == 429:
+                        limited += 1
+                        continue
+                    login_samples.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            logins = asyncio.gather(*(login_worker() for _ in range(login_concurrency)))
+            under_load = await self.hammer(client, "/products", duration, concurrency=8)
+            await logins
+            login_summary = {**summarize(login_samples, time.perf_counter() - started), "rate_limited": limited}
+        self.rate_limited += limited
+
+        self.results["products_under_login_load"] = {
+            "products_baseline": baseline,
+            "products_during_logins": under_load,
+            "logins": login_summary,
+        }
+        print(f"  baseline p99: {baseline['p99_ms']} ms, during logins p99: {under_load['p99_ms']} ms")
+        print(f"  logins: {login_summary['throughput_rps']} rps, p99 {login_summary['p99_ms']} ms, "
+              f"{limited} rate limited")
+
+    async def bench_catalog_endpoints(self, duration: float = 5.0, concurrency: int = 8):
+        """Throughput of the public catalog routes, plain and revalidated with If-None-Match"""
+        print("\n🔍 Benchmarking catalog endpoints...")
+        paths = ["/products", "/products?game=rust", "/products/rust-disconnect",
+                 "/product-status", "/reviews", "/games", "/stats"]
+        catalog = {}
+        async with httpx.AsyncClient(timeout=60) as client:
+            for path in paths:
+                plain = await self.hammer(client, path, duration, concurrency)
+                etag = (await client.get(f"{self.api_url}{path}")).headers.get("etag")
+                entry = {"plain": plain}
+                if etag:
+                    samples: List[float] = []
+                    deadline = time.perf_counter() + duration
+
+                    async def worker():
+                        while time.perf_counter() < deadline:
+                            await self.timed_get(client, path, samples, headers={"If-None-Match": etag})
+
+                    started = time.perf_counter()
+                    await asyncio.gather(*(worker() for _ in range(concurrency)))
+                    entry["not_modified"] = summarize(samples, time.perf_counter() - started)
+                catalog[path] = entry
+                print(f"  {path}: {plain['throughput_rps']} rps, p99 {plain['p99_ms']} ms")
+        self.results["catalog_endpoints"] = catalog
+
+    async def bench_checkout_create(self, requests: int = 50, concurrency: int = 4):
+        """Latency of checkout creation (run against fake_providers.py for a stable baseline)"""
+        print("\n🔍 Benchmarking checkout creation...")
+        samples: List[float] = []
+        async with httpx.AsyncClient(timeout=60) as client:
+            creds = await self.register_user(client)
+            headers = {"Authorization": f"Bearer {creds['token']}"}
+            body = {"product_id": "rust-disconnect", "origin_url": self.base_url, "duration": "1month"}
+            remaining = iter(range(requests))
+
+            async def worker():
+                for _ in remaining:
+                    started = time.perf_counter()
+                    resp = await client.post(f"{self.api_url}/checkout/create", json=body, headers=headers)
+                    samples.append(time.perf_counter() - started)
+                    resp.raise_for_status()
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            summary = summarize(samples, time.perf_counter() - started)
+        self.results["checkout_create"] = summary
+        print(f"  p50 {summary['p50_ms']} ms, p99 {summary['p99_ms']} ms")
+
+    async def bench_payload_encoding(self, iterations: int = 200):
+        """Bytes on the wire per encoding, and JSON serialization CPU for the same payload"""
+        print("\n🔍 Benchmarking payload size and serialization...")
+        sizes = {}
+        async with httpx.AsyncClient(timeout=60) as client:
+            for path in ["/products", "/products/rust-disconnect", "/games"]:
+                entry = {}
+                for encoding in ["identity", "gzip", "br"]:
+                    resp = await client.get(f"{self.api_url}{path}", headers={"Accept-Encoding": encoding})
+                    entry[encoding] = {
+                        "content_encoding": resp.headers.get("content-encoding", "identity"),
+                        "bytes": len(resp.content) if "content-length" not in resp.headers else int(resp.headers["content-length"]),
+                    }
+                sizes[path] = entry
+                print(f"  {path}: " + ", ".join(f"{k} {v['bytes']}B" for k, v in entry.items()))
+            payload = (await client.get(f"{self.api_url}/products")).json()
+
+        serializers = {"json": lambda p: json.dumps(p, ensure_ascii=False, separators=(",", ":")).encode()}
+        try:
+            import orjson
+            serializers["orjson"] = orjson.dumps
+        except ImportError:
+            pass
+        cpu = {}
+        for name, dumps in serializers.items():
+            started = time.process_time()
+            for _ in range(iterations):
+                dumps(payload)
+            cpu[name] = round((time.process_time() - started) / iterations * 1e6, 1)
+        print("  serialization CPU per /products body: " + ", ".join(f"{k} {v}us" for k, v in cpu.items()))
+        self.results["payload_encoding"] = {"bytes_on_wire": sizes, "serialize_cpu_us": cpu}
+
+    async def bench_mixed_traffic(self, duration: float = 30.0, users: int = 32, seed: int = 1):
+        """Virtual users issuing the TRAFFIC_MIX; throughput and percentiles per route"""
+        print(f"\n🔍 Benchmarking mixed traffic ({users} users, {duration}s)...")
+        rng = random.Random(seed)
+        routes, weights = zip(*TRAFFIC_MIX)
+        samples: Dict[str, List[float]] = {route: [] for route in routes}
+        errors: Dict[str, int] = {route: 0 for route in routes}
+        limited: Dict[str, int] = {route: 0 for route in routes}
+        limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+        async with httpx.AsyncClient(timeout=60, limits=limits) as client:
+            products = (await client.get(f"{self.api_url}/products")).json()
+            product_ids = [p["product_id"] for p in products]
+            accounts = [await self.register_user(client) for _ in range(users)]
+
+            async def call(route: str, creds: Dict, sessions: List[str]):
+                auth = {"Authorization": f"Bearer {creds['token']}"}
+                if route == "GET /products":
+                    return await client.get(f"{self.api_url}/products", params={"view": "summary"})
+                if route == "GET /products/{id}":
+                    return await client.get(f"{self.api_url}/products/{rng.choice(product_ids)}")
+                if route == "POST /auth/login":
+                    return await client.post(f"{self.api_url}/auth/login",
+                                             json={"email": creds["email"], "password": creds["password"]})
+                if route == "POST /checkout/create":
+                    resp = await client.post(f"{self.api_url}/checkout/create", headers=auth, json={
+                        "product_id": rng.choice(product_ids), "origin_url": self.base_url, "duration": "1month"})
+                    if resp.status_code == 200:
+                        sessions.append(resp.json()["session_id"])
+                    return resp
+                if route == "GET /checkout/status/{id}":
+                    if not sessions:
+                        return None
+                    return await client.get(f"{self.api_url}/checkout/status/{rng.choice(sessions)}", headers=auth)
+                _, path = route.split(" ")
+                return await client.get(f"{self.api_url}{path}", headers=auth)
+
+            deadline = time.perf_counter() + duration
+
+            async def user(creds: Dict):
+                sessions: List[str] = []
+                while time.perf_counter() < deadline:
+                    route = rng.choices(routes, weights)[0]
+                    started = time.perf_counter()
+                    resp = await call(route, creds, sessions)
+                    if resp is None:
+                        continue
+                    if resp.status_code == 429:
+                        limited[route] += 1
+                        continue
+                    samples[route].append(time.perf_counter() - started)
+                    if resp.status_code >= 400:
+                        errors[route] += 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(user(creds) for creds in accounts))
+            elapsed = time.perf_counter() - started
+
+        per_route = {route: {**summarize(s, elapsed), "errors": errors[route], "rate_limited": limited[route]}
+                     for route, s in samples.items()}
+        self.rate_limited += sum(limited.values())
+        overall = summarize([x for s in samples.values() for x in s], elapsed)
+        self.results["mixed_traffic"] = {"users": users, "duration_s": duration, "overall": overall,
+                                         "routes": per_route}
+        for route, summary in per_route.items():
+            print(f"  {route}: {summary['throughput_rps']} rps, p50 {summary['p50_ms']} / "
+                  f"p95 {summary['p95_ms']} / p99 {summary['p99_ms']} ms, {summary['errors']} errors, "
+                  f"{summary['rate_limited']} rate limited")
+        print(f"  overall: {overall['throughput_rps']} rps, p99 {overall['p99_ms']} ms")
+
+    SCENARIOS = ("catalog", "encoding", "login_load", "checkout", "mixed")
+
+    async def run_all(self, scenarios=SCENARIOS):
+        print("🚀 Starting Cheatcore API Benchmarks")
+        print(f"Benchmarking backend at: {self.api_url}")
+        runners = {
+            "catalog": self.bench_catalog_endpoints,
+            "encoding": self.bench_payload_encoding,
+            "login_load": self.bench_products_under_login_load,
+            "checkout": self.bench_checkout_create,
+            "mixed": self.bench_mixed_traffic,
+        }
+        for name in scenarios:
+            await runners[name]()
+        if self.rate_limited:
+            print(f"\n⚠️ {self.rate_limited} requests were rate limited (429) and left out of the latencies. "
+                  "All virtual users share this machine's IP: raise RATE_LIMIT_LOGIN_IP, RATE_LIMIT_LOGIN_EMAIL "
+                  "and RATE_LIMIT_REGISTER_IP on the target, or run with --local.")
+
+
+async def run(args) -> "CheatcoreAPIBenchmark":
+    if not args.local:
+        bench = CheatcoreAPIBenchmark()
+        await bench.run_all(args.scenarios)
+        return bench
+    async with LocalStack(workers=args.workers, provider_latency_ms=args.provider_latency_ms) as stack:
+        bench = CheatcoreAPIBenchmark(stack.base_url)
+        await bench.run_all(args.scenarios)
+        return bench
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Cheatcore API")
+    parser.add_argument("--local", action="store_true",
+                        help="start the backend and fake providers locally against BENCH_MONGO_URL")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for --local")
+    parser.add_argument("--provider-latency-ms", type=float, default=0.0, help="fake provider delay for --local")
+    parser.add_argument("--scenarios", nargs="+", choices=CheatcoreAPIBenchmark.SCENARIOS,
+                        default=list(CheatcoreAPIBenchmark.SCENARIOS))
+    parser.add_argument("--compare", help="previous results JSON to check for p99 regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed p99 slowdown, as a fraction")
+    args = parser.parse_args()
+
+    bench = asyncio.run(run(args))
+
+    results = {
+        "base_url": bench.base_url,
+        "local": args.local,
+        "rate_limited": bench.rate_limited,
+        "benchmarks": bench.results,
+        "timestamp": datetime.now().isoformat()
+    }
+    out_path = Path(os.environ.get("BENCH_RESULTS", Path(__file__).parent / "backend_bench_results.json"))
+    try:
+        with open(out_path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results saved to {out_path}")
+    except Exception as e:
+        print(f"\n⚠️ Failed to save results: {e}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_results(results, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"❌ regression {line}")
+        if regressions:
+            return 1
+        print(f"✅ No p99 regressions beyond {args.threshold:.0%} against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
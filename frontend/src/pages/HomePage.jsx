@@ -96,7 +96,7 @@ export default function HomePage() {
   useEffect(() => {
     axios.get(`${API}/stats`).then(r => setStats(r.data)).catch(() => {});
     axios.get(`${API}/reviews`).then(r => setReviews(r.data)).catch(() => {});
-    axios.get(`${API}/products`).then(r => {
+    axios.get(`${API}/products?view=summary`).then(r => {
       const premium = r.data.filter(p => p.tier === 'Premium').slice(0, 4);
       setFeaturedProducts(premium);
     }).catch(() => {});
@@ -37,7 +37,7 @@ export default function ProductsPage() {
   const [games, setGames] = useState([]);
 
   useEffect(() => {
-    axios.get(`${API}/products`).then(r => setProducts(r.data)).catch(() => {});
+    axios.get(`${API}/products?view=summary`).then(r => setProducts(r.data)).catch(() => {});
     axios.get(`${API}/games`).then(r => setGames(r.data)).catch(() => {});
   }, []);
 
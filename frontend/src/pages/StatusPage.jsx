@@ -17,7 +17,18 @@ export default function StatusPage() {
   const [filterStatus, setFilterStatus] = useState('all');
 
   useEffect(() => {
-    axios.get(`${API}/product-status`).then(r => setStatuses(r.data)).catch(() => {});
+    if (typeof EventSource === 'undefined') {
+      axios.get(`${API}/product-status`).then(r => setStatuses(r.data)).catch(() => {});
+      return undefined;
+    }
+    // The stream opens with a full snapshot, then pushes one event per status change
+    const source = new EventSource(`${API}/product-status/stream`);
+    source.addEventListener('snapshot', e => setStatuses(JSON.parse(e.data)));
+    source.addEventListener('status', e => {
+      const update = JSON.parse(e.data);
+      setStatuses(prev => prev.map(s => (s.product_id === update.product_id ? update : s)));
+    });
+    return () => source.close();
   }, []);
 
   const games = [...new Set(statuses.map(s => s.game))].sort();
@@ -0,0 +1,383 @@
+"""A small in-memory stand-in for the motor API, covering what the backend modules call.
+
+Only the query, update and aggregation operators the backend uses are
+implemented. Every method yields to the event loop once, so coroutines
+sharing a database interleave the way they would against a real server.
+"""
+import asyncio
+import copy
+from types import SimpleNamespace
+
+from pymongo import InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError
+
+MISSING = object()
+
+
+def get_path(doc, path):
+    for part in path.split("."):
+        if not isinstance(doc, dict) or part not in doc:
+            return MISSING
+        doc = doc[part]
+    return doc
+
+
+def _compare(value, op, arg):
+    if op == "$exists":
+        return (value is not MISSING) == bool(arg)
+    if op == "$in":
+        return value in arg
+    if op == "$nin":
+        return value not in arg
+    if op == "$ne":
+        return value is MISSING or value != arg
+    if value is MISSING or value is None:
+        return False
+    if op == "$lt":
+        return value < arg
+    if op == "$lte":
+        return value <= arg
+    if op == "$gt":
+        return value > arg
+    if op == "$gte":
+        return value >= arg
+    raise NotImplementedError(op)
+
+
+def matches(doc, query):
+    for key, cond in query.items():
+        if key == "$or":
+            if not any(matches(doc, q) for q in cond):
+                return False
+        elif key == "$and":
+            if not all(matches(doc, q) for q in cond):
+                return False
+        elif isinstance(cond, dict) and cond and all(k.startswith("$") for k in cond):
+            value = get_path(doc, key)
+            if not all(_compare(value, op, arg) for op, arg in cond.items()):
+                return False
+        elif get_path(doc, key) != cond:
+            return False
+    return True
+
+
+def apply_update(doc, update, inserting=False):
+    for op, fields in update.items():
+        for path, value in fields.items():
+            *parents, leaf = path.split(".")
+            target = doc
+            for part in parents:
+                target = target.setdefault(part, {})
+            if op == "$set" or (op == "$setOnInsert" and inserting):
+                target[leaf] = copy.deepcopy(value)
+            elif op == "$unset":
+                target.pop(leaf, None)
+            elif op == "$inc":
+                target[leaf] = target.get(leaf, 0) + value
+            elif op == "$push":
+                target.setdefault(leaf, []).append(copy.deepcopy(value))
+            elif op != "$setOnInsert":
+                raise NotImplementedError(op)
+
+
+def apply_pipeline_update(doc, stages):
+    for stage in stages:
+        (op, fields), = stage.items()
+        if op != "$set":
+            raise NotImplementedError(op)
+        values = {path: evaluate(expr, doc) for path, expr in fields.items()}
+        for path, value in values.items():
+            if value is MISSING:
+                doc.pop(path, None)
+            else:
+                doc[path] = value
+
+
+def project(doc, projection):
+    if doc is None or not projection:
+        return copy.deepcopy(doc)
+    included = [k for k, v in projection.items() if v and k != "_id"]
+    if included:
+        out = {k: copy.deepcopy(doc[k]) for k in included if k in doc}
+        if projection.get("_id", 1) and "_id" in doc:
+            out["_id"] = doc["_id"]
+        return out
+    return {k: copy.deepcopy(v) for k, v in doc.items() if projection.get(k, 1)}
+
+
+def evaluate(expr, doc):
+    if expr == "$$REMOVE":
+        return MISSING
+    if isinstance(expr, str) and expr.startswith("$"):
+        value = get_path(doc, expr[1:])
+        return None if value is MISSING else value
+    if isinstance(expr, dict):
+        if len(expr) == 1 and next(iter(expr)).startswith("$"):
+            op, args = next(iter(expr.items()))
+            if op == "$ifNull":
+                value = evaluate(args[0], doc)
+                return evaluate(args[1], doc) if value is None else value
+            if op == "$cond":
+                return evaluate(args[1] if evaluate(args[0], doc) else args[2], doc)
+            values = [evaluate(a, doc) for a in args]
+            if op == "$and":
+                return all(values)
+            if op == "$ne":
+                return values[0] != values[1]
+            if op == "$lt":
+                return values[0] < values[1]
+            if op == "$substrBytes":
+                return values[0][values[1]:values[1] + values[2]]
+            if op == "$multiply":
+                return values[0] * values[1]
+            if op == "$round":
+                return round(values[0], values[1])
+            raise NotImplementedError(op)
+        return {k: evaluate(v, doc) for k, v in expr.items()}
+    return expr
+
+
+def _sort_key(sort):
+    def key(doc):
+        return tuple(Reverse(get_path(doc, f)) if d < 0 else get_path(doc, f) for f, d in sort)
+    return key
+
+
+class Reverse:
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+class Cursor:
+    def __init__(self, docs, projection=None):
+        self.docs = docs
+        self.projection = projection
+
+    def sort(self, key, direction=None):
+        keys = [(key, direction)] if isinstance(key, str) else key
+        self.docs = sorted(self.docs, key=_sort_key(keys))
+        return self
+
+    def limit(self, n):
+        if n:
+            self.docs = self.docs[:n]
+        return self
+
+    def _out(self):
+        return [project(d, self.projection) for d in self.docs]
+
+    async def to_list(self, length=None):
+        await asyncio.sleep(0)
+        return self._out()[:length] if length else self._out()
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self._out():
+            await asyncio.sleep(0)
+            yield doc
+
+
+class Collection:
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+        self.docs = []
+        self._next_id = 0
+
+    def _find(self, query):
+        return [d for d in self.docs if matches(d, query or {})]
+
+    def _insert(self, doc):
+        if "_id" not in doc:
+            self._next_id += 1
+            doc["_id"] = f"{self.name}:{self._next_id}"
+        if any(d["_id"] == doc["_id"] for d in self.docs):
+            raise DuplicateKeyError("duplicate _id", 11000, {"keyPattern": {"_id": 1}})
+        self.docs.append(copy.deepcopy(doc))
+        self.db._touch(self.name)
+
+    def _upsert(self, query, update):
+        doc = {k: copy.deepcopy(v) for k, v in query.items()
+               if not k.startswith("$") and not (isinstance(v, dict) and any(o.startswith("$") for o in v))}
+        apply_update(doc, update, inserting=True)
+        self._insert(doc)
+        return doc["_id"]
+
+    async def insert_one(self, doc):
+        await asyncio.sleep(0)
+        self._insert(doc)
+        return SimpleNamespace(inserted_id=doc["_id"])
+
+    async def insert_many(self, docs, ordered=True):
+        await asyncio.sleep(0)
+        errors = []
+        for index, doc in enumerate(docs):
+            try:
+                self._insert(doc)
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "keyPattern": e.details["keyPattern"]})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+    async def find_one(self, query=None, projection=None, sort=None):
+        await asyncio.sleep(0)
+        found = self._find(query)
+        if sort:
+            found.sort(key=_sort_key(sort))
+        return project(found[0], projection) if found else None
+
+    def find(self, query=None, projection=None):
+        return Cursor(self._find(query), projection)
+
+    async def count_documents(self, query, limit=0):
+        await asyncio.sleep(0)
+        found = len(self._find(query))
+        return min(found, limit) if limit else found
+
+    async def find_one_and_update(self, query, update, projection=None, upsert=False,
+                                  return_document=ReturnDocument.BEFORE, sort=None, session=None):
+        await asyncio.sleep(0)
+        found = self._find(query)
+        if sort:
+            found.sort(key=_sort_key(sort))
+        if not found:
+            if not upsert:
+                return None
+            _id = self._upsert(query, update)
+            if return_document == ReturnDocument.AFTER:
+                return project(next(d for d in self.docs if d["_id"] == _id), projection)
+            return None
+        before = copy.deepcopy(found[0])
+        if isinstance(update, list):
+            apply_pipeline_update(found[0], update)
+        else:
+            apply_update(found[0], update)
+        return project(found[0] if return_document == ReturnDocument.AFTER else before, projection)
+
+    async def update_one(self, query, update, upsert=False):
+        await asyncio.sleep(0)
+        return self._update(query, update, upsert, many=False)
+
+    async def update_many(self, query, update, upsert=False):
+        await asyncio.sleep(0)
+        return self._update(query, update, upsert, many=True)
+
+    def _update(self, query, update, upsert, many):
+        found = self._find(query)
+        if not many:
+            found = found[:1]
+        modified = 0
+        for doc in found:
+            before = copy.deepcopy(doc)
+            apply_update(doc, update)
+            modified += doc != before
+        upserted_id = self._upsert(query, update) if upsert and not found else None
+        return SimpleNamespace(matched_count=len(found), modified_count=modified, upserted_id=upserted_id)
+
+    async def delete_one(self, query):
+        await asyncio.sleep(0)
+        found = self._find(query)[:1]
+        self.docs = [d for d in self.docs if d not in found]
+        return SimpleNamespace(deleted_count=len(found))
+
+    async def delete_many(self, query):
+        await asyncio.sleep(0)
+        found = self._find(query)
+        self.docs = [d for d in self.docs if d not in found]
+        return SimpleNamespace(deleted_count=len(found))
+
+    async def bulk_write(self, ops, ordered=True):
+        await asyncio.sleep(0)
+        for op in ops:
+            if isinstance(op, InsertOne):
+                self._insert(op._doc)
+            elif isinstance(op, UpdateOne):
+                self._update(op._filter, op._doc, op._upsert, many=False)
+            else:
+                raise NotImplementedError(type(op).__name__)
+
+    def aggregate(self, pipeline, **kwargs):
+        docs = [copy.deepcopy(d) for d in self.docs]
+        for stage in pipeline:
+            (op, spec), = stage.items()
+            if op == "$match":
+                docs = [d for d in docs if matches(d, spec)]
+            elif op == "$group":
+                groups = {}
+                for doc in docs:
+                    key = evaluate(spec["_id"], doc)
+                    group = groups.setdefault(repr(key), {"_id": key})
+                    for field, accumulator in spec.items():
+                        if field == "_id":
+                            continue
+                        (acc, expr), = accumulator.items()
+                        value = evaluate(expr, doc)
+                        if acc == "$sum":
+                            group[field] = group.get(field, 0) + value
+                        elif acc == "$first":
+                            group.setdefault(field, value)
+                        else:
+                            raise NotImplementedError(acc)
+                docs = list(groups.values())
+            else:
+                raise NotImplementedError(op)
+        return Cursor(docs)
+
+    async def create_index(self, keys, **kwargs):
+        await asyncio.sleep(0)
+        self.db._touch(self.name)
+        return kwargs.get("name", "_".join(f"{k}_{d}" for k, d in keys))
+
+    async def drop(self):
+        await asyncio.sleep(0)
+        self.docs = []
+        self.db._existing.discard(self.name)
+
+    async def rename(self, new_name, dropTarget=False):
+        await asyncio.sleep(0)
+        if new_name in self.db._existing and not dropTarget:
+            raise CollectionInvalid(f"{new_name} exists")
+        target = self.db[new_name]
+        target.docs, self.docs = self.docs, []
+        self.db._existing.discard(self.name)
+        self.db._touch(new_name)
+
+
+class Database:
+    def __init__(self):
+        self._collections = {}
+        self._existing = set()
+
+    def _touch(self, name):
+        self._existing.add(name)
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = Collection(self, name)
+        return self._collections[name]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    async def create_collection(self, name):
+        await asyncio.sleep(0)
+        if name in self._existing:
+            raise CollectionInvalid(f"{name} exists")
+        self._touch(name)
+        return self[name]
+
+    async def list_collection_names(self):
+        await asyncio.sleep(0)
+        return sorted(self._existing)
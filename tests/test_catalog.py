@@ -0,0 +1,44 @@
+import orjson
+
+from catalog import VIEWS, CompiledCatalog, SUMMARY_FIELDS, etag_matches
+
+PRODUCTS = [
+    {"product_id": "p1", "name": "One", "game": "Rust", "price": 10.0, "status": "undetected", "tier": "Premium",
+     "pricing_tiers": [{"key": "1month", "label": "1 Month", "price": 10.0, "days": 30}]},
+    {"product_id": "p2", "name": "Two", "game": "CS2", "price": 5.0, "status": "updating", "tier": "Lite"},
+]
+REVIEWS = [{"review_id": "r1", "product_id": "p1", "rating": 5}]
+
+
+def test_summary_view_projects_fields():
+    catalog = CompiledCatalog(PRODUCTS, REVIEWS, version=3)
+    summary = orjson.loads(catalog.view("summary").product_by_id["p1"].body)
+    assert set(summary) == set(SUMMARY_FIELDS)
+    assert orjson.loads(catalog.view().product_by_id["p1"].body)["pricing_tiers"]
+
+
+def test_every_named_view_is_rendered_with_the_snapshot():
+    catalog = CompiledCatalog(PRODUCTS, REVIEWS, version=3)
+    assert set(catalog.views) == set(VIEWS)
+    grid = orjson.loads(catalog.view("grid").products.body)
+    assert [set(p) for p in grid] == [set(VIEWS["grid"])] * 2
+    assert orjson.loads(catalog.view("grid").products_for_game("rust").body)[0]["product_id"] == "p1"
+
+
+def test_with_reviews_keeps_product_bodies():
+    catalog = CompiledCatalog(PRODUCTS, REVIEWS, version=3)
+    updated = catalog.with_reviews(REVIEWS + [{"review_id": "r2", "product_id": "p2", "rating": 4}], 7, 1)
+
+    assert updated.full is catalog.full
+    assert updated.full.products.etag == catalog.full.products.etag
+    assert updated.version == 3 and updated.review_version == 1
+    assert orjson.loads(updated.stats.body)["total_reviews"] == 7
+    assert orjson.loads(catalog.stats.body)["total_reviews"] == 1
+    assert updated.reviews.etag != catalog.reviews.etag
+
+
+def test_etag_matches_weak_and_lists():
+    assert etag_matches('W/"abc", "def"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches('"abd"', '"abc"')
+    assert not etag_matches(None, '"abc"')
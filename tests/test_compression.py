@@ -0,0 +1,24 @@
+import gzip
+
+import brotli
+import pytest
+
+from compression import compress, negotiate
+
+
+@pytest.mark.parametrize("header, size, expected", [
+    ("gzip, deflate, br", 2048, "br"),
+    ("gzip, br;q=0", 2048, "gzip"),
+    ("*", 2048, "gzip"),
+    ("identity", 2048, None),
+    ("br", 100, None),      # under the minimum size
+    (None, 2048, None),
+])
+def test_negotiate(header, size, expected):
+    assert negotiate(header, size) == expected
+
+
+def test_compress_round_trips():
+    body = b'{"products": []}' * 200
+    assert brotli.decompress(compress(body, "br")) == body
+    assert gzip.decompress(compress(body, "gzip")) == body
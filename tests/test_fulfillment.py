@@ -0,0 +1,78 @@
+import asyncio
+import re
+
+from pymongo.errors import DuplicateKeyError
+
+from fulfillment import FulfillmentWorker, generate_license_keys
+from payment_states import PAID
+
+KEY = re.compile(r"^CC-[0-9A-F]{4}-[0-9A-F]{4}-[0-9A-F]{4}-[0-9A-F]{4}$")
+
+
+def test_generate_license_keys_are_distinct_and_well_formed():
+    keys = generate_license_keys(500)
+    assert len(set(keys)) == 500
+    assert all(KEY.match(k) for k in keys)
+
+
+class Licenses:
+    """Just enough of a collection to hit the unique indexes from ``fulfill``."""
+
+    def __init__(self, taken_keys=(), by_session=None):
+        self.taken_keys = set(taken_keys)
+        self.by_session = dict(by_session or {})
+        self.inserted = []
+
+    async def insert_one(self, doc):
+        if doc["session_id"] in self.by_session:
+            raise DuplicateKeyError("dup", 11000, {"keyPattern": {"session_id": 1}})
+        if doc["license_key"] in self.taken_keys:
+            raise DuplicateKeyError("dup", 11000, {"keyPattern": {"license_key": 1}})
+        self.inserted.append(doc)
+
+    async def find_one(self, query, projection=None):
+        license_id = self.by_session.get(query["session_id"])
+        return {"license_id": license_id} if license_id else None
+
+
+class Transactions:
+    def __init__(self, txn):
+        self.txn = txn
+
+    async def find_one(self, query, projection=None):
+        return dict(self.txn)
+
+    async def update_one(self, query, update):
+        self.txn.update(update["$set"])
+
+
+class DB:
+    def __init__(self, txn, licenses):
+        self.payment_transactions = Transactions(txn)
+        self.licenses = licenses
+
+
+def paid_txn():
+    return {"session_id": "cs_1", "payment_status": PAID, "product_id": "p1", "product_name": "P",
+            "user_id": "u1", "duration": "1month", "days": 30}
+
+
+def test_fulfill_retries_a_license_key_collision(monkeypatch):
+    keys = iter([["CC-0000-0000-0000-0000"], ["CC-1111-1111-1111-1111"]])
+    monkeypatch.setattr("fulfillment.generate_license_keys", lambda count: next(keys))
+    db = DB(paid_txn(), Licenses(taken_keys={"CC-0000-0000-0000-0000"}))
+    worker = FulfillmentWorker(db)
+
+    license_id = asyncio.run(worker.fulfill("cs_1"))
+
+    assert [doc["license_key"] for doc in db.licenses.inserted] == ["CC-1111-1111-1111-1111"]
+    assert db.payment_transactions.txn["license_id"] == license_id
+    assert worker.fulfilled == 1
+
+
+def test_fulfill_reuses_the_license_of_a_duplicate_session():
+    db = DB(paid_txn(), Licenses(by_session={"cs_1": "lic_existing"}))
+    worker = FulfillmentWorker(db)
+
+    assert asyncio.run(worker.fulfill("cs_1")) == "lic_existing"
+    assert worker.duplicates == 1
@@ -0,0 +1,23 @@
+import importlib
+
+import pytest
+
+MODULES = [
+    "catalog", "compression", "fulfillment", "indexes", "jwt_keys", "license_index", "license_issuer",
+    "maintenance", "metrics", "mongo_pool", "pagination", "password_hasher", "payment_states", "pricing",
+    "principal_cache", "rate_limit", "reviews", "sales_rollups", "search", "status_feed", "webhook_inbox",
+]
+
+
+@pytest.mark.parametrize("name", MODULES)
+def test_module_imports(name):
+    importlib.import_module(name)
+
+
+@pytest.mark.parametrize("name", ["outbound", "server"])
+def test_app_imports(name, monkeypatch):
+    # The payment integration package is only installed in the deployment image
+    pytest.importorskip("emergentintegrations")
+    monkeypatch.setenv("MONGO_URL", "mongodb://localhost:27017")
+    monkeypatch.setenv("DB_NAME", "test_imports")
+    importlib.import_module(name)
@@ -0,0 +1,59 @@
+import jwt as pyjwt
+import pytest
+
+from jwt_keys import KeyRing, load_or_create_keyfile, rotate
+
+SECRET_A = "a" * 64
+SECRET_B = "b" * 64
+
+
+def test_signs_with_the_active_kid_and_verifies_older_keys():
+    old = KeyRing({"k1": SECRET_A}, "k1").sign({"sub": "u1"})
+    ring = KeyRing({"k1": SECRET_A, "k2": SECRET_B}, "k2")
+    new = ring.sign({"sub": "u2"})
+
+    assert pyjwt.get_unverified_header(new)["kid"] == "k2"
+    assert ring.verify(old) == {"sub": "u1"}
+    assert ring.verify(new) == {"sub": "u2"}
+
+
+def test_rejects_unknown_kids_and_bad_signatures():
+    ring = KeyRing({"k1": SECRET_A}, "k1")
+    assert ring.verify(KeyRing({"k9": SECRET_B}, "k9").sign({"sub": "u1"})) is None
+    forged = pyjwt.encode({"sub": "u1"}, SECRET_B, algorithm="HS256", headers={"kid": "k1"})
+    assert ring.verify(forged) is None
+    assert ring.verify("not-a-token") is None
+
+
+def test_active_kid_must_have_a_key():
+    with pytest.raises(ValueError):
+        KeyRing({"k1": SECRET_A}, "k2")
+
+
+def test_from_env_key_list(monkeypatch, tmp_path):
+    monkeypatch.setenv("JWT_KEYS", f"k1:{SECRET_A}, k2:{SECRET_B}")
+    monkeypatch.delenv("JWT_ACTIVE_KID", raising=False)
+    ring = KeyRing.from_env(tmp_path)
+    assert ring.active == "k2" and set(ring.keys) == {"k1", "k2"}
+
+
+def test_rotation_reaches_other_workers_through_the_keyfile(tmp_path):
+    keyfile = tmp_path / "keys.json"
+    load_or_create_keyfile(keyfile)
+    data = load_or_create_keyfile(keyfile)
+    worker_a = KeyRing(data["keys"], data["active"], keyfile)
+    worker_b = KeyRing(dict(data["keys"]), data["active"], keyfile)
+    before = worker_a.sign({"sub": "old"})
+
+    new_kid = rotate(keyfile, keep=2)
+    worker_a._maybe_reload(force=True)
+    token = worker_a.sign({"sub": "new"})
+
+    assert pyjwt.get_unverified_header(token)["kid"] == new_kid
+    # worker_b has never seen the new kid; an unknown kid forces a keyfile reload
+    assert worker_b.verify(token) == {"sub": "new"}
+    assert worker_b.verify(before) == {"sub": "old"}
+
+    rotate(keyfile, keep=2)
+    worker_b._maybe_reload(force=True)
+    assert worker_b.verify(before) is None
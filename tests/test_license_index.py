@@ -0,0 +1,106 @@
+import asyncio
+from datetime import datetime, timezone
+
+from bson import ObjectId
+
+from license_index import BloomFilter, LicenseIndex, key_digest, to_timestamp
+from tests.fake_mongo import Database
+
+
+def doc(key, product_id="p1", expires_at="2030-01-01T00:00:00+00:00", status="active"):
+    return {"_id": ObjectId(), "license_key": key, "product_id": product_id, "expires_at": expires_at,
+            "status": status}
+
+
+def test_bloom_filter_has_no_false_negatives_and_few_false_positives():
+    bloom = BloomFilter(5000)
+    members = [key_digest(f"CC-{i:016X}") for i in range(5000)]
+    for digest in members:
+        bloom.add(digest)
+    assert all(d in bloom for d in members)
+    false_positives = sum(key_digest(f"XX-{i:016X}") in bloom for i in range(20000))
+    assert false_positives / 20000 < 0.02
+
+
+def test_to_timestamp():
+    expected = datetime(2030, 1, 1, tzinfo=timezone.utc).timestamp()
+    assert to_timestamp("2030-01-01T00:00:00Z") == expected
+    assert to_timestamp(datetime(2030, 1, 1)) == expected
+    assert to_timestamp("garbage") == 0.0
+
+
+def test_lookup_normalizes_keys_and_survives_resizes():
+    index = LicenseIndex(None)
+    keys = [f"CC-AAAA-BBBB-CCCC-{i:04X}" for i in range(3000)]
+    for key in keys:
+        index.add(doc(key))
+    assert index.bloom.capacity >= 3000
+    assert all(index.lookup(k) for k in keys)
+    assert index.lookup("  cc-aaaa-bbbb-cccc-0001 ")[0] == "p1"
+    assert index.lookup("CC-0000-0000-0000-0000") is None
+
+
+def test_later_writes_replace_an_entry():
+    index = LicenseIndex(None)
+    index.add(doc("CC-1"))
+    index.add(doc("CC-1", status="revoked"))
+    assert index.lookup("CC-1")[2] == "revoked"
+
+
+class Cursor:
+    def __init__(self, docs, during):
+        self.docs = docs
+        self.during = during
+
+    def batch_size(self, n):
+        return self
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for i, d in enumerate(self.docs):
+            if i == 1:
+                self.during()
+            yield d
+
+
+class Licenses:
+    def __init__(self, docs, during):
+        self.docs = docs
+        self.during = during
+
+    def find(self, query, projection):
+        return Cursor(self.docs, self.during)
+
+
+class DB:
+    def __init__(self, licenses):
+        self.licenses = licenses
+
+
+def test_rebuild_keeps_changes_seen_while_scanning():
+    stored = [doc("CC-1"), doc("CC-2")]
+    index = LicenseIndex(None)
+    index.add(doc("CC-GONE"))
+    # A status change arrives from the change stream after the scan already read CC-1
+    index.db = DB(Licenses(stored, lambda: index.add(doc("CC-1", status="revoked"))))
+
+    asyncio.run(index.rebuild())
+
+    assert index.lookup("CC-1")[2] == "revoked"
+    assert index.lookup("CC-2")[2] == "active"
+    assert index.lookup("CC-GONE") is None
+    assert index.stats()["rebuilds"] == 1
+
+
+def test_poll_on_an_empty_index_picks_up_new_licenses():
+    db = Database()
+    index = LicenseIndex(db)
+    asyncio.run(index.poll())
+    assert index.watermark == 0.0
+
+    db.licenses.docs = [doc("CC-NEW"), {"_id": ObjectId(), "product_id": "p1"}]
+    asyncio.run(index.poll())
+    assert index.lookup("CC-NEW")[0] == "p1"
+    assert index.watermark > 0
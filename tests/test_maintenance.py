@@ -0,0 +1,71 @@
+import asyncio
+from datetime import datetime, timezone, timedelta
+
+from maintenance import ARCHIVE_COLLECTION, TransactionArchiver
+from tests.fake_mongo import Database
+
+
+def txn(session_id, hours_ago, status="pending"):
+    created_at = (datetime.now(timezone.utc) - timedelta(hours=hours_ago)).isoformat()
+    return {"_id": f"oid_{session_id}", "session_id": session_id, "payment_status": status, "created_at": created_at}
+
+
+def sessions(collection):
+    return sorted(d["session_id"] for d in collection.docs)
+
+
+def seeded():
+    db = Database()
+    db.payment_transactions.docs = [txn("old_1", 72), txn("old_2", 60, "unpaid"), txn("old_3", 50),
+                                    txn("old_paid", 72, "paid"), txn("recent", 1)]
+    return db
+
+
+def test_run_once_archives_stale_unpaid_checkouts_in_batches():
+    db = seeded()
+    archiver = TransactionArchiver(db, max_age=48 * 3600, batch_size=2)
+
+    assert asyncio.run(archiver.run_once()) == 3
+    assert sessions(db.payment_transactions) == ["old_paid", "recent"]
+    assert sessions(db[ARCHIVE_COLLECTION]) == ["old_1", "old_2", "old_3"]
+    assert archiver.stats()["archived"] == 3 and archiver.stats()["runs"] == 1
+    assert asyncio.run(archiver.run_once()) == 0
+
+
+def test_concurrent_archivers_move_each_row_once():
+    db = seeded()
+    archivers = [TransactionArchiver(db, batch_size=2) for _ in range(2)]
+
+    async def scenario():
+        return await asyncio.gather(*(a.run_once() for a in archivers))
+
+    assert sum(asyncio.run(scenario())) == 3
+    assert sessions(db[ARCHIVE_COLLECTION]) == ["old_1", "old_2", "old_3"]
+    assert sessions(db.payment_transactions) == ["old_paid", "recent"]
+
+
+def test_restore_round_trips_an_archived_row():
+    db = seeded()
+    archiver = TransactionArchiver(db)
+    asyncio.run(archiver.run_once())
+
+    assert asyncio.run(archiver.restore("old_1")) is True
+    restored = next(d for d in db.payment_transactions.docs if d["session_id"] == "old_1")
+    assert restored == txn("old_1", 72) | {"created_at": restored["created_at"]}
+    assert sessions(db[ARCHIVE_COLLECTION]) == ["old_2", "old_3"]
+    # Nothing left to restore, and a row that was never archived has nothing to restore
+    assert asyncio.run(archiver.restore("old_1")) is False
+    assert asyncio.run(archiver.restore("recent")) is False
+    assert archiver.stats()["restored"] == 1
+
+
+def test_restore_tolerates_a_row_that_is_already_live():
+    db = seeded()
+    archiver = TransactionArchiver(db)
+    asyncio.run(archiver.run_once())
+    # A racing restore already put the row back
+    db.payment_transactions.docs.append(txn("old_2", 60, "unpaid"))
+
+    assert asyncio.run(archiver.restore("old_2")) is True
+    assert sessions(db.payment_transactions).count("old_2") == 1
+    assert "old_2" not in sessions(db[ARCHIVE_COLLECTION])
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from metrics import Histogram, Metrics, MetricsMiddleware, timed
+
+
+def build_app(metrics):
+    app = FastAPI()
+    seen = {}
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: str):
+        seen["in_flight"] = dict(metrics.in_flight)
+        return {"id": item_id}
+
+    @app.get("/boom")
+    async def boom():
+        raise RuntimeError("boom")
+
+    app.add_middleware(MetricsMiddleware, metrics=metrics, routes=app.router.routes)
+    return app, seen
+
+
+def test_histogram_buckets_are_upper_bounds():
+    hist = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 5.0):
+        hist.observe(value)
+    assert hist.counts == [2, 1, 1]
+    assert hist.count == 4 and hist.sum == pytest.approx(5.65)
+
+
+def test_middleware_labels_by_route_template():
+    metrics = Metrics()
+    app, seen = build_app(metrics)
+    client = TestClient(app, raise_server_exceptions=False)
+
+    assert client.get("/items/a").status_code == 200
+    assert client.get("/items/b").status_code == 200
+    assert client.get("/boom").status_code == 500
+    assert client.get("/nope").status_code == 404
+
+    # In flight is labelled with the template while the handler runs, and drops back after
+    assert seen["in_flight"][("GET", "/items/{item_id}")] == 1
+    assert metrics.in_flight == {("GET", "/items/{item_id}"): 0, ("GET", "/boom"): 0, ("GET", "unmatched"): 0}
+    assert metrics.request_latency[("GET", "/items/{item_id}")].count == 2
+    assert metrics.request_count[("GET", "/items/{item_id}", 200)] == 2
+    assert metrics.request_count[("GET", "/boom", 500)] == 1
+
+    text = metrics.render()
+    assert 'cc_http_requests_total{method="GET",route="/items/{item_id}",status="200"} 2' in text
+    assert 'cc_http_requests_in_flight{method="GET",route="/boom"} 0' in text
+    assert 'cc_http_request_duration_seconds_count{method="GET",route="/items/{item_id}"} 2' in text
+
+
+class Hasher:
+    async def hash(self, password):
+        return password[::-1]
+
+    async def fail(self):
+        raise ValueError("nope")
+
+    def stats(self):
+        return {"completed": 3, "executor": "thread", "busy": True}
+
+
+def test_timed_records_calls_and_failures():
+    metrics = Metrics()
+    hasher = timed(Hasher(), metrics, "bcrypt")
+
+    assert asyncio.run(hasher.hash("abc")) == "cba"
+    with pytest.raises(ValueError):
+        asyncio.run(hasher.fail())
+    assert hasher.stats()["completed"] == 3
+
+    assert metrics.dependency_latency[("bcrypt", "hash")].count == 1
+    assert metrics.dependency_latency[("bcrypt", "fail")].count == 1
+    assert metrics.dependency_errors == {("bcrypt", "fail"): 1}
+
+
+def test_collectors_export_numeric_stats_only():
+    metrics = Metrics()
+    metrics.add_collector("password_hasher", Hasher().stats)
+    text = metrics.render()
+    assert "cc_password_hasher_completed 3" in text
+    assert "executor" not in text and "busy" not in text
@@ -0,0 +1,36 @@
+import pytest
+from fastapi import HTTPException
+
+from pagination import Keyset, decode_cursor, encode_cursor
+
+KEYSET = Keyset("created_at", "transaction_id")
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor("2025-01-02T03:04:05+00:00", "txn_abc")
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == ("2025-01-02T03:04:05+00:00", "txn_abc")
+
+
+@pytest.mark.parametrize("cursor", ["not-base64!", encode_cursor("only", "x")[:-3], "e30"])
+def test_bad_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as exc:
+        decode_cursor(cursor)
+    assert exc.value.status_code == 400
+
+
+def test_query_continues_strictly_after_the_cursor():
+    assert KEYSET.query({"user_id": "u1"}, None) == {"user_id": "u1"}
+    query = KEYSET.query({"user_id": "u1"}, encode_cursor("2025-01-02", "txn_5"))
+    assert query == {"user_id": "u1", "$or": [
+        {"created_at": {"$lt": "2025-01-02"}},
+        {"created_at": "2025-01-02", "transaction_id": {"$lt": "txn_5"}},
+    ]}
+
+
+def test_split_page():
+    rows = [{"created_at": f"2025-01-0{9 - i}", "transaction_id": f"txn_{i}"} for i in range(4)]
+    page, cursor = KEYSET.split_page(rows, 3)
+    assert page == rows[:3]
+    assert decode_cursor(cursor) == ("2025-01-07", "txn_2")
+    assert KEYSET.split_page(rows[:3], 3) == (rows[:3], None)
@@ -0,0 +1,37 @@
+import asyncio
+
+from password_hasher import PasswordHasher, build_crypt_context
+
+
+def test_hash_and_verify_on_the_pool():
+    async def run():
+        hasher = PasswordHasher(rounds=4, workers=2, max_concurrency=1)
+        try:
+            hashed = await hasher.hash("hunter2")
+            results = await asyncio.gather(*(hasher.verify_and_update(pw, hashed)
+                                             for pw in ("hunter2", "wrong", "hunter2")))
+            return hashed, results, hasher.stats()
+        finally:
+            hasher.shutdown()
+
+    hashed, results, stats = asyncio.run(run())
+    assert hashed.startswith("$2b$04$")
+    assert results == [(True, None), (False, None), (True, None)]
+    assert stats["completed"] == 4
+    assert stats["max_queue_depth"] >= 2   # one slot, three verifies
+    assert stats["in_flight"] == stats["queue_depth"] == 0
+
+
+def test_rounds_change_triggers_rehash():
+    stored = build_crypt_context(4).hash("hunter2")
+
+    async def run():
+        hasher = PasswordHasher(rounds=5, workers=1)
+        try:
+            return await hasher.verify_and_update("hunter2", stored)
+        finally:
+            hasher.shutdown()
+
+    ok, new_hash = asyncio.run(run())
+    assert ok
+    assert new_hash.startswith("$2b$05$")
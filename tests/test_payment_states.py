@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+import payment_states
+from payment_states import NO_PAYMENT_REQUIRED, PAID, PENDING, UNPAID, can_transition, read_and_claim_check, transition
+from tests.fake_mongo import Database
+
+
+def collection(status=PENDING, **fields):
+    db = Database()
+    db.payment_transactions.docs = [{"_id": 1, "session_id": "cs_1", "payment_status": status, **fields}]
+    return db.payment_transactions
+
+
+@pytest.mark.parametrize("current, target, allowed", [
+    (PENDING, PAID, True),
+    (UNPAID, PAID, True),
+    (NO_PAYMENT_REQUIRED, PAID, True),
+    (PENDING, UNPAID, True),
+    (PAID, UNPAID, False),
+    (PAID, PENDING, False),
+    (PAID, PAID, False),
+    (UNPAID, PENDING, False),
+])
+def test_can_transition(current, target, allowed):
+    assert can_transition(current, target) is allowed
+
+
+def test_transition_applies_fields_and_returns_the_new_document():
+    txns = collection()
+    txn = asyncio.run(transition(txns, "cs_1", PAID, {"status": "complete"}))
+    assert txn == {"session_id": "cs_1", "payment_status": PAID, "status": "complete"}
+
+
+def test_paid_is_terminal_and_only_one_racer_wins():
+    txns = collection()
+
+    async def race():
+        return await asyncio.gather(transition(txns, "cs_1", PAID, {"status": "webhook"}),
+                                    transition(txns, "cs_1", PAID, {"status": "poll"}))
+
+    results = asyncio.run(race())
+    assert sum(r is not None for r in results) == 1
+    for target in (UNPAID, PENDING, NO_PAYMENT_REQUIRED, PAID):
+        assert asyncio.run(transition(txns, "cs_1", target)) is None
+    assert txns.docs[0]["payment_status"] == PAID
+
+
+def test_transition_of_an_unknown_session_is_none():
+    assert asyncio.run(transition(collection(), "cs_missing", PAID)) is None
+
+
+@pytest.fixture
+def now(monkeypatch):
+    clock = {"now": 1000.0}
+    monkeypatch.setattr(payment_states.time, "time", lambda: clock["now"])
+    return clock
+
+
+def test_claim_check_once_per_interval(now):
+    txns = collection()
+    txn, claimed = asyncio.run(read_and_claim_check(txns, "cs_1", 15))
+    assert claimed and txn["provider_checked_at"] == 1000.0
+    # A second poll inside the interval reads the row but gets no re-check
+    now["now"] = 1010.0
+    txn, claimed = asyncio.run(read_and_claim_check(txns, "cs_1", 15))
+    assert not claimed and txn["provider_checked_at"] == 1000.0
+    now["now"] = 1016.0
+    assert asyncio.run(read_and_claim_check(txns, "cs_1", 15))[1]
+
+
+def test_concurrent_polls_claim_the_check_once(now):
+    txns = collection()
+
+    async def polls():
+        return await asyncio.gather(*(read_and_claim_check(txns, "cs_1", 15) for _ in range(5)))
+
+    assert [claimed for _, claimed in asyncio.run(polls())].count(True) == 1
+
+
+def test_paid_rows_are_never_claimed_for_a_check(now):
+    txns = collection(PAID)
+    txn, claimed = asyncio.run(read_and_claim_check(txns, "cs_1", 15))
+    assert txn["payment_status"] == PAID and not claimed
+    assert "provider_checked_at" not in txns.docs[0]
+    assert asyncio.run(read_and_claim_check(txns, "cs_missing", 15)) == (None, False)
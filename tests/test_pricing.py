@@ -0,0 +1,43 @@
+import pytest
+
+from pricing import PriceBook, to_cents
+
+TIERED = {"product_id": "tiered", "price": 59.99, "pricing_tiers": [
+    {"key": "1day", "label": "1 Day", "price": 7.99, "days": 1},
+    {"key": "1month", "label": "1 Month", "price": 59.99, "days": 30},
+]}
+PLAIN = {"product_id": "plain", "price": 24.99}
+
+
+@pytest.mark.parametrize("price, divisor, cents", [
+    (0.29, 1, 29),        # float(0.29) * 100 is 28.999999999999996
+    (19.99, 1, 1999),
+    (24.99, 2, 1250),     # 1249.5 rounds half up
+    (24.99, 4, 625),      # 624.75
+    (10, 4, 250),
+    ("4.005", 1, 401),
+])
+def test_to_cents(price, divisor, cents):
+    assert to_cents(price, divisor) == cents
+
+
+def test_tiers_are_used_as_given():
+    book = PriceBook([TIERED])
+    quote = book.quote("tiered", "1day")
+    assert (quote.amount_cents, quote.days, quote.label) == (799, 1, "1 Day")
+    assert book.quote("tiered", "1week") is None
+    assert [q.duration for q in book.by_product["tiered"]] == ["1day", "1month"]
+
+
+def test_standard_durations_and_aliases():
+    book = PriceBook([PLAIN])
+    assert {q.duration: q.amount_cents for q in book.by_product["plain"]} == \
+        {"1day": 625, "1week": 1250, "1month": 2499}
+    assert book.quote("plain", "monthly") == book.quote("plain", "1month")
+    assert book.quote("missing", "1month") is None
+
+
+def test_quote_payload():
+    payload = PriceBook([PLAIN]).quote("plain", "1week").payload()
+    assert payload == {"product_id": "plain", "duration": "1week", "label": "1 Week", "amount_cents": 1250,
+                       "days": 7, "currency": "usd", "amount": 12.5}
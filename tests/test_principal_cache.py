@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+import principal_cache
+from principal_cache import InMemorySharedTier, PrincipalCache
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock(1000.0)
+    monkeypatch.setattr(principal_cache.time, "time", clock.time)
+    return clock
+
+
+USER = {"user_id": "u1", "email": "a@b.c"}
+
+
+def test_member_sets_honour_the_ttl(clock):
+    tier = InMemorySharedTier()
+
+    async def scenario():
+        await tier.add_member("user:u1", "k1", 10)
+        clock.now += 5
+        await tier.add_member("user:u1", "k2", 10)
+        clock.now += 6
+        first = await tier.members("user:u1")
+        clock.now += 10
+        return first, await tier.members("user:u1")
+
+    assert asyncio.run(scenario()) == ({"k2"}, set())
+    assert tier._sets == {}
+
+
+def test_sweep_drops_keys_nobody_reads(clock):
+    tier = InMemorySharedTier(sweep_every=3)
+
+    async def scenario():
+        await tier.set("a", "1", 1)
+        await tier.add_member("user:u1", "a", 1)
+        clock.now += 2
+        await tier.set("b", "2", 10)
+
+    asyncio.run(scenario())
+    assert set(tier._values) == {"b"} and tier._sets == {}
+
+
+def test_cache_respects_session_expiry_and_invalidation(clock):
+    cache = PrincipalCache(ttl=30, shared=InMemorySharedTier())
+
+    async def scenario():
+        await cache.put("tok", USER, not_after=clock.now + 10)
+        hit = await cache.get("tok")
+        clock.now += 11
+        expired = await cache.get("tok")
+        await cache.put("tok2", USER, not_after=clock.now + 100)
+        await cache.invalidate_user("u1")
+        return hit, expired, await cache.get("tok2")
+
+    assert asyncio.run(scenario()) == (USER, None, None)
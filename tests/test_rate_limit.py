@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+import rate_limit
+from rate_limit import InMemoryLimiterBackend, RateLimiter, Rule, client_ip
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock(1000.0)
+    monkeypatch.setattr(rate_limit.time, "time", clock.time)
+    return clock
+
+
+def request(forwarded=None, peer="10.0.0.1"):
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return Request({"type": "http", "headers": headers, "client": (peer, 1234)})
+
+
+def test_rule_parse():
+    assert Rule.parse("20/60") == Rule(20, 60.0)
+
+
+def test_limit_within_one_window(clock):
+    limiter = RateLimiter({"login": Rule(3, 60)})
+    results = [asyncio.run(limiter.hit("login", "1.2.3.4")) for _ in range(4)]
+    assert results[:3] == [None, None, None]
+    assert results[3] == pytest.approx(20.0)
+    assert limiter.stats() == {"login_allowed": 3, "login_rejected": 1}
+
+
+def test_previous_window_is_weighted_by_what_is_left_of_it(clock):
+    limiter = RateLimiter({"login": Rule(4, 60)})
+    for _ in range(4):
+        asyncio.run(limiter.hit("login", "1.2.3.4"))
+    # Half way through the next window the 4 earlier hits still count as 2
+    clock.now = 1050.0
+    assert asyncio.run(limiter.hit("login", "1.2.3.4")) is None
+    assert asyncio.run(limiter.hit("login", "1.2.3.4")) is None
+    assert asyncio.run(limiter.hit("login", "1.2.3.4")) is not None
+    # Two windows later nothing is left
+    clock.now = 1150.0
+    assert asyncio.run(limiter.hit("login", "1.2.3.4")) is None
+
+
+def test_keys_are_independent(clock):
+    limiter = RateLimiter({"login": Rule(1, 60)})
+    assert asyncio.run(limiter.hit("login", "a")) is None
+    assert asyncio.run(limiter.hit("login", "b")) is None
+    assert asyncio.run(limiter.hit("login", "a")) is not None
+
+
+def test_enforce_raises_429_with_retry_after(clock):
+    clock.now = 990.0
+    limiter = RateLimiter({"login_ip": Rule(1, 60), "login_email": Rule(5, 60)})
+    asyncio.run(limiter.enforce(("login_ip", "1.2.3.4"), ("login_email", "a@b.c")))
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(limiter.enforce(("login_ip", "1.2.3.4"), ("login_email", "a@b.c"), ("login_email", None)))
+    assert exc.value.status_code == 429
+    assert exc.value.headers["Retry-After"] == "30"
+
+
+def test_in_memory_backend_prunes_stale_keys(clock):
+    backend = InMemoryLimiterBackend(max_keys=2)
+    asyncio.run(backend.incr("a", 10))
+    asyncio.run(backend.incr("b", 10))
+    clock.now = 1100.0
+    asyncio.run(backend.incr("c", 10))
+    assert set(backend._windows) == {"c"}
+
+
+def test_client_ip_takes_the_entry_the_trusted_proxy_appended():
+    assert client_ip(request("6.6.6.6, 1.2.3.4"), 1) == "1.2.3.4"
+    assert client_ip(request("6.6.6.6, 1.2.3.4, 10.1.1.1"), 2) == "1.2.3.4"
+    assert client_ip(request("1.2.3.4"), 3) == "1.2.3.4"
+
+
+def test_client_ip_falls_back_to_the_peer():
+    assert client_ip(request(), 1) == "10.0.0.1"
+    assert client_ip(request("1.2.3.4"), 0) == "10.0.0.1"
+
+
+def test_in_memory_backend_evicts_least_recently_hit_keys(clock):
+    backend = InMemoryLimiterBackend(max_keys=3)
+    for key in ("ip", "a", "b", "ip", "c", "d"):
+        asyncio.run(backend.incr(key, 60))
+    # The IP kept hitting, so the spray of new keys pushed out the others
+    assert list(backend._windows) == ["ip", "c", "d"]
+    assert backend._windows["ip"][1] == 2
+
+
+def test_enforce_stops_at_the_first_rejection(clock):
+    limiter = RateLimiter({"login_ip": Rule(1, 60), "login_email": Rule(5, 60)})
+    asyncio.run(limiter.enforce(("login_ip", "1.2.3.4"), ("login_email", "victim@b.c")))
+    for _ in range(10):
+        with pytest.raises(HTTPException):
+            asyncio.run(limiter.enforce(("login_ip", "1.2.3.4"), ("login_email", "victim@b.c")))
+    assert limiter.stats() == {"login_ip_allowed": 1, "login_ip_rejected": 10,
+                               "login_email_allowed": 1, "login_email_rejected": 0}
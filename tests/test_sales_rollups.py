@@ -0,0 +1,137 @@
+import asyncio
+from datetime import datetime, timezone, timedelta
+
+from payment_states import PAID
+from sales_rollups import SalesRollups
+from tests.fake_mongo import Database
+
+NOW = datetime.now(timezone.utc)
+
+
+def ts(days_ago: float) -> str:
+    return (NOW - timedelta(days=days_ago)).isoformat()
+
+
+def txn(session_id, days_ago=1.0, amount_cents=1999, status=PAID):
+    return {"session_id": session_id, "payment_status": status, "product_id": "aim", "game": "Rust",
+            "duration": "1month", "amount": amount_cents / 100, "amount_cents": amount_cents,
+            "created_at": ts(days_ago), "paid_at": ts(days_ago)}
+
+
+def license_doc(key, days_ago=1.0):
+    return {"license_key": key, "product_id": "aim", "purchased_at": ts(days_ago), "expires_at": ts(days_ago - 30)}
+
+
+def totals(db, collection="sales_daily"):
+    docs = db[collection].docs
+    return sum(d["sales"] for d in docs), sum(d["revenue_cents"] for d in docs)
+
+
+def issued(db):
+    return sum(d.get("issued", 0) for d in db.license_daily.docs)
+
+
+def seeded(paid=3, pending=1, licenses=2):
+    db = Database()
+    db.payment_transactions.docs = [txn(f"cs_{i}", days_ago=i + 1) for i in range(paid)]
+    db.payment_transactions.docs += [txn(f"cs_pending_{i}", status="pending") for i in range(pending)]
+    db.licenses.docs = [license_doc(f"KEY-{i}", days_ago=i + 1) for i in range(licenses)]
+    return db
+
+
+def test_record_sale_counts_a_transaction_once():
+    db = seeded(paid=1, licenses=0)
+    rollups = SalesRollups(db)
+
+    async def scenario():
+        return [await rollups.record_sale("cs_0"), await rollups.record_sale("cs_0"),
+                await rollups.record_sale("cs_pending_0")]
+
+    assert asyncio.run(scenario()) == [True, False, False]
+    assert totals(db) == totals(db, "sales_hourly") == (1, 1999)
+
+
+def test_backfill_rebuilds_through_staging():
+    db = seeded()
+    # Stale counts that the rebuild must replace, not add to
+    db.sales_daily.docs = [{"_id": "stale", "bucket": "2000-01-01", "product_id": "aim", "sales": 40,
+                            "revenue_cents": 1}]
+    rollups = SalesRollups(db)
+
+    async def scenario():
+        result = await rollups.backfill()
+        report = await rollups.report("day", None, None, "product_id")
+        return result, report, await db.list_collection_names()
+
+    result, report, collections = asyncio.run(scenario())
+    assert result == {"sales": 3, "licenses": 2, "deferred": 0}
+    assert totals(db) == totals(db, "sales_hourly") == (3, 3 * 1999)
+    assert report["totals"] == {"aim": {"sales": 3, "revenue_cents": 3 * 1999}}
+    assert report["active_licenses"] == {"aim": 2}
+    assert not any(c.endswith("_staging") for c in collections)
+    assert db.rollup_meta.docs == [{"_id": "sales", "backfilled_at": db.rollup_meta.docs[0]["backfilled_at"]}]
+
+    # Counted rows are claimed, so live writes afterwards do not double them
+    assert asyncio.run(rollups.record_sale("cs_0")) is False
+    asyncio.run(rollups.backfill())
+    assert totals(db) == (3, 3 * 1999)
+
+
+def test_concurrent_backfills_take_one_lease():
+    db = seeded()
+    workers = [SalesRollups(db) for _ in range(3)]
+
+    async def scenario():
+        return await asyncio.gather(*(w.backfill() for w in workers))
+
+    results = asyncio.run(scenario())
+    assert sum(r is not None for r in results) == 1
+    assert totals(db) == totals(db, "sales_hourly") == (3, 3 * 1999)
+    assert issued(db) == 2
+
+
+def test_expired_lease_is_taken_over():
+    db = seeded()
+    db.rollup_meta.docs = [{"_id": "backfill", "owner": "crashed", "expires_at": ts(0.01)}]
+    assert asyncio.run(SalesRollups(db).backfill())["sales"] == 3
+
+    db.rollup_meta.docs.append({"_id": "backfill", "owner": "busy", "expires_at": ts(-0.01)})
+    assert asyncio.run(SalesRollups(db).backfill()) is None
+
+
+def test_live_writes_during_a_backfill_are_folded_in_after_the_swap():
+    db = seeded()
+    backfiller, live = SalesRollups(db), SalesRollups(db)
+    recorded = []
+    rename = db.license_daily_staging.rename
+
+    async def sale_then_rename(*args, **kwargs):
+        # A checkout completes while the staging collections are still being built
+        db.payment_transactions.docs.append(txn("cs_live", days_ago=0))
+        db.licenses.docs.append(license_doc("KEY-live", days_ago=0))
+        recorded.append(await live.record_sale("cs_live"))
+        await live.record_licenses([{"license_key": "KEY-live"}])
+        return await rename(*args, **kwargs)
+
+    db.license_daily_staging.rename = sale_then_rename
+    result = asyncio.run(backfiller.backfill())
+
+    assert recorded == [False]
+    assert result["deferred"] == 2
+    assert totals(db) == totals(db, "sales_hourly") == (4, 4 * 1999)
+    assert issued(db) == 3
+    assert not any(d.get("rollup_deferred") for d in db.payment_transactions.docs + db.licenses.docs)
+
+
+def test_deferred_sale_is_folded_in_by_the_writer_once_the_lease_is_gone():
+    db = seeded(paid=1, licenses=0)
+    rollups = SalesRollups(db)
+    db.rollup_meta.docs = [{"_id": "backfill", "owner": "other", "expires_at": ts(-0.01)}]
+    checks = iter([True, False])
+
+    async def backfilling():
+        return next(checks)
+
+    rollups._backfilling = backfilling
+    assert asyncio.run(rollups.record_sale("cs_0")) is True
+    assert totals(db) == (1, 1999)
@@ -0,0 +1,68 @@
+from search import SearchIndex, price_bucket, tokenize
+
+
+def product(pid, name, game="Rust", tier="Premium", status="Undetected", price=19.99, features=(), tagline=""):
+    return {"product_id": pid, "name": name, "game": game, "tier": tier, "status": status, "price": price,
+            "features": list(features), "tagline": tagline}
+
+
+PRODUCTS = [
+    product("aim", "Aimbot Pro", features=["Silent aim", "Recoil control"]),
+    product("esp", "ESP Lite", tier="Basic", price=9.99, features=["Wallhack"], tagline="Sees through aim walls"),
+    product("val", "Valorant Aimlock", game="Valorant", price=34.99, features=["Aim assist"]),
+    product("old", "Legacy Tool", status="Detected", price=55),
+]
+
+
+def ids(result):
+    return [p["product_id"] for p, _ in result["results"]]
+
+
+def test_tokenize_and_price_bucket():
+    assert tokenize("Silent-Aim v2.0!") == ["silent", "aim", "v2", "0"]
+    assert [price_bucket(p) for p in (0, 9.99, 10, 34.99, 50, 500)] == ["0-10", "0-10", "10-20", "30-50", "50+", "50+"]
+
+
+def test_prefix_matches_rank_below_exact_matches():
+    index = SearchIndex(PRODUCTS)
+    # "aim" is exact in two products and a prefix of "aimbot" / "aimlock"
+    result = index.search("aim")
+    assert result["total"] == 3
+    assert ids(result) == ["aim", "val", "esp"]
+    assert ids(index.search("aiml")) == ["val"]
+
+
+def test_every_query_term_must_match():
+    index = SearchIndex(PRODUCTS)
+    assert ids(index.search("aim recoil")) == ["aim"]
+    assert index.search("aim nothing")["total"] == 0
+
+
+def test_empty_query_matches_all_in_catalog_order():
+    result = SearchIndex(PRODUCTS).search("", limit=2, offset=1)
+    assert result["total"] == 4
+    assert ids(result) == ["esp", "val"]
+
+
+def test_filters_are_case_insensitive_and_or_within_a_facet():
+    index = SearchIndex(PRODUCTS)
+    assert ids(index.search(filters={"game": ["valorant"]})) == ["val"]
+    assert ids(index.search(filters={"tier": ["basic", "PREMIUM"], "status": ["detected"]})) == ["old"]
+    assert ids(index.search(filters={"price": ["0-10"], "game": []})) == ["esp"]
+
+
+def test_facet_counts_ignore_their_own_filter():
+    result = SearchIndex(PRODUCTS).search(filters={"tier": ["Basic"]})
+    assert ids(result) == ["esp"]
+    assert result["facets"]["tier"] == {"Premium": 3, "Basic": 1}
+    assert result["facets"]["game"] == {"Rust": 1}
+    assert result["facets"]["price"] == {"0-10": 1}
+
+
+def test_rebuild_only_retokenizes_changed_products():
+    SearchIndex(PRODUCTS)
+    edited = [dict(PRODUCTS[0], name="Aimbot Ultra")] + PRODUCTS[1:]
+    index = SearchIndex(edited)
+    assert index.retokenized == 1
+    assert ids(index.search("ultra")) == ["aim"]
+    assert index.stats()["products"] == 4
@@ -0,0 +1,71 @@
+import asyncio
+import json
+
+from status_feed import StatusFeed
+
+PRODUCTS = [{"product_id": f"p{i}", "name": f"P{i}", "game": "Rust", "status": "undetected"} for i in range(3)]
+
+
+def record(product_id, status, version):
+    return {"product_id": product_id, "status": status, "version": version, "last_updated": f"t{version}"}
+
+
+def feed(**kwargs):
+    return StatusFeed(None, PRODUCTS, "t0", **kwargs)
+
+
+def parse(event):
+    fields = dict(line.split(": ", 1) for line in event.strip().splitlines())
+    return fields["event"], int(fields["id"]), json.loads(fields["data"])
+
+
+def test_apply_skips_stale_versions():
+    f = feed()
+    f._apply([record("p0", "testing", 2), record("p0", "detected", 1)])
+    assert f.statuses["p0"]["status"] == "testing"
+    assert f.version == 2
+
+
+def test_since_resumes_from_history_or_asks_for_a_snapshot():
+    f = feed(history=2)
+    f._apply([record("p0", "testing", 1), record("p1", "updating", 2), record("p2", "detected", 3)])
+    assert [v for v, _ in f.since(1)] == [2, 3]
+    assert f.since(3) == []
+    assert f.since(0) is None    # version 1 has left the history
+    assert f.since(9) is None    # from a different (newer) feed
+
+
+def test_events_replay_what_a_reconnecting_client_missed():
+    f = feed()
+    f._apply([record("p0", "testing", 1), record("p1", "updating", 2)])
+
+    async def first_two():
+        stream = f.events(last_event_id=1)
+        replayed = await stream.__anext__()
+        f._apply([record("p2", "detected", 3)])
+        live = await stream.__anext__()
+        await stream.aclose()
+        return replayed, live
+
+    replayed, live = asyncio.run(first_two())
+    assert parse(replayed)[:2] == ("status", 2)
+    assert parse(live)[:2] == ("status", 3) and parse(live)[2]["status"] == "detected"
+    assert not f.subscribers
+
+
+def test_a_lagging_subscriber_gets_a_snapshot():
+    f = feed(queue_size=1)
+
+    async def scenario():
+        stream = f.events()
+        assert parse(await stream.__anext__())[0] == "snapshot"
+        f._apply([record("p0", "testing", 1)])
+        f._apply([record("p1", "updating", 2)])    # queue of one is full: drop the backlog
+        event, version, data = parse(await stream.__anext__())
+        await stream.aclose()
+        return event, version, data
+
+    event, version, data = asyncio.run(scenario())
+    assert (event, version) == ("snapshot", 2)
+    assert {r["product_id"]: r["status"] for r in data}["p1"] == "updating"
+    assert f.dropped_backlogs == 1
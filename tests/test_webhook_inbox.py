@@ -0,0 +1,57 @@
+import asyncio
+
+from pymongo.errors import DuplicateKeyError
+
+from webhook_inbox import WebhookInbox
+
+
+class Inbox:
+    def __init__(self):
+        self.docs = {}
+
+    async def insert_one(self, doc):
+        if doc["_id"] in self.docs:
+            raise DuplicateKeyError("dup", 11000)
+        self.docs[doc["_id"]] = doc
+
+
+class DB:
+    def __init__(self):
+        self.webhook_inbox = Inbox()
+
+
+def test_record_dedupes_redeliveries():
+    inbox = WebhookInbox(DB(), handler=None)
+
+    async def scenario():
+        return [await inbox.record("evt_1", {"type": "a"}), await inbox.record("evt_1", {"type": "a"})]
+
+    assert asyncio.run(scenario()) == [True, False]
+    assert inbox.stats()["received"] == 1 and inbox.stats()["duplicates"] == 1
+
+
+def test_failing_batch_is_retried_event_by_event():
+    calls = []
+
+    async def handler(events):
+        calls.append([e["_id"] for e in events])
+        if any(e["_id"] == "bad" for e in events):
+            raise ValueError("boom")
+
+    inbox = WebhookInbox(DB(), handler)
+    handled, errors = asyncio.run(inbox._handle([{"_id": "a"}, {"_id": "bad"}, {"_id": "b"}]))
+
+    assert [e["_id"] for e in handled] == ["a", "b"]
+    assert list(errors) == ["bad"] and "boom" in errors["bad"]
+    assert calls == [["a", "bad", "b"], ["a"], ["bad"], ["b"]]
+    assert inbox.failures == 1
+
+
+def test_successful_batch_is_handled_once():
+    calls = []
+
+    async def handler(events):
+        calls.append(len(events))
+
+    handled, errors = asyncio.run(WebhookInbox(DB(), handler)._handle([{"_id": "a"}, {"_id": "b"}]))
+    assert len(handled) == 2 and errors == {} and calls == [2]